@@ -0,0 +1,91 @@
+"""
+Per-call overhead of building the Contract used by call_contract / invoke_contract,
+without and with the contract cache.
+
+Runs offline in a temporary working directory: python benchmarks/contract_cache.py
+"""
+import json
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:0")
+
+from starknet_py.contract import Contract  # noqa: E402
+from starknet_py.net.account.account import Account  # noqa: E402
+from starknet_py.net.signer.stark_curve_signer import KeyPair  # noqa: E402
+
+from src.utils.constants import RPC_CLIENT  # noqa: E402
+from src.utils.starknet import (  # noqa: E402
+    dump_deployments,
+    get_artifact,
+    get_cached_contract,
+)
+
+ABI = [
+    {
+        "type": "struct",
+        "name": "Uint256",
+        "size": 2,
+        "members": [
+            {"name": "low", "type": "felt", "offset": 0},
+            {"name": "high", "type": "felt", "offset": 1},
+        ],
+    },
+    *[
+        {
+            "type": "function",
+            "name": f"function_{i}",
+            "inputs": [
+                {"name": "account", "type": "felt"},
+                {"name": "amount", "type": "Uint256"},
+            ],
+            "outputs": [{"name": "balance", "type": "Uint256"}],
+            "stateMutability": "view",
+        }
+        for i in range(20)
+    ],
+]
+
+
+def main(number=1000):
+    get_artifact("Benchmark").parent.mkdir(parents=True, exist_ok=True)
+    get_artifact("Benchmark").write_text(json.dumps({"abi": ABI}))
+    dump_deployments(
+        {"Benchmark": {"address": 0x1234, "tx": 0x1, "artifact": "Benchmark.json"}}
+    )
+    account = Account(
+        address=0x1,
+        client=RPC_CLIENT,
+        chain=1,
+        key_pair=KeyPair.from_private_key(1),
+    )
+
+    def uncached():
+        deployments = json.load(open("deployments/deployments.json"))
+        return Contract(
+            deployments["Benchmark"]["address"],
+            json.load(open(get_artifact("Benchmark")))["abi"],
+            account,
+        )
+
+    def cached():
+        return get_cached_contract("Benchmark", None, account)
+
+    cached()
+
+    # Parsing the ABI is slow enough that a few uncached calls are representative
+    for name, function, repeat in [
+        ("uncached", uncached, max(number // 100, 1)),
+        ("cached", cached, number),
+    ]:
+        duration = timeit.timeit(function, number=repeat) / repeat
+        print(f"{name:>10}: {duration * 1e6:9.1f} us per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Detection-to-broadcast latency of a flashloan_swap, from the swap params of a sized
+route to the transaction hash returned by the node: fetching the contract class and
+sending with Contract.invoke, as before the templates, versus the pre-serialized
+FlashswapTemplates, signing at send time or ahead of it.
+
+Runs offline against a stub node with a fixed latency per request, serving a Cairo 1
+flashswap class whose ABI matches the swap params:
+
+    python benchmarks/flashswap_templates.py
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PORT = _get_free_port()
+STUB_URL = f"http://127.0.0.1:{PORT}/rpc"
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+os.chdir(tempfile.mkdtemp())
+# The receipts of the sent transactions are tracked through the shared transport
+os.environ["RPC_URL"] = STUB_URL
+
+from aiohttp import web  # noqa: E402
+from starknet_py.contract import Contract  # noqa: E402
+from starknet_py.net.account.account import Account  # noqa: E402
+from starknet_py.net.full_node_client import FullNodeClient  # noqa: E402
+from starknet_py.net.signer.stark_curve_signer import KeyPair  # noqa: E402
+
+from src.utils.ekubo import (  # noqa: E402
+    FLASHSWAP_ADDRESS,
+    FlashswapTemplates,
+    _flashswap_contracts,
+)
+from src.utils.rpc import get_rpc_transport  # noqa: E402
+
+ACCOUNT_ADDRESS = 0x1234
+CONTRACT_ADDRESS = "core::starknet::contract_address::ContractAddress"
+ABI = [
+    {
+        "type": "struct",
+        "name": "core::integer::u256",
+        "members": [
+            {"name": "low", "type": "core::integer::u128"},
+            {"name": "high", "type": "core::integer::u128"},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "ekubo::types::keys::PoolKey",
+        "members": [
+            {"name": "token0", "type": CONTRACT_ADDRESS},
+            {"name": "token1", "type": CONTRACT_ADDRESS},
+            {"name": "fee", "type": "core::integer::u128"},
+            {"name": "tick_spacing", "type": "core::integer::u128"},
+            {"name": "extension", "type": CONTRACT_ADDRESS},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "flashswap::SwapParams",
+        "members": [
+            {"name": "token_from", "type": CONTRACT_ADDRESS},
+            {"name": "token_to", "type": CONTRACT_ADDRESS},
+            {"name": "pool_key", "type": "ekubo::types::keys::PoolKey"},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "flashswap::FlashswapParams",
+        "members": [
+            {"name": "amount_from", "type": "core::integer::u256"},
+            {
+                "name": "routes",
+                "type": "core::array::Array::<flashswap::SwapParams>",
+            },
+        ],
+    },
+    {
+        "type": "function",
+        "name": "flashloan_swap",
+        "inputs": [{"name": "flashswap_params", "type": "flashswap::FlashswapParams"}],
+        "outputs": [],
+        "state_mutability": "external",
+    },
+]
+ENTRY_POINTS = {"CONSTRUCTOR": [], "EXTERNAL": [], "L1_HANDLER": []}
+FLASHSWAP_CLASS = {
+    "sierra_program": ["0x1"],
+    "contract_class_version": "0.1.0",
+    "entry_points_by_type": ENTRY_POINTS,
+    "abi": json.dumps(ABI),
+}
+ACCOUNT_CLASS = {"program": "", "entry_points_by_type": ENTRY_POINTS, "abi": []}
+
+TOKENS = [0x49D3, 0x53C9, 0xDA11]
+SWAP_PARAMS = [
+    {
+        "token_from": token_from,
+        "token_to": token_to,
+        "pool_key": {
+            "token0": min(token_from, token_to),
+            "token1": max(token_from, token_to),
+            "fee": 170141183460469235273462165868118016,
+            "extension": 0,
+            "tick_spacing": 1000,
+        },
+    }
+    for token_from, token_to in zip(TOKENS, TOKENS[1:] + TOKENS[:1])
+]
+
+
+def get_stub_app(latency, stats):
+    results = {
+        "starknet_getClassHashAt": "0x1",
+        "starknet_getClass": FLASHSWAP_CLASS,
+        "starknet_getClassAt": ACCOUNT_CLASS,
+        "starknet_getNonce": "0x5",
+        "starknet_addInvokeTransaction": {"transaction_hash": "0xabc"},
+        "starknet_getTransactionReceipt": {"status": "ACCEPTED_ON_L2"},
+    }
+
+    async def rpc(request):
+        payload = await request.json()
+        calls = payload if isinstance(payload, list) else [payload]
+        for call in calls:
+            # The receipts polled in the background are not on the sending path
+            if call["method"] != "starknet_getTransactionReceipt":
+                stats[call["method"]] = stats.get(call["method"], 0) + 1
+        await asyncio.sleep(latency)
+        responses = [
+            {"jsonrpc": "2.0", "id": call["id"], "result": results[call["method"]]}
+            for call in calls
+        ]
+        return web.json_response(
+            responses if isinstance(payload, list) else responses[0]
+        )
+
+    app = web.Application()
+    app.router.add_post("/rpc", rpc)
+    return app
+
+
+async def send_with_contract(account, amount_from):
+    contract = await Contract.from_address(FLASHSWAP_ADDRESS, account)
+    result = await contract.functions["flashloan_swap"].invoke(
+        flashswap_params={"amount_from": amount_from, "routes": SWAP_PARAMS},
+        max_fee=int(1e16),
+    )
+    return result.hash
+
+
+async def run(number, latency):
+    stats = {}
+    runner = web.AppRunner(get_stub_app(latency, stats))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    account = Account(
+        address=ACCOUNT_ADDRESS,
+        client=FullNodeClient(node_url=STUB_URL),
+        key_pair=KeyPair.from_private_key(0x1),
+        chain=int.from_bytes(b"SN_MAIN", "big"),
+    )
+    _flashswap_contracts.pop(account.address, None)
+    templates = FlashswapTemplates(account)
+    await templates.prepare()
+    max_fee = int(1e16)
+
+    async def send_pre_signed(amount_from):
+        # The signature is made during the simulation in the scanner, out of the
+        # detection to broadcast path
+        transaction = await templates.sign(SWAP_PARAMS, amount_from, max_fee)
+        start = time.perf_counter()
+        return start, await templates.send(
+            SWAP_PARAMS, amount_from, max_fee, transaction
+        )
+
+    async def timed(coroutine):
+        return time.perf_counter(), await coroutine
+
+    cases = {
+        "Contract.from_address + invoke": lambda amount: timed(
+            send_with_contract(account, amount)
+        ),
+        "FlashswapTemplates.send": lambda amount: timed(
+            templates.send(SWAP_PARAMS, amount, max_fee)
+        ),
+        "pre-signed broadcast": send_pre_signed,
+    }
+    try:
+        print(f"{'case':>32} {'p50 ms':>8} {'p99 ms':>8} {'requests':>9}")
+        for name, case in cases.items():
+            await case(1)
+            stats.clear()
+            durations = []
+            for i in range(number):
+                start, _ = await case(10**18 + i)
+                durations.append(time.perf_counter() - start)
+            p50, p99 = np.percentile(durations, [50, 99]) * 1e3
+            print(
+                f"{name:>32} {p50:8.2f} {p99:8.2f} "
+                f"{sum(stats.values()) / number:9.1f}"
+            )
+    finally:
+        await get_rpc_transport().close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    # The receipts tracking logs would flood the output
+    logging.disable(logging.INFO)
+    asyncio.run(run(args.number, args.latency))
+
+
+if __name__ == "__main__":
+    main()
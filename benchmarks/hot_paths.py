@@ -0,0 +1,324 @@
+"""
+Latency, throughput and peak memory of the hot paths, compared to a stored baseline.
+
+Runs offline in a temporary working directory, on synthetic data, the recorded
+snapshots if any, and a local stub of the Ekubo API and Starknet RPC:
+
+    python benchmarks/hot_paths.py                  # compare to baseline.json
+    python benchmarks/hot_paths.py --save-baseline  # overwrite baseline.json
+
+A case is flagged as a regression when its fastest run exceeds the baseline one
+by more than the tolerance, and the script then exits with an error: the median
+moves too much with the load of the machine. Both are first divided by the
+fastest run of a fixed calibration loop, measured with them, so that a baseline
+saved on a faster machine does not flag every case. This only scales away the
+CPU speed though: the stub round trips depend on the network stack and the
+timers of the machine, so the baseline must be saved again locally before
+comparing to it, e.g. on a new CI runner.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+SNAPSHOTS_PATH = ROOT / "build" / "snapshots"
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+PORT = _get_free_port()
+STUB_URL = f"http://127.0.0.1:{PORT}"
+CALIBRATION = "calibration"
+
+sys.path.insert(0, str(ROOT))
+os.chdir(tempfile.mkdtemp())
+os.environ.pop("STARKNET_NETWORK", None)
+os.environ["RPC_URL"] = f"{STUB_URL}/rpc"
+
+from aiohttp import web  # noqa: E402
+
+from src.utils.arbitrage import (  # noqa: E402
+    TokenGraph,
+    find_arbitrage_for_all_tokens,
+    find_arbitrage_for_token,
+)
+from src.utils.ekubo import (  # noqa: E402
+    POOLS_CACHE,
+    TOKEN_NAME_TO_ADDRESS,
+    TOKENS,
+    get_pair_prices,
+    get_pools,
+    get_prices,
+    get_session,
+    get_swap_params,
+    select_pools,
+)
+from src.utils.rpc import get_rpc_transport  # noqa: E402
+from src.utils.snapshots import SnapshotStore  # noqa: E402
+from src.utils.starknet import (  # noqa: E402
+    _convert_offset_to_hex,
+    int_to_uint256,
+    wait_for_transaction,
+)
+
+ROUTE = ["ETH", "USDC", "DAI", "ETH"]
+FEES = [int(0.003 * 2**128), int(0.0005 * 2**128), int(0.0001 * 2**128)]
+
+
+def get_synthetic_prices(n_tokens, degree=8, seed=0):
+    """
+    Return consistent prices with some noise, each token being quoted against about
+    degree others, like the real graph.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.exp(rng.normal(0, 3, n_tokens))
+    prices = values[None, :] / values[:, None]
+    prices *= np.exp(rng.normal(0, 0.002, (n_tokens, n_tokens)))
+    prices[rng.random((n_tokens, n_tokens)) > min(1, degree / n_tokens)] = 0
+    return prices
+
+
+def get_synthetic_entry_points(n_entry_points=10_000):
+    return {
+        entry_point_type: [
+            {"selector": 2**250 - i, "offset": i, "builtins": ["range_check"]}
+            for i in range(n_entry_points)
+        ]
+        for entry_point_type in ["EXTERNAL", "L1_HANDLER", "CONSTRUCTOR"]
+    }
+
+
+def get_stub_app():
+    async def price(request):
+        rng = np.random.default_rng()
+        return web.json_response(
+            {
+                "prices": [
+                    {"token": address, "price": str(rng.lognormal())}
+                    for address in TOKENS
+                ]
+            }
+        )
+
+    async def rpc(request):
+        payload = await request.json()
+        results = []
+        for call in payload if isinstance(payload, list) else [payload]:
+            if call["method"] == "starknet_call":
+                sqrt_ratio = int((1 + call["id"] / 1000) * 2**128)
+                result = [hex(sqrt_ratio % 2**128), hex(sqrt_ratio >> 128), "0x0"]
+            else:
+                result = {"status": "ACCEPTED_ON_L2"}
+            results.append({"jsonrpc": "2.0", "id": call["id"], "result": result})
+        return web.json_response(results if isinstance(payload, list) else results[0])
+
+    app = web.Application()
+    app.router.add_get("/price/{address}", price)
+    app.router.add_post("/rpc", rpc)
+    return app
+
+
+def _summarize(durations, peak):
+    durations = np.array(durations)
+    return {
+        "throughput": float(1 / durations.mean()),
+        "min_us": float(durations.min() * 1e6),
+        "p50_us": float(np.percentile(durations, 50) * 1e6),
+        "p99_us": float(np.percentile(durations, 99) * 1e6),
+        "peak_kib": peak / 1024,
+    }
+
+
+def measure(function, number):
+    function()
+    durations = []
+    for _ in range(number):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return _summarize(durations, peak)
+
+
+async def measure_async(function, number):
+    await function()
+    durations = []
+    for _ in range(number):
+        start = time.perf_counter()
+        await function()
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    await function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return _summarize(durations, peak)
+
+
+def calibrate():
+    # Interpreter bound, like most of the hot paths
+    table = {}
+    for i in range(5_000):
+        table[i % 1_000] = table.get(i % 1_000, 0) + i * i
+    return table
+
+
+async def run(number):
+    results = {CALIBRATION: measure(calibrate, number)}
+
+    for n_tokens in [8, 20, 50, 100, 200]:
+        prices = get_synthetic_prices(n_tokens)
+        results[f"find_arbitrage_for_token[{n_tokens}]"] = measure(
+            lambda: find_arbitrage_for_token(0, prices, max_length=4),
+            max(number // 10, 10),
+        )
+    # All the origins of the known tokens, with cycles of any length
+    prices = get_synthetic_prices(len(TOKENS), degree=len(TOKENS))
+    results[f"find_arbitrage_for_all_tokens[{len(TOKENS)}]"] = measure(
+        lambda: find_arbitrage_for_all_tokens(prices), max(number // 10, 10)
+    )
+    # Large universe of discovered tokens, about 20k edges
+    graph = TokenGraph.from_prices(get_synthetic_prices(500, degree=40))
+    results["TokenGraph.find_arbitrages[500]"] = measure(
+        lambda: graph.find_arbitrages(), max(number // 10, 10)
+    )
+    store = SnapshotStore(SNAPSHOTS_PATH)
+    if len(store):
+        snapshots = iter(range(10**9))
+        results["find_arbitrage_for_token[recorded]"] = measure(
+            lambda: find_arbitrage_for_token(
+                0, store.prices[next(snapshots) % len(store)], max_length=4
+            ),
+            max(number // 10, 10),
+        )
+
+    values = [int.from_bytes(os.urandom(32), "big") for _ in range(1000)]
+    results["int_to_uint256[1000]"] = measure(
+        lambda: [int_to_uint256(value) for value in values], number
+    )
+    entry_points = get_synthetic_entry_points()
+    results["_convert_offset_to_hex[30000]"] = measure(
+        lambda: _convert_offset_to_hex(entry_points), max(number // 100, 10)
+    )
+
+    runner = web.AppRunner(get_stub_app())
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+    try:
+        async with get_session() as session:
+            results["get_prices"] = await measure_async(
+                lambda: get_prices(api_url=STUB_URL, session=session), number
+            )
+            # Liquid pairs of discovered tokens, quoted against a few hubs
+            pairs = [
+                (hub, name, 1.0)
+                for hub in ["ETH", "USDC"]
+                for name in TOKENS.values()
+                if name != hub
+            ]
+            results["get_pair_prices"] = await measure_async(
+                lambda: get_pair_prices(pairs, api_url=STUB_URL, session=session),
+                number,
+            )
+
+            for token_from, token_to in zip(ROUTE[:-1], ROUTE[1:]):
+                POOLS_CACHE.set(
+                    f"{TOKEN_NAME_TO_ADDRESS[token_from]}/{TOKEN_NAME_TO_ADDRESS[token_to]}",
+                    [
+                        {
+                            "fee": str(fee),
+                            "tick_spacing": str(tick_spacing),
+                            "extension": "0",
+                            "volume0_24h": "0",
+                        }
+                        for fee, tick_spacing in zip(FEES, [5982, 1000, 200])
+                    ],
+                )
+            pools = await get_pools(ROUTE, session=session)
+            results["select_pools"] = await measure_async(
+                lambda: select_pools(ROUTE, pools, session=session), number
+            )
+            selected_pools = await select_pools(ROUTE, pools, session=session)
+            results["get_swap_params"] = measure(
+                lambda: get_swap_params(selected_pools), number
+            )
+
+        results["wait_for_transaction"] = await measure_async(
+            lambda: wait_for_transaction(0x1, check_interval=1e-4, max_wait=1),
+            number,
+        )
+        await get_rpc_transport().close()
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    print(
+        f"{'case':>38} {'ops/s':>10} {'min us':>10} {'p50 us':>10} {'p99 us':>10} "
+        f"{'peak KiB':>9} {'vs base':>8}"
+    )
+    # Latencies in calibration loops, comparable across machines
+    scale = results[CALIBRATION]["min_us"]
+    base_scale = baseline[CALIBRATION]["min_us"] if CALIBRATION in baseline else np.nan
+    for name, result in results.items():
+        ratio = (
+            (result["min_us"] / scale) / (baseline[name]["min_us"] / base_scale)
+            if name in baseline and name != CALIBRATION
+            else np.nan
+        )
+        flag = " REGRESSION" if ratio > 1 + tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(
+            f"{name:>38} {result['throughput']:10.1f} {result['min_us']:10.1f} "
+            f"{result['p50_us']:10.1f} "
+            f"{result['p99_us']:10.1f} {result['peak_kib']:9.1f} {ratio:8.2f}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative slowdown of the normalized median latencies",
+    )
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    # The logs of the RPC calls would dominate the timings
+    logging.disable(logging.INFO)
+    results = asyncio.run(run(args.number))
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif regressions:
+        sys.exit(f"Regressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Latency of many concurrent JSON-RPC calls against a stub node with a fixed latency
+per HTTP request: one request and connection per call, as before the shared
+transport, versus the transport pooling connections and batching the calls of the
+same tick. Also times the failover when the first node is down.
+
+Runs offline: python benchmarks/rpc_transport.py
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+os.environ.setdefault("RPC_URL", "http://127.0.0.1:0")
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from src.utils.rpc import JsonRpcTransport  # noqa: E402
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_stub_app(latency, stats):
+    async def rpc(request):
+        stats["requests"] += 1
+        payload = await request.json()
+        await asyncio.sleep(latency)
+        results = [
+            {"jsonrpc": "2.0", "id": call["id"], "result": hex(call["id"])}
+            for call in (payload if isinstance(payload, list) else [payload])
+        ]
+        return web.json_response(results if isinstance(payload, list) else results[0])
+
+    app = web.Application()
+    app.router.add_post("/rpc", rpc)
+    return app
+
+
+async def call_per_connection(url, n_calls):
+    async def _call(i):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                url,
+                json={
+                    "jsonrpc": "2.0",
+                    "method": "starknet_call",
+                    "params": [],
+                    "id": i,
+                },
+            ) as response:
+                return (await response.json())["result"]
+
+    return await asyncio.gather(*[_call(i) for i in range(n_calls)])
+
+
+async def call_transport(transport, n_calls):
+    return await transport.batch([("starknet_call", [])] * n_calls)
+
+
+async def run(n_calls, number, latency):
+    stats = {"requests": 0}
+    port = _get_free_port()
+    url = f"http://127.0.0.1:{port}/rpc"
+    runner = web.AppRunner(get_stub_app(latency, stats))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    transport = JsonRpcTransport([url])
+    failover = JsonRpcTransport([f"http://127.0.0.1:{_get_free_port()}/rpc", url])
+    cases = {
+        "connection per call": lambda: call_per_connection(url, n_calls),
+        "shared transport": lambda: call_transport(transport, n_calls),
+        "shared transport, first node down": lambda: call_transport(failover, n_calls),
+    }
+    try:
+        print(f"{'case':>36} {'ms / round':>11} {'requests / round':>17}")
+        for name, case in cases.items():
+            await case()
+            stats["requests"] = 0
+            start = time.perf_counter()
+            for _ in range(number):
+                await case()
+            duration = (time.perf_counter() - start) / number
+            print(
+                f"{name:>36} {duration * 1e3:11.2f} {stats['requests'] / number:17.1f}"
+            )
+    finally:
+        await transport.close()
+        await failover.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--number", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.005)
+    args = parser.parse_args()
+
+    # The retries of the failover case would flood the output
+    logging.disable(logging.WARNING)
+    asyncio.run(run(args.calls, args.number, args.latency))
+
+
+if __name__ == "__main__":
+    main()
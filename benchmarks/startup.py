@@ -0,0 +1,47 @@
+"""
+Import time of the project modules, each measured in a fresh interpreter.
+
+Runs offline: python benchmarks/startup.py
+"""
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parents[1]
+MODULES = ["src.utils.constants", "src.utils.starknet", "src.utils.ekubo"]
+
+
+def measure(module, repeat=5):
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    # An unroutable RPC makes any network call at import fail loudly and slowly
+    env = {**os.environ, "RPC_URL": "http://10.255.255.1:5050", "PYTHONPATH": "."}
+    durations = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=ROOT,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        durations.append(float(output.stdout.strip().splitlines()[-1]))
+    return durations
+
+
+def main():
+    for module in MODULES:
+        durations = measure(module)
+        print(
+            f"{module:>22}: median {statistics.median(durations) * 1e3:8.1f} ms, "
+            f"max {max(durations) * 1e3:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
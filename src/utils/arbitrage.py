@@ -0,0 +1,603 @@
+import functools
+import heapq
+import itertools
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+SWAP_COST = 0.05 / 100
+
+
+def get_edge_weights(prices, swap_cost=SWAP_COST):
+    """
+    Return the -log(price * (1 - swap_cost)) matrix of the prices graph.
+
+    Missing pairs (zero or nan prices) and self loops are set to +inf so that they
+    are never used by the search.
+    """
+    values = np.asarray(prices, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = -np.log(values * (1 - swap_cost))
+    weights[~np.isfinite(weights) | (values <= 0)] = np.inf
+    np.fill_diagonal(weights, np.inf)
+    return weights
+
+
+def _get_costs_to_origin(weights, origin, max_length):
+    """
+    Return, for each number of swaps h, the cheapest walk of at most h swaps from each
+    token back to origin.
+
+    Walks may repeat tokens, so these costs are lower bounds of the cost of any simple
+    path back to origin, which is what the pruning of the search needs.
+    """
+    costs = [np.full(len(weights), np.inf), weights[:, origin]]
+    for _ in range(2, max_length + 1):
+        costs.append(np.minimum(costs[-1], (weights + costs[-1][None, :]).min(axis=1)))
+    return [cost.tolist() for cost in costs]
+
+
+def _search_cycles(weights, origin, max_length, threshold, on_cycle):
+    """
+    Depth-first search of the simple cycles of at most max_length swaps going through
+    origin.
+
+    Branches that cannot produce a cycle with a cost lower than threshold are pruned
+    using the cheapest walk back to origin with the remaining number of swaps.
+    on_cycle(cycle, cost) is called for each such cycle and returns the threshold
+    for the rest of the search.
+    """
+    n = len(weights)
+    costs_to_origin = _get_costs_to_origin(weights, origin, max_length)
+    rows = weights.tolist()
+    closing = costs_to_origin[1]
+    neighbours = [
+        sorted(
+            (j for j in range(n) if rows[i][j] != np.inf and j != origin),
+            key=lambda j, i=i: rows[i][j] + costs_to_origin[-1][j],
+        )
+        for i in range(n)
+    ]
+    visited = [False] * n
+    visited[origin] = True
+    path = [origin]
+
+    def _dfs(node, cost):
+        nonlocal threshold
+        if len(path) > 1 and closing[node] != np.inf:
+            total = cost + closing[node]
+            if total < threshold:
+                threshold = on_cycle(path + [origin], total)
+        remaining = max_length - len(path)
+        if remaining <= 0:
+            return
+        row = rows[node]
+        bounds = costs_to_origin[remaining]
+        for next_node in neighbours[node]:
+            if visited[next_node]:
+                continue
+            next_cost = cost + row[next_node]
+            if next_cost + bounds[next_node] >= threshold:
+                continue
+            visited[next_node] = True
+            path.append(next_node)
+            _dfs(next_node, next_cost)
+            path.pop()
+            visited[next_node] = False
+
+    _dfs(origin, 0.0)
+
+
+def _format_cycle(cycle, values, names):
+    prices = [values[o, d] for o, d in zip(cycle[:-1], cycle[1:])]
+    return [names[i] for i in cycle], prices
+
+
+def _get_names(prices):
+    return (
+        list(prices.columns) if hasattr(prices, "columns") else list(range(len(prices)))
+    )
+
+
+def find_arbitrage_for_token(origin, prices, swap_cost=SWAP_COST, max_length=None):
+    """
+    Find the best cycle starting and ending at origin.
+
+    The search is exact: the returned cycle has the highest product of prices among
+    all the simple cycles of at most max_length swaps going through origin. The
+    best cycle is returned even if it is not profitable.
+    """
+    values = np.asarray(prices, dtype=float)
+    names = _get_names(prices)
+    weights = get_edge_weights(values, swap_cost)
+    max_length = max_length or len(values)
+
+    best = {"cycle": None, "cost": np.inf}
+
+    def _on_cycle(cycle, cost):
+        best["cycle"] = cycle
+        best["cost"] = cost
+        return cost
+
+    _search_cycles(weights, origin, max_length, np.inf, _on_cycle)
+    if best["cycle"] is None:
+        return [names[origin], names[origin]], 0.0, []
+
+    route, best_prices = _format_cycle(best["cycle"], values, names)
+    profit = np.prod(best_prices) * (1 - swap_cost) ** len(best_prices)
+    return route, profit, best_prices
+
+
+# Above this many tokens, the best cycles of all the tokens are searched one origin
+# at a time
+MAX_SUBSET_TOKENS = 12
+
+
+@functools.lru_cache(maxsize=None)
+def _get_subsets(n_tokens, max_length):
+    """
+    Return the subsets of 2 to max_length tokens as bit masks, with whether each
+    token is in each subset and the lowest token of each subset, and the extensions
+    of the subsets of each size below max_length.
+
+    A subset is only extended with tokens above its lowest one, as a
+    (subsets, rows, tokens, extended subsets) tuple: the path of the row-th subset
+    ending at the previous token and extended with token is the path of the
+    extended subset ending at token.
+    """
+    tokens = np.arange(n_tokens)
+    all_masks = np.arange(2**n_tokens)
+    members = (all_masks[:, None] >> tokens) & 1 == 1
+    sizes = members.sum(axis=1)
+    lowest = np.argmax(members, axis=1)
+    extensions = []
+    for size in range(1, max_length):
+        masks = np.flatnonzero(sizes == size)
+        rows, nexts = np.nonzero(~members[masks] & (tokens > lowest[masks, None]))
+        extensions.append((masks, rows, nexts, masks[rows] | (1 << nexts)))
+    masks = np.flatnonzero((sizes >= 2) & (sizes <= max_length))
+    return masks, members[masks], lowest[masks], extensions
+
+
+def _get_best_cycles(weights, max_length):
+    """
+    Return, for each token, the tokens of the cheapest simple cycle of at most
+    max_length swaps going through it, or None.
+
+    Cheapest paths are built by dynamic programming over the subsets of tokens,
+    from the lowest token of each subset, so that each directed cycle is built once
+    and then scored for all its tokens.
+    """
+    n_tokens = len(weights)
+    tokens = np.arange(n_tokens)
+    masks, members, lowest, extensions = _get_subsets(n_tokens, max_length)
+    # Cheapest path from the lowest token of each subset through all its tokens,
+    # by last token
+    costs = np.full((2**n_tokens, n_tokens), np.inf)
+    costs[1 << tokens, tokens] = 0.0
+    for subsets, rows, nexts, extended in extensions:
+        paths = (costs[subsets][:, :, None] + weights[None, :, :]).min(axis=1)
+        costs[extended, nexts] = paths[rows, nexts]
+
+    cycle_costs = costs[masks] + weights.T[lowest]
+    ends = np.argmin(cycle_costs, axis=1)
+    cycle_costs = cycle_costs[np.arange(len(masks)), ends]
+    by_token = np.where(members, cycle_costs[:, None], np.inf)
+    best_rows = [
+        row if by_token[row, token] < np.inf else None
+        for token, row in enumerate(np.argmin(by_token, axis=0).tolist())
+    ]
+
+    # Walk the paths back, the previous token being the one the cost of the path
+    # was extended from
+    cycles = {}
+    weights_to = weights.T.tolist()
+    for row in set(best_rows) - {None}:
+        mask, path = int(masks[row]), [int(ends[row])]
+        while mask != 1 << path[-1]:
+            mask ^= 1 << path[-1]
+            path_costs = costs[mask].tolist()
+            to_last = weights_to[path[-1]]
+            path.append(min(tokens.tolist(), key=lambda i: path_costs[i] + to_last[i]))
+        cycles[row] = path[::-1]
+
+    best_cycles = []
+    for token, row in enumerate(best_rows):
+        if row is None:
+            best_cycles.append(None)
+            continue
+        path = cycles[row]
+        start = path.index(token)
+        best_cycles.append(path[start:] + path[:start] + [token])
+    return best_cycles
+
+
+def find_arbitrage_for_all_tokens(prices, swap_cost=SWAP_COST, max_length=None):
+    """
+    Return the best cycle starting and ending at each token, like
+    find_arbitrage_for_token for all the origins at once.
+
+    On small graphs, the cycles of all the tokens are found with a single dynamic
+    program over the subsets of tokens instead of one search per origin.
+    """
+    values = np.asarray(prices, dtype=float)
+    names = _get_names(prices)
+    n_tokens = len(values)
+    max_length = min(max_length or n_tokens, n_tokens)
+    if n_tokens > MAX_SUBSET_TOKENS or max_length < 2:
+        return [
+            find_arbitrage_for_token(origin, prices, swap_cost, max_length)
+            for origin in range(n_tokens)
+        ]
+
+    weights = get_edge_weights(values, swap_cost)
+    cycles = _get_best_cycles(weights, max_length)
+    arbitrages = []
+    for origin, cycle in enumerate(cycles):
+        if cycle is None:
+            arbitrages.append(([names[origin], names[origin]], 0.0, []))
+            continue
+        route, best_prices = _format_cycle(cycle, values, names)
+        profit = np.prod(best_prices) * (1 - swap_cost) ** len(best_prices)
+        arbitrages.append((route, profit, best_prices))
+    return arbitrages
+
+
+@functools.lru_cache(maxsize=None)
+def get_cycles_indexes(n_tokens, max_length):
+    """
+    Return the (n_cycles, max_length + 1) array of all the simple cycles of at most
+    max_length swaps between n_tokens, and the length of each cycle.
+
+    Each cycle is listed once, from its smallest token: its rotations have the same
+    cost and would only fill the top results with the same trade.
+
+    Shorter cycles are padded by repeating their origin: with a zero weight on the
+    diagonal, all the cycles can be scored in a single gather and sum.
+    """
+    cycles = []
+    lengths = []
+    for length in range(2, min(max_length, n_tokens) + 1):
+        permutations = np.array(
+            [
+                (origin, *path)
+                for origin in range(n_tokens)
+                for path in itertools.permutations(
+                    range(origin + 1, n_tokens), length - 1
+                )
+            ],
+            dtype=np.intp,
+        ).reshape(-1, length)
+        padding = np.repeat(permutations[:, :1], max_length + 1 - length, axis=1)
+        cycles.append(np.hstack([permutations, padding]))
+        lengths.append(np.full(len(permutations), length, dtype=np.intp))
+    if not cycles:
+        return np.empty((0, max_length + 1), dtype=np.intp), np.empty(0, np.intp)
+    indexes = np.vstack(cycles)
+    indexes.flags.writeable = False
+    lengths = np.concatenate(lengths)
+    lengths.flags.writeable = False
+    return indexes, lengths
+
+
+def find_arbitrages(prices, swap_cost=SWAP_COST, max_length=4, top=10):
+    """
+    Score all the simple cycles of at most max_length swaps at once, each from its
+    smallest token, and return the top ones as (route, profit, prices) tuples sorted
+    by decreasing profit.
+    """
+    values = np.asarray(prices, dtype=float)
+    names = _get_names(prices)
+    weights = get_edge_weights(values, swap_cost)
+    np.fill_diagonal(weights, 0)
+    indexes, lengths = get_cycles_indexes(len(values), max_length)
+
+    costs = weights[indexes[:, :-1], indexes[:, 1:]].sum(axis=1)
+    candidates = np.flatnonzero(np.isfinite(costs))
+    if len(candidates) > top:
+        candidates = candidates[np.argpartition(costs[candidates], top)[:top]]
+    candidates = candidates[np.argsort(costs[candidates], kind="stable")]
+
+    arbitrages = []
+    for cycle, length, cost in zip(
+        indexes[candidates], lengths[candidates], costs[candidates]
+    ):
+        route, cycle_prices = _format_cycle(cycle[: length + 1], values, names)
+        arbitrages.append((route, np.exp(-cost), cycle_prices))
+    return arbitrages
+
+
+class ArbitrageIndex:
+    """
+    Incremental version of find_arbitrages for prices that change one pair at a time.
+
+    All the simple cycles of at most max_length swaps are scored once. Each edge keeps
+    the list of the cycles using it, so that updating the price of a pair only
+    re-scores these cycles, and the best ones are kept in a heap with lazy deletion of
+    the outdated scores.
+    """
+
+    def __init__(self, prices, swap_cost=SWAP_COST, max_length=4):
+        self.values = np.array(prices, dtype=float)
+        self.names = _get_names(prices)
+        self.swap_cost = swap_cost
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        self.weights = get_edge_weights(self.values, swap_cost)
+        np.fill_diagonal(self.weights, 0)
+        self.indexes, self.lengths = get_cycles_indexes(len(self.values), max_length)
+
+        # Cycles of each edge, as a CSR layout indexed by origin * n_tokens + destination
+        n_tokens = len(self.values)
+        origins = self.indexes[:, :-1].ravel()
+        destinations = self.indexes[:, 1:].ravel()
+        cycles = np.repeat(np.arange(len(self.indexes)), max_length)
+        is_swap = origins != destinations
+        edges = origins[is_swap] * n_tokens + destinations[is_swap]
+        order = np.argsort(edges, kind="stable")
+        self._edge_cycles = cycles[is_swap][order]
+        self._edge_offsets = np.searchsorted(
+            edges[order], np.arange(n_tokens * n_tokens + 1)
+        )
+
+        self.costs = self._score(np.arange(len(self.indexes)))
+        self._versions = np.zeros(len(self.indexes), dtype=np.int64)
+        self._heap = []
+        self._rebuild_heap()
+
+    def _score(self, cycles):
+        indexes = self.indexes[cycles]
+        return self.weights[indexes[:, :-1], indexes[:, 1:]].sum(axis=1)
+
+    def _rebuild_heap(self):
+        finite = np.flatnonzero(np.isfinite(self.costs))
+        self._heap = list(
+            zip(self.costs[finite].tolist(), self._versions[finite].tolist(), finite)
+        )
+        heapq.heapify(self._heap)
+
+    def get_edge_cycles(self, token_from, token_to):
+        edge = (
+            self._positions[token_from] * len(self.values) + self._positions[token_to]
+        )
+        return self._edge_cycles[
+            self._edge_offsets[edge] : self._edge_offsets[edge + 1]
+        ]
+
+    def update(self, token_from, token_to, price):
+        """
+        Set the price of a pair and re-score the cycles using it.
+
+        Return the number of re-scored cycles.
+        """
+        origin, destination = self._positions[token_from], self._positions[token_to]
+        self.values[origin, destination] = price
+        if origin == destination:
+            return 0
+        self.weights[origin, destination] = (
+            -np.log(price * (1 - self.swap_cost))
+            if np.isfinite(price) and price > 0
+            else np.inf
+        )
+
+        cycles = self.get_edge_cycles(token_from, token_to)
+        self.costs[cycles] = self._score(cycles)
+        self._versions[cycles] += 1
+        for cycle, cost, version in zip(
+            cycles, self.costs[cycles].tolist(), self._versions[cycles].tolist()
+        ):
+            if cost != np.inf:
+                heapq.heappush(self._heap, (cost, version, cycle))
+
+        # Outdated entries are only dropped when reaching the top of the heap
+        if len(self._heap) > 4 * len(self.indexes):
+            self._rebuild_heap()
+        return len(cycles)
+
+    def top(self, top=10):
+        """
+        Return the top cycles as (route, profit, prices) tuples sorted by decreasing
+        profit, like find_arbitrages.
+        """
+        best = []
+        while self._heap and len(best) < top:
+            cost, version, cycle = heapq.heappop(self._heap)
+            if version == self._versions[cycle]:
+                best.append((cost, version, cycle))
+        for entry in best:
+            heapq.heappush(self._heap, entry)
+
+        arbitrages = []
+        for cost, _, cycle in best:
+            route, cycle_prices = _format_cycle(
+                self.indexes[cycle][: self.lengths[cycle] + 1], self.values, self.names
+            )
+            arbitrages.append((route, np.exp(-cost), cycle_prices))
+        return arbitrages
+
+
+class TokenGraph:
+    """
+    Sparse graph of the priced pairs, for universes of tokens too large for the
+    exhaustive searches.
+
+    Only the pairs with a price, and optionally with enough liquidity, are stored, as
+    arrays of edges sorted by destination token: the incoming edges of token j are
+    offsets[j]:offsets[j + 1], i.e. a compressed sparse row layout of the transposed
+    prices matrix. Profitable cycles are found with a Bellman-Ford relaxation of all
+    the edges at once.
+    """
+
+    # Improvements smaller than this are rounding errors of consistent prices
+    TOLERANCE = 1e-12
+
+    def __init__(self, names, sources, destinations, prices, swap_cost=SWAP_COST):
+        self.names = list(names)
+        order = np.lexsort((sources, destinations))
+        self.sources = np.asarray(sources, dtype=np.intp)[order]
+        self.destinations = np.asarray(destinations, dtype=np.intp)[order]
+        self.prices = np.asarray(prices, dtype=float)[order]
+        self.weights = -np.log(self.prices * (1 - swap_cost))
+        self.offsets = np.searchsorted(
+            self.destinations, np.arange(len(self.names) + 1)
+        )
+        # Tokens with incoming edges, so that no reduceat segment is empty
+        counts = np.diff(self.offsets)
+        self._targets = np.flatnonzero(counts)
+        self._starts = self.offsets[self._targets]
+        self._counts = counts[self._targets]
+
+    def __len__(self):
+        return len(self.sources)
+
+    def equals(self, other):
+        """
+        Return whether other is a graph of the same prices, like DataFrame.equals.
+        """
+        return (
+            isinstance(other, TokenGraph)
+            and self.names == other.names
+            and np.array_equal(self.sources, other.sources)
+            and np.array_equal(self.destinations, other.destinations)
+            and np.array_equal(self.prices, other.prices)
+        )
+
+    def get_price(self, token_from, token_to):
+        """
+        Return the price of a pair, or 0 if the graph has no edge for it.
+        """
+        if token_from not in self.names or token_to not in self.names:
+            return 0.0
+        source, destination = self.names.index(token_from), self.names.index(token_to)
+        start, end = self.offsets[destination], self.offsets[destination + 1]
+        edge = start + np.searchsorted(self.sources[start:end], source)
+        if edge < end and self.sources[edge] == source:
+            return float(self.prices[edge])
+        return 0.0
+
+    def to_prices(self):
+        """
+        Return the dense prices matrix of the graph, with the layout of
+        ekubo.get_prices and 0 for the missing pairs.
+        """
+        prices = np.zeros((len(self.names), len(self.names)))
+        prices[self.sources, self.destinations] = self.prices
+        return pd.DataFrame(
+            prices,
+            index=pd.Index(self.names, name="token"),
+            columns=pd.Index(self.names, name="base"),
+        )
+
+    @classmethod
+    def from_prices(cls, prices, pairs=None, swap_cost=SWAP_COST):
+        """
+        Build the graph of the positive prices of a prices matrix, restricted to the
+        given (token, token, ...) pairs in both directions if any.
+        """
+        values = np.asarray(prices, dtype=float)
+        names = _get_names(prices)
+        mask = np.isfinite(values) & (values > 0)
+        np.fill_diagonal(mask, False)
+        if pairs is not None:
+            positions = {name: i for i, name in enumerate(names)}
+            allowed = np.zeros_like(mask)
+            for token_0, token_1, *_ in pairs:
+                if token_0 in positions and token_1 in positions:
+                    i, j = positions[token_0], positions[token_1]
+                    allowed[i, j] = allowed[j, i] = True
+            mask &= allowed
+        sources, destinations = np.nonzero(mask)
+        return cls(
+            names, sources, destinations, values[sources, destinations], swap_cost
+        )
+
+    def _get_predecessor_cycles(self, predecessors):
+        """
+        Return the cycles of the predecessor graph, each as a list of edges.
+        """
+        n_tokens = len(self.names)
+        # Jump at least n_tokens steps back from every token, with n_tokens as an
+        # absorbing token for the ones without predecessor: the tokens reached are
+        # on the cycles
+        jumps = np.append(self.sources[predecessors], n_tokens)
+        jumps[:-1][predecessors < 0] = n_tokens
+        for _ in range(int(np.ceil(np.log2(max(n_tokens, 2)))) + 1):
+            jumps = jumps[jumps]
+        on_cycles = np.unique(jumps[:-1])
+
+        cycles = []
+        seen = set()
+        for start in on_cycles[on_cycles < n_tokens].tolist():
+            if start in seen:
+                continue
+            edges = []
+            token = start
+            while not edges or token != start:
+                edge = predecessors[token]
+                edges.append(edge)
+                seen.add(token)
+                token = self.sources[edge]
+            cycles.append(edges[::-1])
+        return cycles
+
+    def find_negative_cycles(self, max_iterations=None):
+        """
+        Return cycles with a negative cost, i.e. profitable ones, as lists of edges.
+
+        All the tokens start at a zero distance, as if linked to a virtual origin,
+        and all the edges are relaxed at each iteration. The search stops at the
+        first iteration where the predecessors of the tokens form cycles, or when
+        the distances do not improve anymore.
+        """
+        n_tokens = len(self.names)
+        distances = np.zeros(n_tokens)
+        predecessors = np.full(n_tokens, -1, dtype=np.intp)
+        if len(self._targets) == 0:
+            return []
+        # Position of the first incoming edge of each edge destination target
+        segments = np.repeat(np.arange(len(self._targets)), self._counts)
+        for _ in range(max_iterations or n_tokens):
+            candidates = distances[self.sources] + self.weights
+            minima = np.minimum.reduceat(candidates, self._starts)
+            improved = minima < distances[self._targets] - self.TOLERANCE
+            if not improved.any():
+                return []
+            # First incoming edge reaching the minimum of each target
+            is_minimum = np.flatnonzero(candidates == minima[segments])
+            best_edges = is_minimum[
+                np.r_[True, segments[is_minimum][1:] != segments[is_minimum][:-1]]
+            ]
+            targets = self._targets[improved]
+            distances[targets] = minima[improved]
+            predecessors[targets] = best_edges[improved]
+            cycles = self._get_predecessor_cycles(predecessors)
+            if cycles:
+                return cycles
+        return []
+
+    def find_arbitrages(self, top=10, max_length=None, max_iterations=None):
+        """
+        Return the profitable cycles as (route, profit, prices) tuples sorted by
+        decreasing profit, like find_arbitrages.
+
+        Unlike the exhaustive searches, only the cycles found by the relaxation are
+        returned, not all the profitable ones.
+        """
+        arbitrages = []
+        for edges in self.find_negative_cycles(max_iterations):
+            if max_length is not None and len(edges) > max_length:
+                continue
+            cost = self.weights[edges].sum()
+            if cost >= 0:
+                continue
+            route = [self.names[token] for token in self.sources[edges]]
+            arbitrages.append(
+                (route + route[:1], float(np.exp(-cost)), self.prices[edges].tolist())
+            )
+        return sorted(arbitrages, key=lambda arbitrage: arbitrage[1], reverse=True)[
+            :top
+        ]
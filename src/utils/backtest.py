@@ -0,0 +1,198 @@
+"""
+Offline replay of recorded snapshots through the arbitrage search and sizing.
+
+For each snapshot, the best cycle of the prices matrix is searched and, when its
+estimated profit is above min_profit, the trade is sized on the pool states of the
+snapshot and executed on the pool states of the next one, to account for the
+pools moving before the transaction lands.
+"""
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.utils.arbitrage import SWAP_COST, find_arbitrages, get_cycles_indexes
+from src.utils.constants import BUILD_DIR
+from src.utils.ekubo import TOKEN_NAME_TO_ADDRESS
+from src.utils.registry import parse_int
+from src.utils.simulator import find_optimal_amount, get_marginal_rate, simulate_route
+from src.utils.snapshots import SnapshotStore
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _select_route_pools(route, pool_states):
+    """
+    Return the pool keys and directions of the route, keeping the pool with the best
+    marginal rate net of fee for each hop, or None if a hop has no pool.
+    """
+    pairs = defaultdict(list)
+    for pool_key in pool_states:
+        pairs[pool_key[:2]].append(pool_key)
+
+    pool_keys, directions = [], []
+    for token_from, token_to in zip(route[:-1], route[1:]):
+        candidates = pairs.get((min(token_from, token_to), max(token_from, token_to)))
+        if not candidates:
+            return None
+        is_token1 = token_from > token_to
+        pool_keys.append(
+            max(
+                candidates,
+                key=lambda pool_key: get_marginal_rate(
+                    [pool_states[pool_key]], [is_token1]
+                ),
+            )
+        )
+        directions.append(is_token1)
+    return pool_keys, directions
+
+
+def _backtest_snapshots(path, snapshots, swap_cost, max_length, min_profit):
+    store = SnapshotStore(path)
+    addresses = [
+        parse_int(TOKEN_NAME_TO_ADDRESS.get(name, name)) for name in store.names
+    ]
+    # Build the cycles once before timing the searches
+    get_cycles_indexes(len(store.names), max_length)
+    results = []
+    for i in snapshots:
+        prices = store.prices[i]
+        start = time.perf_counter()
+        arbitrages = find_arbitrages(prices, swap_cost, max_length, top=1)
+        result = {
+            "snapshot": i,
+            "timestamp": store.index["timestamp"][i],
+            "search_latency": time.perf_counter() - start,
+            "route": None,
+            "estimated_profit": 0.0,
+            "amount": 0,
+            "expected_profit": 0,
+            "realized_profit": 0,
+        }
+        results.append(result)
+        if not arbitrages or arbitrages[0][1] < min_profit:
+            continue
+        route, estimated_profit, _ = arbitrages[0]
+        result["route"] = [store.names[token] for token in route]
+        result["estimated_profit"] = estimated_profit
+
+        pool_states = store.get_pool_states(i)
+        route_pools = _select_route_pools(
+            [addresses[token] for token in route], pool_states
+        )
+        if route_pools is None:
+            continue
+        pool_keys, directions = route_pools
+        amount, expected_profit = find_optimal_amount(
+            [pool_states[pool_key] for pool_key in pool_keys], directions
+        )
+        if amount == 0:
+            continue
+        next_states = store.get_pool_states(i + 1) if i + 1 < len(store) else {}
+        realized_profit = (
+            simulate_route(
+                [next_states.get(key, pool_states[key]) for key in pool_keys],
+                directions,
+                amount,
+            )
+            - amount
+        )
+        result.update(
+            amount=amount,
+            expected_profit=expected_profit,
+            realized_profit=realized_profit,
+        )
+    return results
+
+
+def backtest(
+    path=BUILD_DIR / "snapshots",
+    swap_cost=SWAP_COST,
+    max_length=4,
+    min_profit=1.0,
+    max_workers=None,
+):
+    """
+    Replay all the snapshots of a store, split in chunks over processes.
+
+    Return a report of the run and the results of each snapshot.
+    """
+    n_snapshots = len(SnapshotStore(path))
+    max_workers = max_workers or os.cpu_count() or 1
+    chunks = [
+        chunk.tolist()
+        for chunk in np.array_split(np.arange(n_snapshots), max_workers * 4)
+        if len(chunk)
+    ]
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_results in executor.map(
+            _backtest_snapshots,
+            [path] * len(chunks),
+            chunks,
+            [swap_cost] * len(chunks),
+            [max_length] * len(chunks),
+            [min_profit] * len(chunks),
+        ):
+            results.extend(chunk_results)
+    results = pd.DataFrame(
+        results,
+        columns=[
+            "snapshot",
+            "timestamp",
+            "search_latency",
+            "route",
+            "estimated_profit",
+            "amount",
+            "expected_profit",
+            "realized_profit",
+        ],
+    )
+
+    opportunities = results.loc[results.route.notna()]
+    sized = opportunities.loc[opportunities.amount > 0]
+    hits = sized.loc[sized.realized_profit > 0]
+    latencies = results.search_latency.to_numpy() * 1e3
+    report = {
+        "snapshots": len(results),
+        "opportunities": len(opportunities),
+        "sized": len(sized),
+        "hits": len(hits),
+        "hit_rate": len(hits) / len(opportunities) if len(opportunities) else 0.0,
+        "mean_estimated_profit": (
+            float(opportunities.estimated_profit.mean()) if len(opportunities) else 0.0
+        ),
+        # Profits are in units of the origin token of each route, only their ratio
+        # can be aggregated
+        "median_realized_over_expected": (
+            float(
+                np.median(
+                    sized.realized_profit.astype(float)
+                    / sized.expected_profit.astype(float)
+                )
+            )
+            if len(sized)
+            else 0.0
+        ),
+        "search_latency_p50_ms": (
+            float(np.percentile(latencies, 50)) if len(latencies) else 0.0
+        ),
+        "search_latency_p99_ms": (
+            float(np.percentile(latencies, 99)) if len(latencies) else 0.0
+        ),
+    }
+    return report, results
+
+
+if __name__ == "__main__":
+    report, _ = backtest(*sys.argv[1:2])
+    for key, value in report.items():
+        logger.info(f"ℹ️  {key}: {value}")
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class AsyncTTLCache:
+    """
+    In-memory cache with a time to live, LRU eviction and single-flight fetches.
+
+    Keys are strings and values must be JSON serializable when a path is given: the
+    cache is then loaded from this file at init and saved after the updates, so that
+    a restarted process starts warm. Within an event loop, the updates of the next
+    dump_delay seconds are saved together in a worker thread, and flush() saves
+    them right away.
+
+    Values depending on the chain state can be tagged with the block_number they
+    were fetched at, and are then only served for this block.
+    """
+
+    def __init__(self, ttl=3600, maxsize=1024, path=None, dump_delay=1.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.path = Path(path) if path is not None else None
+        self.dump_delay = dump_delay
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._dump_task = None
+        self._dump_lock = threading.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, block_number=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, entry_block_number = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        if entry_block_number != block_number:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, block_number=None):
+        self._entries[key] = (value, time.time() + self.ttl, block_number)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        self._schedule_dump()
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+        self._schedule_dump()
+
+    async def get_or_fetch(self, key, fetch, block_number=None):
+        """
+        Return the cached value or await fetch() to get it.
+
+        Concurrent calls for the same missing key and block share a single fetch.
+        """
+        value = self.get(key, block_number)
+        if value is not None:
+            return value
+        inflight_key = (key, block_number)
+        if inflight_key not in self._inflight:
+            self._inflight[inflight_key] = asyncio.ensure_future(
+                self._fetch(key, fetch, block_number)
+            )
+        return await asyncio.shield(self._inflight[inflight_key])
+
+    async def _fetch(self, key, fetch, block_number):
+        try:
+            value = await fetch()
+            self.set(key, value, block_number)
+            return value
+        finally:
+            del self._inflight[(key, block_number)]
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            entries = json.loads(self.path.read_text())
+        except (json.JSONDecodeError, OSError) as err:
+            logger.warning(f"⚠️  Ignoring cache file {self.path}: {err}")
+            return
+        now = time.time()
+        # Files saved before the block numbers have 2 items per entry
+        for key, (value, expires_at, *block_number) in sorted(
+            entries.items(), key=lambda item: item[1][1]
+        ):
+            if expires_at > now:
+                self._entries[key] = (value, expires_at, *(block_number or [None]))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _schedule_dump(self):
+        if self.path is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.dump()
+            return
+        if self._dump_task is None:
+            self._dump_task = loop.create_task(self._dump_later())
+
+    async def _dump_later(self):
+        try:
+            await asyncio.sleep(self.dump_delay)
+        except asyncio.CancelledError:
+            # e.g. the loop is closing: the updates are saved rather than lost, unless
+            # flush() took over
+            if self._dump_task is asyncio.current_task():
+                self._dump_task = None
+                self.dump()
+            raise
+        self._dump_task = None
+        await asyncio.to_thread(self._write, dict(self._entries))
+
+    async def flush(self):
+        """
+        Save the pending updates now.
+        """
+        if self._dump_task is not None:
+            dump_task, self._dump_task = self._dump_task, None
+            dump_task.cancel()
+            await asyncio.to_thread(self._write, dict(self._entries))
+
+    def dump(self):
+        if self.path is None:
+            return
+        self._write(dict(self._entries))
+
+    def _write(self, entries):
+        # Dumps of successive updates may overlap in the worker threads
+        with self._dump_lock:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps(entries))
+            os.replace(tmp_path, self.path)
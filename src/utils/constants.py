@@ -1,15 +1,17 @@
+"""
+Network and project settings.
+
+Importing this module is cheap and does no I/O: the clients, the chain id and the
+contracts lists are only built on first access (see __getattr__).
+"""
+import asyncio
+import hashlib
 import json
 import logging
 import os
-from enum import IntEnum
-from math import ceil, log
 from pathlib import Path
 
-import requests
 from dotenv import load_dotenv
-from starknet_py.net.full_node_client import FullNodeClient
-from starknet_py.net.gateway_client import GatewayClient
-from starknet_py.net.models.chains import StarknetChainId
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -17,6 +19,11 @@ logger.setLevel(logging.INFO)
 load_dotenv()
 
 
+def _encode_chain_id(name: str) -> int:
+    # Same values as starknet_py's StarknetChainId, which is slow to import
+    return int.from_bytes(name.encode(), "big")
+
+
 NETWORKS = {
     "mainnet": {
         "name": "mainnet",
@@ -24,7 +31,7 @@ NETWORKS = {
         "rpc_url": f"https://starknet-mainnet.infura.io/v3/{os.getenv('INFURA_KEY')}",
         "gateway": "mainnet",
         "devnet": False,
-        "chain_id": StarknetChainId.MAINNET,
+        "chain_id": _encode_chain_id("SN_MAIN"),
     },
     "testnet": {
         "name": "testnet",
@@ -32,7 +39,7 @@ NETWORKS = {
         "rpc_url": f"https://starknet-goerli.infura.io/v3/{os.getenv('INFURA_KEY')}",
         "gateway": "testnet",
         "devnet": False,
-        "chain_id": StarknetChainId.TESTNET,
+        "chain_id": _encode_chain_id("SN_GOERLI"),
     },
     "testnet2": {
         "name": "testnet2",
@@ -40,7 +47,7 @@ NETWORKS = {
         "rpc_url": f"https://starknet-goerli2.infura.io/v3/{os.getenv('INFURA_KEY')}",
         "gateway": "testnet2",
         "devnet": False,
-        "chain_id": StarknetChainId.TESTNET2,
+        "chain_id": _encode_chain_id("SN_GOERLI2"),
     },
     "starknet-devnet": {
         "name": "starknet-devnet",
@@ -105,43 +112,14 @@ if NETWORK["private_key"] is None:
     logger.warning(f"⚠️  {prefix}_PRIVATE_KEY not set, defaulting to PRIVATE_KEY")
     NETWORK["private_key"] = os.getenv("PRIVATE_KEY")
 
-RPC_CLIENT = FullNodeClient(node_url=NETWORK["rpc_url"])
-GATEWAY_CLIENT = GatewayClient(NETWORK["gateway"]) if NETWORK.get("gateway") else None
-CLIENT = GATEWAY_CLIENT if GATEWAY_CLIENT is not None else RPC_CLIENT
-
-try:
-    response = requests.post(
-        RPC_CLIENT.url,
-        json={
-            "jsonrpc": "2.0",
-            "method": "starknet_chainId",
-            "params": [],
-            "id": 0,
-        },
-        timeout=5,
-    )
-    payload = json.loads(response.text)
-
-    class ChainId(IntEnum):
-        chain_id = int(payload["result"], 16)
-
-    NETWORK["chain_id"] = ChainId.chain_id
-except (requests.exceptions.ConnectionError, requests.exceptions.MissingSchema):
-    pass
-
-
 ETH_TOKEN_ADDRESS = 0x49D36570D4E46F48E99674BD3FCC84644DDD6B96F7C741B1562B82F9E004DC7
 SOURCE_DIR = Path("src")
 SOURCE_DIR_FIXTURES = Path("tests/fixtures")
-CONTRACTS = {p.stem: p for p in list(SOURCE_DIR.glob("**/*.cairo"))}
-CONTRACTS_FIXTURES = {p.stem: p for p in list(SOURCE_DIR_FIXTURES.glob("**/*.cairo"))}
 
 BUILD_DIR = Path("build")
 BUILD_DIR_FIXTURES = BUILD_DIR / "fixtures"
-BUILD_DIR.mkdir(exist_ok=True, parents=True)
-BUILD_DIR_FIXTURES.mkdir(exist_ok=True, parents=True)
 DEPLOYMENTS_DIR = Path("deployments") / NETWORK["name"]
-DEPLOYMENTS_DIR.mkdir(exist_ok=True, parents=True)
+CHAIN_IDS_PATH = BUILD_DIR / "chain_ids.json"
 
 COMPILED_CONTRACTS = [
     {"contract_name": "Sheet", "is_account_contract": False},
@@ -160,8 +138,119 @@ N_ROWS = 15
 
 ALLOW_LIST = []
 
-if NETWORK.get("chain_id"):
+
+def _get_chain_ids():
+    try:
+        return json.loads(CHAIN_IDS_PATH.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _get_rpc_key():
+    rpc_url = NETWORK["rpc_url"] or ""
+    return hashlib.sha256(rpc_url.encode()).hexdigest()[:16]
+
+
+def _get_known_chain_id():
+    if NETWORK.get("chain_id") is None:
+        chain_id = _get_chain_ids().get(_get_rpc_key())
+        if chain_id is not None:
+            NETWORK["chain_id"] = int(chain_id, 16)
+    return NETWORK.get("chain_id")
+
+
+def _save_chain_id(result):
+    NETWORK["chain_id"] = int(result, 16)
+    chain_ids = _get_chain_ids()
+    chain_ids[_get_rpc_key()] = result
+    CHAIN_IDS_PATH.parent.mkdir(exist_ok=True, parents=True)
+    CHAIN_IDS_PATH.write_text(json.dumps(chain_ids, indent=2))
     logger.info(
-        f"ℹ️  Connected to CHAIN_ID {NETWORK['chain_id'].value.to_bytes(ceil(log(NETWORK['chain_id'].value, 256)), 'big')} "
-        f"with {f'Gateway {GATEWAY_CLIENT.net}' if GATEWAY_CLIENT is not None else f'RPC {RPC_CLIENT.url}'}"
+        f"ℹ️  Connected to CHAIN_ID {NETWORK['chain_id'].to_bytes(32, 'big').lstrip(bytes(1))} "
+        f"with RPC {NETWORK['rpc_url']}"
     )
+    return NETWORK["chain_id"]
+
+
+async def get_chain_id():
+    """
+    Return the chain id of the current network.
+
+    For networks without a known chain id, the RPC is asked once and the answer is
+    saved in CHAIN_IDS_PATH, keyed by a hash of the RPC url so that api keys are not
+    written to disk.
+    """
+    if _get_known_chain_id() is not None:
+        return NETWORK["chain_id"]
+
+    from src.utils.rpc import RpcError, RpcUnavailableError, get_rpc_transport
+
+    try:
+        result = await asyncio.wait_for(
+            get_rpc_transport().call("starknet_chainId"), timeout=5
+        )
+    except (RpcUnavailableError, asyncio.TimeoutError):
+        return None
+    except RpcError as err:
+        logger.warning(f"⚠️  Cannot get chain id from {NETWORK['rpc_url']}: {err}")
+        return None
+    return _save_chain_id(result)
+
+
+def get_chain_id_sync():
+    """
+    Blocking version of get_chain_id, for the code running outside of an event loop.
+    """
+    if _get_known_chain_id() is not None:
+        return NETWORK["chain_id"]
+
+    from src.utils.rpc import RpcError, RpcUnavailableError, get_rpc_transport
+
+    try:
+        result = get_rpc_transport().call_sync("starknet_chainId", retries=0, timeout=5)
+    except RpcUnavailableError:
+        return None
+    except RpcError as err:
+        logger.warning(f"⚠️  Cannot get chain id from {NETWORK['rpc_url']}: {err}")
+        return None
+    return _save_chain_id(result)
+
+
+def _get_rpc_client():
+    from starknet_py.net.full_node_client import FullNodeClient
+
+    return FullNodeClient(node_url=NETWORK["rpc_url"])
+
+
+def _get_gateway_client():
+    if not NETWORK.get("gateway"):
+        return None
+
+    from starknet_py.net.gateway_client import GatewayClient
+
+    return GatewayClient(NETWORK["gateway"])
+
+
+_LAZY_ATTRIBUTES = {
+    "RPC_CLIENT": _get_rpc_client,
+    "GATEWAY_CLIENT": _get_gateway_client,
+    "CLIENT": lambda: (
+        __getattr__("GATEWAY_CLIENT")
+        if __getattr__("GATEWAY_CLIENT") is not None
+        else __getattr__("RPC_CLIENT")
+    ),
+    "CHAIN_ID": get_chain_id_sync,
+    "CONTRACTS": lambda: {p.stem: p for p in SOURCE_DIR.glob("**/*.cairo")},
+    "CONTRACTS_FIXTURES": lambda: {
+        p.stem: p for p in SOURCE_DIR_FIXTURES.glob("**/*.cairo")
+    },
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = _LAZY_ATTRIBUTES[name]()
+    if name != "CHAIN_ID" or value is not None:
+        globals()[name] = value
+    return value
@@ -0,0 +1,766 @@
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from dataclasses import replace
+
+import aiohttp
+import numpy as np
+import pandas as pd
+from starknet_py.constants import QUERY_VERSION_BASE
+from starknet_py.contract import Contract
+from starknet_py.hash.selector import get_selector_from_name
+from starknet_py.net.client_models import Call
+from starknet_py.net.models.transaction import Invoke
+
+from src.utils import constants
+from src.utils.arbitrage import TokenGraph
+from src.utils.cache import AsyncTTLCache
+from src.utils.constants import BUILD_DIR
+from src.utils.metrics import METRICS
+from src.utils.nonce import get_nonce_manager
+from src.utils.registry import PoolRegistry, PoolView, TokenRegistry, parse_int
+from src.utils.rpc import RpcError, get_rpc_transport
+from src.utils.simulator import PoolState
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EKUBO_API_URL = "https://mainnet-api.ekubo.org"
+EKUBO_CORE_ADDRESS = (
+    "0x00000005dd3d2f4429af886cd1a3b08289dbcea99a294197e9eb43b0e0325b4b"
+)
+
+TOKENS = {
+    "0xda114221cb83fa859dbdb4c44beeaa0bb37c7537ad5ae66fe5e0efd20e6eb3": "DAI",
+    "0x124aeb495b947201f5fac96fd1138e326ad86195b98df6dec9009158a533b49": "LORDS",
+    "0x319111a5037cbec2b3e638cc34a3474e2d2608299f3e62866e9cc683208c610": "rETH",
+    "0x3fe2b97c1fd336e750087d68b9b867997fd64a2661ff3ca5a7c771641e8e7ac": "WBTC",
+    "0x42b8f0484674ca266ac5d08e4ac6a3fe65bd3129795def2dca5c34ecc5f96d2": "wstETH",
+    "0x53c91253bc9682c04929ca02ed00b3e423f6710d2ee7e0d5ebb06f3ecf368a8": "USDC",
+    "0x68f5c6a61780768455de69077e07e89787839bf8166decfbf92b645209c0fb8": "USDT",
+    "0x49d36570d4e46f48e99674bd3fcc84644ddd6b96f7c741b1562b82f9e004dc7": "ETH",
+}
+TOKEN_NAME_TO_ADDRESS = {value: key for key, value in TOKENS.items()}
+# Amounts are in 10**-decimals of a token, whereas the API prices whole tokens
+TOKEN_DECIMALS = {
+    "DAI": 18,
+    "LORDS": 18,
+    "rETH": 18,
+    "WBTC": 8,
+    "wstETH": 18,
+    "USDC": 6,
+    "USDT": 6,
+    "ETH": 18,
+}
+TOKEN_REGISTRY = TokenRegistry(TOKENS)
+
+TICK_SPACING = {
+    5982: "0.3% / 0.6%",
+    200: "0.01% / 0.02%",
+    1000: "0.05% / 0.1%",
+}
+STABLE = ["USDC", "DAI", "USDT"]
+FLASHSWAP_ADDRESS = 0x03E5538F146CCC90EAB5B60B374123EB54D97621879A3392BAA1BD12CE0BF3FF
+
+POOLS_CACHE = AsyncTTLCache(ttl=3600, maxsize=1024, path=BUILD_DIR / "pools.json")
+POOL_REGISTRY = PoolRegistry(TOKEN_REGISTRY)
+_flashswap_contracts = {}
+
+
+def get_session(concurrency=8, timeout=5):
+    """
+    Return a keep-alive HTTP session whose connection pool is bounded by concurrency.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency, keepalive_timeout=60),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        raise_for_status=True,
+    )
+
+
+async def fetch_json(session, url, retries=3, backoff=0.1):
+    # The first path segment, e.g. price, pair or pools, labels the API latencies
+    endpoint = url.split("/")[3] if url.count("/") > 2 else url
+    for attempt in range(retries + 1):
+        try:
+            with METRICS.span("api_seconds", endpoint=endpoint):
+                async with session.get(url) as response:
+                    return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            if attempt == retries:
+                raise
+            delay = backoff * 2**attempt
+            logger.warning(f"⚠️  {url} failed ({err}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+
+async def get_prices(
+    tokens=None, api_url=EKUBO_API_URL, session=None, concurrency=8, retries=3
+):
+    """
+    Fetch the prices of all the tokens against each other.
+
+    The result has the same layout as the former concat/pivot of the price endpoints:
+    rows are the quoted tokens, columns the base tokens, both sorted by name, and
+    missing pairs are 0.
+    """
+    tokens = tokens or TOKENS
+    registry = TOKEN_REGISTRY if tokens is TOKENS else TokenRegistry(tokens)
+    # The tokens come first in the registry, before the ones interned from pools
+    names = registry.names[: len(tokens)]
+    prices = np.zeros((len(names), len(names)))
+
+    own_session = session is None
+    session = session or get_session(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fill_column(address):
+        async with semaphore:
+            payload = await fetch_json(session, f"{api_url}/price/{address}", retries)
+        column = registry.find(address)
+        for quote in payload["prices"]:
+            row = registry.find(quote["token"])
+            if row is not None and row < len(names):
+                prices[row, column] = float(quote["price"])
+
+    try:
+        await asyncio.gather(*[_fill_column(address) for address in tokens])
+    finally:
+        if own_session:
+            await session.close()
+
+    return pd.DataFrame(
+        prices,
+        index=pd.Index(names, name="token"),
+        columns=pd.Index(names, name="base"),
+    )
+
+
+def _get_covering_tokens(pairs):
+    """
+    Return tokens such that each (token, token) pair has at least one of them,
+    greedily taking the token of the most pairs not covered yet.
+    """
+    uncovered = set(pairs)
+    covering = []
+    while uncovered:
+        counts = Counter(token for pair in uncovered for token in pair)
+        token = min(counts, key=lambda token: (-counts[token], token))
+        covering.append(token)
+        uncovered = {pair for pair in uncovered if token not in pair}
+    return covering
+
+
+async def get_pair_prices(
+    pairs,
+    tokens=None,
+    api_url=EKUBO_API_URL,
+    session=None,
+    concurrency=8,
+    retries=3,
+):
+    """
+    Fetch the prices of the given (name, name, ...) pairs in both directions, as a
+    sparse TokenGraph, e.g. for the liquid pairs of discover_tokens.
+
+    Unlike get_prices, no prices matrix is built and the price endpoint is only
+    called for the few tokens covering all the pairs, usually the hubs of the
+    liquid pairs. The other direction of a pair is priced with the inverse when its
+    base token is not fetched.
+    """
+    tokens = tokens or TOKENS
+    registry = TOKEN_REGISTRY if tokens is TOKENS else TokenRegistry(tokens)
+    names = registry.names[: len(tokens)]
+    positions = {name: i for i, name in enumerate(names)}
+    edges = {
+        tuple(sorted((positions[token_0], positions[token_1])))
+        for token_0, token_1, *_ in pairs
+        if token_0 in positions and token_1 in positions and token_0 != token_1
+    }
+    neighbours = defaultdict(set)
+    for token_0, token_1 in edges:
+        neighbours[token_0].add(token_1)
+        neighbours[token_1].add(token_0)
+    prices = {}
+
+    own_session = session is None
+    session = session or get_session(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _fill_base(base):
+        async with semaphore:
+            payload = await fetch_json(
+                session, f"{api_url}/price/{hex(registry.addresses[base])}", retries
+            )
+        for quote in payload["prices"]:
+            token = registry.find(quote["token"])
+            if token in neighbours[base]:
+                prices[token, base] = float(quote["price"])
+
+    try:
+        await asyncio.gather(
+            *[_fill_base(base) for base in _get_covering_tokens(edges)]
+        )
+    finally:
+        if own_session:
+            await session.close()
+
+    for (token, base), price in list(prices.items()):
+        if (base, token) not in prices and price > 0:
+            prices[base, token] = 1 / price
+    prices = {
+        edge: price
+        for edge, price in prices.items()
+        if np.isfinite(price) and price > 0
+    }
+    return TokenGraph(
+        names,
+        np.array([source for source, _ in prices], dtype=np.intp),
+        np.array([destination for _, destination in prices], dtype=np.intp),
+        np.array(list(prices.values()), dtype=float),
+    )
+
+
+def register_tokens(tokens):
+    """
+    Make the tokens of a {address: name} dict, e.g. discovered ones, usable in
+    routes by name.
+    """
+    for address, name in tokens.items():
+        TOKEN_NAME_TO_ADDRESS[name] = address
+        TOKEN_REGISTRY.intern(address, name)
+
+
+async def discover_tokens(min_liquidity=1.0, api_url=EKUBO_API_URL, session=None):
+    """
+    Return the tokens of the Ekubo pairs with at least min_liquidity ETH locked, as
+    a {address: name} dict, and these pairs as (name, name, liquidity) tuples sorted
+    by decreasing liquidity.
+
+    The locked amounts of the pairs are converted with the decimals of the tokens
+    list and valued with the ETH prices, so that pairs with a token without ETH
+    price only count the liquidity of the other one. Known tokens keep their name,
+    others are named by symbol, suffixed with the end of their address when the
+    symbol is already taken. The decimals of the discovered tokens are saved in
+    TOKEN_DECIMALS.
+    """
+    own_session = session is None
+    session = session or get_session()
+    eth = TOKEN_NAME_TO_ADDRESS["ETH"]
+    try:
+        pairs, tokens_list, eth_prices = await asyncio.gather(
+            fetch_json(session, f"{api_url}/overview/pairs"),
+            fetch_json(session, f"{api_url}/tokens"),
+            fetch_json(session, f"{api_url}/price/{eth}"),
+        )
+    finally:
+        if own_session:
+            await session.close()
+
+    decimals = {
+        parse_int(token["l2_token_address"]): int(token.get("decimals", 18))
+        for token in tokens_list
+    }
+    symbols = {
+        parse_int(token["l2_token_address"]): token["symbol"] for token in tokens_list
+    }
+    rates = {
+        parse_int(quote["token"]): float(quote["price"])
+        for quote in eth_prices["prices"]
+    }
+    rates[parse_int(eth)] = 1.0
+
+    def _get_liquidity(token, amount):
+        return int(amount) / 10 ** decimals.get(token, 18) * rates.get(token, 0.0)
+
+    liquid_pairs = []
+    for pair in pairs["topPairs"]:
+        token0, token1 = parse_int(pair["token0"]), parse_int(pair["token1"])
+        liquidity = _get_liquidity(token0, pair["tvl0_total"]) + _get_liquidity(
+            token1, pair["tvl1_total"]
+        )
+        if liquidity >= min_liquidity and token0 != token1:
+            liquid_pairs.append((token0, token1, liquidity))
+    liquid_pairs.sort(key=lambda pair: pair[2], reverse=True)
+
+    discovered = list(
+        dict.fromkeys(
+            token for token0, token1, _ in liquid_pairs for token in (token0, token1)
+        )
+    )
+    names = {parse_int(address): name for address, name in TOKENS.items()}
+    taken = set(names.values())
+    for token in discovered:
+        if token in names:
+            continue
+        name = symbols.get(token, hex(token))
+        if name in taken:
+            name = f"{name}-{hex(token)[-4:]}"
+        names[token] = name
+        taken.add(name)
+    for token in discovered:
+        TOKEN_DECIMALS.setdefault(names[token], decimals.get(token, 18))
+
+    return {hex(token): names[token] for token in discovered}, [
+        (names[token0], names[token1], liquidity)
+        for token0, token1, liquidity in liquid_pairs
+    ]
+
+
+async def get_pool(
+    token_from,
+    token_to,
+    session=None,
+    api_url=EKUBO_API_URL,
+    cache=None,
+    block_number=None,
+):
+    """
+    Return the top pools of a pair.
+
+    The pools metadata (fee, tick_spacing, extension, volumes) rarely change, so the
+    API response is served from POOLS_CACHE when fresh enough. With a block_number,
+    it is only served for this block, e.g. to see the pools created since.
+    """
+    cache = POOLS_CACHE if cache is None else cache
+
+    async def _fetch_top_pools():
+        logger.info(
+            f"Fetching pools for pair {TOKEN_REGISTRY.get_name(token_from)}/"
+            f"{TOKEN_REGISTRY.get_name(token_to)}"
+        )
+        own_session = session is None
+        _session = session or get_session()
+        try:
+            payload = await fetch_json(
+                _session, f"{api_url}/pair/{token_from}/{token_to}"
+            )
+        finally:
+            if own_session:
+                await _session.close()
+        return payload["topPools"]
+
+    top_pools = await cache.get_or_fetch(
+        f"{token_from}/{token_to}", _fetch_top_pools, block_number
+    )
+    return pd.DataFrame(top_pools).assign(
+        token_from=token_from,
+        token_to=token_to,
+        pool_id=[
+            POOL_REGISTRY.add(
+                token_from,
+                token_to,
+                pool["fee"],
+                pool["tick_spacing"],
+                pool["extension"],
+            )
+            for pool in top_pools
+        ],
+        from_id=TOKEN_REGISTRY.get_id(token_from),
+        to_id=TOKEN_REGISTRY.get_id(token_to),
+    )
+
+
+async def get_pools(route, session=None, block_number=None):
+    """
+    Fetch the candidate pools of each hop of a route given as a list of token names.
+    """
+    return (
+        pd.concat(
+            await asyncio.gather(
+                *[
+                    get_pool(
+                        TOKEN_NAME_TO_ADDRESS[token_0],
+                        TOKEN_NAME_TO_ADDRESS[token_1],
+                        session=session,
+                        block_number=block_number,
+                    )
+                    for token_0, token_1 in zip(route[:-1], route[1:])
+                ]
+            )
+        )
+        .reset_index(drop=True)
+        .loc[lambda df: df.tick_spacing.astype(int).isin(TICK_SPACING.keys())]
+    )
+
+
+def get_pool_key(pool):
+    if isinstance(pool, PoolView):
+        return pool.pool_key
+    token_from, token_to = parse_int(pool["token_from"]), parse_int(pool["token_to"])
+    return [
+        min(token_from, token_to),
+        max(token_from, token_to),
+        int(pool["fee"]),
+        int(pool["tick_spacing"]),
+        int(pool["extension"]),
+    ]
+
+
+async def call_core(entry_point, calldatas, rpc_url=None, block_id="latest"):
+    """
+    Call an entry point of Ekubo core once per calldata, in a single JSON-RPC batch
+    request, and return the results in the same order.
+    """
+    selector = hex(get_selector_from_name(entry_point))
+    results = await get_rpc_transport(rpc_url).batch(
+        [
+            (
+                "starknet_call",
+                {
+                    "request": {
+                        "contract_address": EKUBO_CORE_ADDRESS,
+                        "entry_point_selector": selector,
+                        "calldata": [hex(value) for value in calldata],
+                    },
+                    "block_id": block_id,
+                },
+            )
+            for calldata in calldatas
+        ],
+        return_exceptions=True,
+    )
+    for calldata, result in zip(calldatas, results):
+        if isinstance(result, RpcError):
+            raise RuntimeError(f"{entry_point} failed for {calldata}: {result}")
+        if isinstance(result, Exception):
+            raise result
+    return [[int(value, 16) for value in result] for result in results]
+
+
+async def get_pool_ticks(pool_key, session=None, api_url=EKUBO_API_URL):
+    """
+    Return the sorted (tick, liquidity_net) of the initialized ticks of a pool.
+    """
+    own_session = session is None
+    session = session or get_session()
+    try:
+        payload = await fetch_json(
+            session,
+            f"{api_url}/pools/{'/'.join(hex(value) for value in pool_key)}/liquidity",
+        )
+    finally:
+        if own_session:
+            await session.close()
+    return sorted(
+        (int(tick["tick"]), int(tick["net_liquidity_delta_diff"]))
+        for tick in payload["data"]
+    )
+
+
+async def get_pool_states(
+    pools, session=None, rpc_url=None, api_url=EKUBO_API_URL, block_id="latest"
+):
+    """
+    Fetch the price, liquidity and initialized ticks of the pools, to simulate swaps.
+
+    The ticks come from the API, which only serves the latest ones whatever block_id.
+    """
+    pool_keys = [get_pool_key(pool) for pool in pools]
+    prices, liquidities, *ticks = await asyncio.gather(
+        call_core("get_pool_price", pool_keys, rpc_url, block_id),
+        call_core("get_pool_liquidity", pool_keys, rpc_url, block_id),
+        *[get_pool_ticks(pool_key, session, api_url) for pool_key in pool_keys],
+    )
+    return [
+        PoolState(
+            sqrt_ratio=sqrt_ratio_low + (sqrt_ratio_high << 128),
+            tick=-tick_mag if tick_sign else tick_mag,
+            liquidity=liquidity[0],
+            fee=pool_key[2],
+            ticks=pool_ticks,
+        )
+        for (
+            (sqrt_ratio_low, sqrt_ratio_high, tick_mag, tick_sign, *_),
+            liquidity,
+            pool_key,
+            pool_ticks,
+        ) in zip(prices, liquidities, pool_keys, ticks)
+    ]
+
+
+def get_route_directions(pools):
+    """
+    Return for each pool whether its input is its token1, as expected by the simulator.
+    """
+    return [
+        pool_key[1] == parse_int(pool["token_from"])
+        for pool, pool_key in zip(pools, map(get_pool_key, pools))
+    ]
+
+
+async def update_pool_sqrt_ratios(pool_ids, session=None, mirror=None):
+    """
+    Refresh the sqrt ratios of the pools of the registry, from the mirror when given
+    or with a single JSON-RPC batch request.
+    """
+    pool_ids = list(dict.fromkeys(pool_ids))
+    pool_keys = [POOL_REGISTRY.pool_keys[pool_id] for pool_id in pool_ids]
+    if mirror is None:
+        results = await call_core("get_pool_price", pool_keys)
+        sqrt_ratios = [low + (high << 128) for low, high, *_ in results]
+    else:
+        await mirror.track(
+            [
+                POOL_REGISTRY.view(pool_id, POOL_REGISTRY.token0[pool_id])
+                for pool_id in pool_ids
+            ],
+            session=session,
+        )
+        sqrt_ratios = [
+            mirror.pools[tuple(pool_key)].sqrt_ratio for pool_key in pool_keys
+        ]
+    POOL_REGISTRY.set_sqrt_ratios(pool_ids, sqrt_ratios)
+
+
+async def select_pools(route, pools, session=None, mirror=None):
+    """
+    Price all the candidate pools and keep one pool per hop of the route.
+
+    All the pools of a pair are parallel edges of the hop: the selected one is the
+    pool with the best live price net of its fee. Prices are read from the mirror
+    when given, instead of being called on the node.
+    """
+    pool_ids = pools.pool_id.to_numpy(dtype=np.intp)
+    from_ids = pools.from_id.to_numpy(dtype=np.intp)
+    to_ids = pools.to_id.to_numpy(dtype=np.intp)
+    route_ids = np.array(TOKEN_REGISTRY.get_ids(route), dtype=np.intp)
+    n_tokens = len(TOKEN_REGISTRY)
+    hops = np.full(n_tokens * n_tokens, -1, dtype=np.intp)
+    hops[route_ids[:-1] * n_tokens + route_ids[1:]] = np.arange(len(route_ids) - 1)
+    hop = hops[from_ids * n_tokens + to_ids]
+
+    await update_pool_sqrt_ratios(pool_ids.tolist(), session=session, mirror=mirror)
+    prices = POOL_REGISTRY.get_prices(pool_ids, from_ids)
+    net_prices = prices * (1 - POOL_REGISTRY.fee_ratio[pool_ids])
+
+    # Sort by hop then decreasing net price and keep the first pool of each hop,
+    # pools of pairs outside of the route coming first and being dropped
+    order = np.lexsort((-net_prices, hop))
+    order = order[hop[order] >= 0]
+    selected = order[np.r_[True, np.diff(hop[order]) != 0]]
+    if len(selected) != len(route_ids) - 1:
+        missing = sorted(set(range(len(route_ids) - 1)) - set(hop[selected].tolist()))
+        raise ValueError(
+            f"No pool for hops {[route[i:i + 2] for i in missing]} of route {route}"
+        )
+
+    addresses = TOKEN_REGISTRY.addresses
+    selected_ids = pool_ids[selected]
+    return (
+        pools.iloc[selected]
+        .reset_index(drop=True)
+        .assign(
+            price=prices[selected],
+            net_price=net_prices[selected],
+            required_liquidity=np.cumprod(prices[selected]),
+            token_from=[addresses[i] for i in from_ids[selected]],
+            token_to=[addresses[i] for i in to_ids[selected]],
+            token_0=[addresses[i] for i in POOL_REGISTRY.token0[selected_ids]],
+            token_1=[addresses[i] for i in POOL_REGISTRY.token1[selected_ids]],
+        )
+    )
+
+
+def get_route_pools(selected_pools):
+    """
+    Return the selected pools as registry views, usable wherever pool records are.
+    """
+    return [
+        POOL_REGISTRY.view(pool_id, from_id)
+        for pool_id, from_id in zip(
+            selected_pools.pool_id.to_list(), selected_pools.from_id.to_list()
+        )
+    ]
+
+
+def get_swap_params(selected_pools):
+    """
+    Return the route argument of flashloan_swap for the selected pools.
+    """
+    return [
+        POOL_REGISTRY.get_swap_params(pool_id, from_id)
+        for pool_id, from_id in zip(
+            selected_pools.pool_id.to_list(), selected_pools.from_id.to_list()
+        )
+    ]
+
+
+async def get_eth_balance(address):
+    balance_low, balance_high = await constants.RPC_CLIENT.call_contract(
+        Call(
+            to_addr=int(TOKEN_NAME_TO_ADDRESS["ETH"], 16),
+            selector=get_selector_from_name("balanceOf"),
+            calldata=[address],
+        )
+    )
+    return balance_low + balance_high * 2**128
+
+
+async def get_flashswap_contract(account):
+    """
+    Return the flashswap contract, fetching its class and parsing its ABI only once
+    per account.
+    """
+    if account.address not in _flashswap_contracts:
+        _flashswap_contracts[account.address] = await Contract.from_address(
+            FLASHSWAP_ADDRESS, account
+        )
+    return _flashswap_contracts[account.address]
+
+
+def get_execute_calldata(calls, cairo_version):
+    """
+    Return the calldata of the __execute__ entrypoint of an account for calls, in
+    the layout of its Cairo version.
+    """
+    if cairo_version == 1:
+        calldata = [len(calls)]
+        for call in calls:
+            calldata += [
+                call.to_addr,
+                call.selector,
+                len(call.calldata),
+                *call.calldata,
+            ]
+        return calldata
+    calldata = [len(calls)]
+    offset = 0
+    for call in calls:
+        calldata += [call.to_addr, call.selector, offset, len(call.calldata)]
+        offset += len(call.calldata)
+    calldata.append(offset)
+    for call in calls:
+        calldata += call.calldata
+    return calldata
+
+
+class FlashswapTemplates:
+    """
+    Pre-serialized flashloan_swap calls, to sign and send a route with as little work
+    as possible once the opportunity is detected.
+
+    The calldata of each route is serialized once with the contract ABI, and only
+    the amount is patched in afterwards. Transactions are built at the next nonce
+    of the account NonceManager, so that they can be signed ahead of time, e.g.
+    while they are being simulated, and are re-signed if the nonce moved before
+    they are sent.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self.nonces = get_nonce_manager(account)
+        self._function = None
+        self._cairo_version = None
+        self._templates = {}
+
+    async def prepare(self):
+        """
+        Resolve the ABI, the account Cairo version and the nonce ahead of the first
+        transaction.
+        """
+        if self._function is None:
+            contract = await get_flashswap_contract(self.account)
+            self._function = contract.functions["flashloan_swap"]
+        if self._cairo_version is None:
+            self._cairo_version = await self.account.cairo_version
+        await self.nonces.peek()
+
+    def _prepare_call(self, swap_params, amount_from):
+        return self._function.prepare(
+            flashswap_params={"amount_from": amount_from, "routes": swap_params}
+        )
+
+    def _get_template(self, swap_params):
+        """
+        Return the call of a route with a zero amount, and the calldata positions of
+        the amount, found by serializing a second, different amount.
+        """
+        call = self._prepare_call(swap_params, 0)
+        try:
+            # A u256 amount spans two felts
+            other = self._prepare_call(swap_params, 2**128 + 1)
+        except ValueError:
+            other = self._prepare_call(swap_params, 1)
+        positions = [
+            i
+            for i, (value, other_value) in enumerate(zip(call.calldata, other.calldata))
+            if value != other_value
+        ]
+        return call, positions
+
+    def get_call(self, swap_params, amount_from):
+        key = tuple(
+            (params["token_from"], *params["pool_key"].values())
+            for params in swap_params
+        )
+        template = self._templates.get(key)
+        if template is None:
+            template = self._templates[key] = self._get_template(swap_params)
+        call, positions = template
+        calldata = list(call.calldata)
+        if len(positions) == 2:
+            calldata[positions[0]] = amount_from & (2**128 - 1)
+            calldata[positions[1]] = amount_from >> 128
+        else:
+            calldata[positions[0]] = amount_from
+        return Call(to_addr=call.to_addr, selector=call.selector, calldata=calldata)
+
+    async def build(self, swap_params, amount_from, max_fee, query=False, nonce=None):
+        """
+        Return the unsigned transaction of a route at the next nonce, in the query
+        version that cannot be broadcast if query is set.
+        """
+        if self._function is None or self._cairo_version is None:
+            await self.prepare()
+        call = self.get_call(swap_params, amount_from)
+        return Invoke(
+            version=1 + QUERY_VERSION_BASE if query else 1,
+            sender_address=self.account.address,
+            calldata=get_execute_calldata([call], self._cairo_version),
+            max_fee=max_fee,
+            signature=[],
+            nonce=await self.nonces.peek() if nonce is None else nonce,
+        )
+
+    async def sign(self, swap_params, amount_from, max_fee, nonce=None):
+        """
+        Return the signed transaction of a route.
+
+        Signing is CPU bound and runs in a thread, so that several routes can be
+        signed while the event loop waits for the node.
+        """
+        transaction = await self.build(swap_params, amount_from, max_fee, nonce=nonce)
+        signature = await asyncio.to_thread(
+            self.account.signer.sign_transaction, transaction
+        )
+        return replace(transaction, signature=signature)
+
+    async def send(self, swap_params, amount_from, max_fee, transaction=None):
+        """
+        Send the transaction of a route with a nonce reserved on the account
+        NonceManager and return its hash.
+
+        A transaction signed ahead of time is sent as is if it has this nonce, and
+        signed again otherwise.
+        """
+
+        async def _send(nonce):
+            signed = transaction
+            if signed is None or signed.nonce != nonce:
+                signed = await self.sign(swap_params, amount_from, max_fee, nonce)
+            return await self.account.client.send_transaction(signed)
+
+        transaction_hash, _ = await self.nonces.submit(_send)
+        return transaction_hash
+
+
+async def flashloan_swap(account, swap_params, amount_from, max_fee):
+    """
+    Send the flashloan_swap of a route with a nonce reserved on the account
+    NonceManager, shared with the other senders, and return its hash.
+    """
+    templates = FlashswapTemplates(account)
+    await templates.prepare()
+    return await templates.send(swap_params, amount_from, max_fee)
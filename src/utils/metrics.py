@@ -0,0 +1,205 @@
+"""
+Low overhead metrics: counters, latency histograms and span timers.
+
+Metrics are exported in the Prometheus text format on a local HTTP endpoint and/or
+appended as JSON lines to a file. They are disabled by default, in which case a
+span is a shared no-op context manager and counters return right away; they are
+enabled by setting METRICS_PORT or METRICS_PATH, or with METRICS.enable().
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from aiohttp import web
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Upper bounds in seconds, from 50us to ~26s
+BUCKETS = tuple(5e-5 * 2**i for i in range(20))
+
+_NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket holding the q quantile.
+        """
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            if total >= rank and total > 0:
+                return bound
+        return 0.0
+
+
+class Span:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_info[0] is not None:
+            self.metrics.increment("errors", span=self.name, **self.labels)
+
+
+def _format_labels(labels, **extra):
+    items = [*labels, *extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+class Metrics:
+    def __init__(self, enabled=False, prefix="tolomei_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.counters = {}
+        self.histograms = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+    def increment(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def span(self, name, **labels):
+        """
+        Return a context manager observing its duration in the name histogram.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, labels)
+
+    def to_prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {self.prefix}{name}_total counter")
+            for (counter_name, labels), value in sorted(self.counters.items()):
+                if counter_name == name:
+                    lines.append(
+                        f"{self.prefix}{name}_total{_format_labels(labels)} {value}"
+                    )
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {self.prefix}{name} histogram")
+            for (histogram_name, labels), histogram in sorted(
+                self.histograms.items(), key=lambda item: item[0]
+            ):
+                if histogram_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(
+                    histogram.buckets + (float("inf"),), histogram.counts
+                ):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:.6g}"
+                    lines.append(
+                        f"{self.prefix}{name}_bucket{_format_labels(labels, le=le)} "
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f"{self.prefix}{name}_sum{_format_labels(labels)} {histogram.sum}"
+                )
+                lines.append(
+                    f"{self.prefix}{name}_count{_format_labels(labels)} "
+                    f"{histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {
+            "timestamp": time.time(),
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ],
+            "histograms": [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p99": histogram.quantile(0.99),
+                }
+                for (name, labels), histogram in self.histograms.items()
+            ],
+        }
+
+    def dump(self, path):
+        path = Path(path)
+        path.parent.mkdir(exist_ok=True, parents=True)
+        with open(path, "a") as file:
+            file.write(json.dumps(self.to_json()) + "\n")
+
+    async def serve(self, port=9100, host="127.0.0.1"):
+        """
+        Serve the metrics in the Prometheus text format on http://host:port/metrics.
+        """
+
+        async def _metrics(request):
+            return web.Response(text=self.to_prometheus())
+
+        app = web.Application()
+        app.router.add_get("/metrics", _metrics)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"ℹ️  Serving metrics on http://{host}:{port}/metrics")
+        return runner
+
+    async def export(self, path, interval=10.0):
+        while True:
+            await asyncio.sleep(interval)
+            self.dump(path)
+
+
+METRICS = Metrics(enabled=bool(os.getenv("METRICS_PORT") or os.getenv("METRICS_PATH")))
@@ -0,0 +1,404 @@
+"""
+Local mirror of the Ekubo pools state, updated from the core contract events.
+
+The mirror applies the PoolInitialized, Swapped and PositionUpdated events of the
+tracked pools block after block, so that prices and pool states are read from
+memory on the hot path instead of being called on the node. It checkpoints the
+last processed block and keeps an undo log of the recent blocks to roll back
+reorganized ones.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+from collections import deque
+from dataclasses import replace
+from pathlib import Path
+
+from starknet_py.hash.selector import get_selector_from_name
+
+from src.utils.constants import BUILD_DIR
+from src.utils.ekubo import EKUBO_CORE_ADDRESS, get_pool_key, get_pool_states
+from src.utils.registry import parse_int
+from src.utils.rpc import get_rpc_transport
+from src.utils.simulator import PoolState
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+POOL_INITIALIZED = get_selector_from_name("PoolInitialized")
+SWAPPED = get_selector_from_name("Swapped")
+POSITION_UPDATED = get_selector_from_name("PositionUpdated")
+
+
+def _to_i129(magnitude, sign):
+    return -magnitude if sign else magnitude
+
+
+def _to_u256(low, high):
+    return low + (high << 128)
+
+
+def _dump_state(state):
+    if state is None:
+        return None
+    return [state.sqrt_ratio, state.tick, state.liquidity, state.fee, state.ticks]
+
+
+def _load_state(values):
+    if values is None:
+        return None
+    sqrt_ratio, tick, liquidity, fee, ticks = values
+    return PoolState(sqrt_ratio, tick, liquidity, fee, [tuple(t) for t in ticks])
+
+
+def _dump_key(pool_key):
+    return ",".join(hex(value) for value in pool_key)
+
+
+def _load_key(key):
+    return tuple(int(value, 16) for value in key.split(","))
+
+
+def dump_pool_states(pools):
+    """
+    Return a JSON serializable version of a {pool key: PoolState} dict.
+    """
+    return {_dump_key(key): _dump_state(state) for key, state in pools.items()}
+
+
+def load_pool_states(payload):
+    return {_load_key(key): _load_state(values) for key, values in payload.items()}
+
+
+class RpcEventSource:
+    """
+    Read the Ekubo core events from a node with starknet_getEvents, following the
+    continuation tokens.
+    """
+
+    def __init__(self, rpc_url=None, address=EKUBO_CORE_ADDRESS, chunk_size=1000):
+        self.rpc_url = rpc_url
+        self.address = address
+        self.chunk_size = chunk_size
+        self.transport = get_rpc_transport(rpc_url)
+
+    async def _rpc(self, method, params):
+        return await self.transport.call(method, params)
+
+    async def get_block_number(self):
+        return await self._rpc("starknet_blockNumber", [])
+
+    async def get_block_hash(self, block_number):
+        block = await self._rpc(
+            "starknet_getBlockWithTxHashes",
+            {"block_id": {"block_number": block_number}},
+        )
+        return parse_int(block["block_hash"])
+
+    async def get_events(self, from_block, to_block):
+        events = []
+        event_filter = {
+            "from_block": {"block_number": from_block},
+            "to_block": {"block_number": to_block},
+            "address": self.address,
+            "keys": [[hex(POOL_INITIALIZED), hex(SWAPPED), hex(POSITION_UPDATED)]],
+            "chunk_size": self.chunk_size,
+        }
+        while True:
+            page = await self._rpc("starknet_getEvents", {"filter": event_filter})
+            events.extend(page["events"])
+            if not page.get("continuation_token"):
+                return events
+            event_filter["continuation_token"] = page["continuation_token"]
+
+    async def close(self):
+        await self.transport.close()
+
+
+class RecordedEventSource:
+    """
+    Replay events recorded as JSON lines, with the starknet_getEvents format.
+
+    The chain head is the last recorded block, unless set with head.
+    """
+
+    def __init__(self, path, head=None):
+        self.events = [
+            json.loads(line) for line in Path(path).read_text().splitlines() if line
+        ]
+        self.block_hashes = {
+            event["block_number"]: parse_int(event["block_hash"])
+            for event in self.events
+        }
+        self.head = head if head is not None else max(self.block_hashes, default=0)
+
+    async def get_block_number(self):
+        return self.head
+
+    async def get_block_hash(self, block_number):
+        # Blocks without events are not recorded, any hash is consistent with them
+        return self.block_hashes.get(block_number, block_number)
+
+    async def get_events(self, from_block, to_block):
+        return [
+            event
+            for event in self.events
+            if from_block <= event["block_number"] <= to_block
+        ]
+
+    async def close(self):
+        pass
+
+
+async def record_events(source, path, from_block, to_block):
+    """
+    Save the events of a source to a JSON lines file usable by RecordedEventSource.
+    """
+    events = await source.get_events(from_block, to_block)
+    Path(path).write_text("".join(json.dumps(event) + "\n" for event in events))
+    return len(events)
+
+
+class PoolMirror:
+    """
+    In-memory pools state kept up to date from an event source.
+
+    Pools are keyed by the tuple of their pool key. A pool must be tracked, i.e. its
+    state loaded once at the mirror block, before its events can be applied; pools
+    initialized after the mirror started are tracked from their PoolInitialized
+    event.
+    """
+
+    def __init__(
+        self,
+        source,
+        path=BUILD_DIR / "pool_mirror.json",
+        reorg_depth=64,
+        batch_size=1000,
+    ):
+        self.source = source
+        self.path = Path(path) if path is not None else None
+        self.batch_size = batch_size
+        self.pools = {}
+        self.block_number = None
+        self.block_hash = None
+        # (block_number, block_hash, {pool key: state before the block or None})
+        self._history = deque(maxlen=reorg_depth)
+        # Serializes sync and track, which both move the pools to a block
+        self._lock = asyncio.Lock()
+        self.load()
+
+    def get_pool_state(self, pool):
+        return self.pools[tuple(get_pool_key(pool))]
+
+    def get_pool_states(self, pools):
+        return [self.get_pool_state(pool) for pool in pools]
+
+    def set_pool_state(self, pool_key, state):
+        self.pools[tuple(pool_key)] = state
+
+    async def track(self, pools, session=None, rpc_url=None):
+        """
+        Load the state of the pools not mirrored yet, at the mirror block.
+
+        Runs under the sync lock: the mirror block cannot move while the states are
+        loaded, otherwise the events of the new pools applied in between would be
+        skipped and lost.
+        """
+        async with self._lock:
+            missing = {}
+            for pool in pools:
+                pool_key = tuple(get_pool_key(pool))
+                if pool_key not in self.pools:
+                    missing.setdefault(pool_key, pool)
+            if not missing:
+                return
+            if self.block_number is None:
+                await self._set_checkpoint(await self.source.get_block_number())
+            logger.info(f"Tracking {len(missing)} pools from block {self.block_number}")
+            states = await get_pool_states(
+                list(missing.values()),
+                session=session,
+                rpc_url=rpc_url,
+                block_id={"block_number": self.block_number},
+            )
+            for pool_key, state in zip(missing, states):
+                self.pools[pool_key] = state
+            self.dump()
+
+    async def _set_checkpoint(self, block_number):
+        self.block_number = block_number
+        self.block_hash = await self.source.get_block_hash(block_number)
+
+    def _save_previous(self, undo, pool_key):
+        if pool_key not in undo:
+            state = self.pools.get(pool_key)
+            undo[pool_key] = (
+                None if state is None else replace(state, ticks=list(state.ticks))
+            )
+
+    def apply(self, event, undo):
+        """
+        Apply an event to the pools, saving their previous state in undo.
+
+        Return whether the event changed a tracked pool.
+        """
+        selector = parse_int(event["keys"][0])
+        data = [parse_int(value) for value in event["data"]]
+        if selector == POOL_INITIALIZED:
+            # pool_key, tick: i129, sqrt_ratio: u256
+            pool_key = tuple(data[0:5])
+            self._save_previous(undo, pool_key)
+            self.pools[pool_key] = PoolState(
+                sqrt_ratio=_to_u256(*data[7:9]),
+                tick=_to_i129(*data[5:7]),
+                liquidity=0,
+                fee=pool_key[2],
+            )
+            return True
+
+        # Swapped and PositionUpdated start with the locker, then the pool_key
+        pool_key = tuple(data[1:6])
+        state = self.pools.get(pool_key)
+        if state is None:
+            return False
+        self._save_previous(undo, pool_key)
+        if selector == SWAPPED:
+            # params: amount i129, is_token1, sqrt_ratio_limit u256, skip_ahead,
+            # delta: amount0 i129, amount1 i129, then the state after the swap
+            state.sqrt_ratio = _to_u256(*data[16:18])
+            state.tick = _to_i129(*data[18:20])
+            state.liquidity = data[20]
+            return True
+        if selector == POSITION_UPDATED:
+            # params: salt, bounds: lower i129, upper i129, liquidity_delta i129
+            lower, upper = _to_i129(*data[7:9]), _to_i129(*data[9:11])
+            liquidity_delta = _to_i129(*data[11:13])
+            self._add_liquidity_net(state, lower, liquidity_delta)
+            self._add_liquidity_net(state, upper, -liquidity_delta)
+            if lower <= state.tick < upper:
+                state.liquidity += liquidity_delta
+            return True
+        return False
+
+    @staticmethod
+    def _add_liquidity_net(state, tick, liquidity_delta):
+        index = bisect.bisect_left(state.ticks, (tick,))
+        if index < len(state.ticks) and state.ticks[index][0] == tick:
+            liquidity_net = state.ticks[index][1] + liquidity_delta
+            if liquidity_net == 0:
+                del state.ticks[index]
+            else:
+                state.ticks[index] = (tick, liquidity_net)
+        elif liquidity_delta != 0:
+            state.ticks.insert(index, (tick, liquidity_delta))
+
+    def _rollback(self, block_number):
+        """
+        Undo all the blocks after block_number.
+        """
+        while self._history and self._history[-1][0] > block_number:
+            _, _, undo = self._history.pop()
+            for pool_key, state in undo.items():
+                if state is None:
+                    self.pools.pop(pool_key, None)
+                else:
+                    self.pools[pool_key] = state
+
+    async def _handle_reorg(self):
+        """
+        Roll back to the last block of the history still in the chain.
+
+        Return whether a reorg happened.
+        """
+        if self.block_hash == await self.source.get_block_hash(self.block_number):
+            return False
+        for block_number, block_hash, _ in reversed(self._history):
+            if block_hash == await self.source.get_block_hash(block_number):
+                logger.warning(f"⚠️  Reorg detected, rolling back to {block_number}")
+                self._rollback(block_number)
+                self.block_number, self.block_hash = block_number, block_hash
+                return True
+        raise RuntimeError(
+            f"Reorg deeper than the {self._history.maxlen} blocks history, "
+            "the mirror needs to be reset"
+        )
+
+    async def sync(self):
+        """
+        Apply the events from the checkpoint up to the chain head.
+
+        Return the number of applied events.
+        """
+        async with self._lock:
+            head = await self.source.get_block_number()
+            if self.block_number is None:
+                await self._set_checkpoint(head)
+                self.dump()
+                return 0
+            await self._handle_reorg()
+
+            applied = 0
+            while self.block_number < head:
+                to_block = min(self.block_number + self.batch_size, head)
+                events = await self.source.get_events(self.block_number + 1, to_block)
+                for event in events:
+                    block_number = event["block_number"]
+                    if not self._history or self._history[-1][0] != block_number:
+                        self._history.append(
+                            (block_number, parse_int(event["block_hash"]), {})
+                        )
+                    applied += self.apply(event, self._history[-1][2])
+                await self._set_checkpoint(to_block)
+                if not self._history or self._history[-1][0] != to_block:
+                    self._history.append((to_block, self.block_hash, {}))
+            self.dump()
+            return applied
+
+    async def follow(self, interval=2.0):
+        while True:
+            try:
+                applied = await self.sync()
+                if applied:
+                    logger.info(
+                        f"ℹ️  Mirror at block {self.block_number}: {applied} events"
+                    )
+            except Exception as err:
+                logger.error(f"❌ Mirror sync failed: {err}")
+            await asyncio.sleep(interval)
+
+    def load(self):
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            checkpoint = json.loads(self.path.read_text())
+        except (json.JSONDecodeError, OSError) as err:
+            logger.warning(f"⚠️  Ignoring mirror checkpoint {self.path}: {err}")
+            return
+        self.block_number = checkpoint["block_number"]
+        self.block_hash = checkpoint["block_hash"]
+        self.pools = load_pool_states(checkpoint["pools"])
+        self._history.extend(
+            (block_number, block_hash, load_pool_states(undo))
+            for block_number, block_hash, undo in checkpoint["history"]
+        )
+
+    def dump(self):
+        if self.path is None:
+            return
+        checkpoint = {
+            "block_number": self.block_number,
+            "block_hash": self.block_hash,
+            "pools": dump_pool_states(self.pools),
+            "history": [
+                [block_number, block_hash, dump_pool_states(undo)]
+                for block_number, block_hash, undo in self._history
+            ],
+        }
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(checkpoint))
+        os.replace(tmp_path, self.path)
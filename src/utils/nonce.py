@@ -0,0 +1,125 @@
+import asyncio
+import logging
+
+from starknet_py.net.client_models import TransactionStatus
+
+from src.utils.starknet import (
+    get_starknet_account,
+    invoke_address,
+    invoke_contract,
+    wait_for_transaction,
+)
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_nonce_managers = {}
+
+
+class NonceManager:
+    """
+    Allocate the nonces of an account locally so that many transactions can be in
+    flight at once.
+
+    Nonces are read from the node only on the first reservation and after a failure:
+    a transaction that could not be sent or was rejected leaves a gap, so the next
+    nonce is resynced from the pending block.
+    """
+
+    def __init__(self, account):
+        self.account = account
+        self._next_nonce = None
+        self._pending = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def pending(self):
+        """
+        Return the in-flight transactions as a {nonce: transaction_hash} dict, with
+        None for nonces reserved but not sent yet.
+        """
+        return dict(self._pending)
+
+    async def resync(self):
+        async with self._lock:
+            await self._resync()
+
+    async def _resync(self):
+        nonce = await self.account.get_nonce(block_number="pending")
+        if nonce != self._next_nonce:
+            logger.info(f"ℹ️  Nonce of {hex(self.account.address)} resynced to {nonce}")
+        self._next_nonce = nonce
+        self._pending = {
+            pending_nonce: tx_hash
+            for pending_nonce, tx_hash in self._pending.items()
+            if pending_nonce >= nonce
+        }
+
+    async def peek(self):
+        """
+        Return the next nonce without reserving it, e.g. to sign a transaction ahead
+        of time.
+        """
+        async with self._lock:
+            if self._next_nonce is None:
+                await self._resync()
+            return self._next_nonce
+
+    async def reserve(self):
+        async with self._lock:
+            if self._next_nonce is None:
+                await self._resync()
+            nonce = self._next_nonce
+            self._next_nonce += 1
+            self._pending[nonce] = None
+            return nonce
+
+    async def submit(self, send):
+        """
+        Send a transaction with the next nonce without waiting for it.
+
+        send is a coroutine function taking the nonce and returning the sent transaction
+        response. Return the transaction hash and a task resolving to its final status.
+        """
+        nonce = await self.reserve()
+        try:
+            response = await send(nonce)
+        except Exception:
+            self._pending.pop(nonce, None)
+            await self.resync()
+            raise
+        self._pending[nonce] = response.transaction_hash
+        return response.transaction_hash, asyncio.ensure_future(
+            self._track(nonce, response.transaction_hash)
+        )
+
+    async def _track(self, nonce, transaction_hash):
+        status = await wait_for_transaction(transaction_hash)
+        self._pending.pop(nonce, None)
+        if status != TransactionStatus.ACCEPTED_ON_L2:
+            logger.error(
+                f"❌ Tx {hex(transaction_hash)} with nonce {nonce} ended with status {status}"
+            )
+            await self.resync()
+        return status
+
+
+def get_nonce_manager(account):
+    if account.address not in _nonce_managers:
+        _nonce_managers[account.address] = NonceManager(account)
+    return _nonce_managers[account.address]
+
+
+async def submit_invoke(contract, *args, account=None, **kwargs):
+    """
+    Pipelined version of invoke: the transaction is sent with a locally allocated
+    nonce and the receipt is tracked in the background.
+
+    Return the transaction hash and a task resolving to its final status.
+    """
+    account = account or (await get_starknet_account())
+    send = invoke_address if isinstance(contract, int) else invoke_contract
+    return await get_nonce_manager(account).submit(
+        lambda nonce: send(contract, *args, account=account, nonce=nonce, **kwargs)
+    )
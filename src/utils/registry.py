@@ -0,0 +1,251 @@
+"""
+Compact registries of tokens and pools.
+
+Tokens are interned once as small integer ids and pools are stored as a
+struct-of-arrays indexed by pool id, so that the hot path works on ids and arrays
+instead of parsing hex strings and allocating dicts for each route.
+"""
+import numpy as np
+
+
+def parse_int(value):
+    """
+    Return the int of a value given as an int or a hex string.
+    """
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+class TokenRegistry:
+    """
+    Intern token addresses as consecutive ids, in the order they are added.
+    """
+
+    def __init__(self, tokens=None):
+        self.addresses = []
+        self.names = []
+        self._ids = {}
+        self._ids_by_str = {}
+        self._ids_by_name = {}
+        # Sorted by name, so that ids are the indexes of the prices matrix
+        for address, name in sorted((tokens or {}).items(), key=lambda item: item[1]):
+            self.intern(address, name)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def intern(self, address, name=None):
+        address = parse_int(address)
+        token_id = self._ids.get(address)
+        if token_id is None:
+            token_id = len(self.addresses)
+            self._ids[address] = token_id
+            self.addresses.append(address)
+            self.names.append(name or hex(address))
+            self._ids_by_name[self.names[-1]] = token_id
+            self._ids_by_str.clear()
+        elif name and self.names[token_id] == hex(address):
+            # Tokens first seen in a pool are named once known
+            del self._ids_by_name[self.names[token_id]]
+            self.names[token_id] = name
+            self._ids_by_name[name] = token_id
+        return token_id
+
+    def find(self, address):
+        """
+        Return the id of a token address, given as an int or a hex string, or None.
+
+        Hex strings are only parsed the first time they are seen.
+        """
+        if not isinstance(address, str):
+            return self._ids.get(int(address))
+        try:
+            return self._ids_by_str[address]
+        except KeyError:
+            token_id = self._ids_by_str[address] = self._ids.get(int(address, 16))
+            return token_id
+
+    def get_id(self, address):
+        token_id = self.find(address)
+        return self.intern(address) if token_id is None else token_id
+
+    def get_name(self, address):
+        return self.names[self.get_id(address)]
+
+    def get_ids(self, names):
+        return [self._ids_by_name[name] for name in names]
+
+
+class PoolView:
+    """
+    A pool of the registry used from one of its tokens.
+
+    It exposes the same keys as the records of ekubo.get_pools, with int values.
+    """
+
+    __slots__ = ("registry", "pool_id", "from_id")
+
+    def __init__(self, registry, pool_id, from_id):
+        self.registry = registry
+        self.pool_id = pool_id
+        self.from_id = from_id
+
+    def __repr__(self):
+        return f"PoolView({self.pool_id}, {self.from_id})"
+
+    def __getitem__(self, key):
+        if key not in PoolRegistry.RECORD_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    @property
+    def pool_key(self):
+        return self.registry.pool_keys[self.pool_id]
+
+    @property
+    def to_id(self):
+        registry, pool_id = self.registry, self.pool_id
+        token0 = registry.token0[pool_id]
+        return registry.token1[pool_id] if self.from_id == token0 else token0
+
+    @property
+    def token_from(self):
+        return self.registry.tokens.addresses[self.from_id]
+
+    @property
+    def token_to(self):
+        return self.registry.tokens.addresses[self.to_id]
+
+    @property
+    def fee(self):
+        return self.pool_key[2]
+
+    @property
+    def tick_spacing(self):
+        return self.pool_key[3]
+
+    @property
+    def extension(self):
+        return self.pool_key[4]
+
+    @property
+    def is_token1(self):
+        return self.from_id == self.registry.token1[self.pool_id]
+
+
+class PoolRegistry:
+    """
+    Struct-of-arrays store of the pools, indexed by pool id.
+
+    token0 and token1 are token ids; fee, extension and sqrt_ratio may not fit in 64
+    bits and are object arrays of Python ints. The pool keys and swap params are
+    built once per pool and shared.
+    """
+
+    RECORD_KEYS = ("token_from", "token_to", "fee", "tick_spacing", "extension")
+
+    def __init__(self, tokens, capacity=64):
+        self.tokens = tokens
+        self.size = 0
+        self.token0 = np.zeros(capacity, dtype=np.int32)
+        self.token1 = np.zeros(capacity, dtype=np.int32)
+        self.fee = np.zeros(capacity, dtype=object)
+        self.fee_ratio = np.zeros(capacity)
+        self.tick_spacing = np.zeros(capacity, dtype=np.int64)
+        self.extension = np.zeros(capacity, dtype=object)
+        self.sqrt_ratio = np.zeros(capacity, dtype=object)
+        self.pool_keys = []
+        self._ids = {}
+        self._swap_params = {}
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self):
+        for name in [
+            "token0",
+            "token1",
+            "fee",
+            "fee_ratio",
+            "tick_spacing",
+            "extension",
+            "sqrt_ratio",
+        ]:
+            array = getattr(self, name)
+            grown = np.zeros(2 * len(array), dtype=array.dtype)
+            grown[: len(array)] = array
+            setattr(self, name, grown)
+
+    def add(self, token_from, token_to, fee, tick_spacing, extension):
+        """
+        Return the id of a pool, registering it the first time.
+
+        Values are taken as returned by the API, and only parsed for new pools.
+        """
+        raw_key = (token_from, token_to, fee, tick_spacing, extension)
+        pool_id = self._ids.get(raw_key)
+        if pool_id is not None:
+            return pool_id
+
+        address_from, address_to = parse_int(token_from), parse_int(token_to)
+        pool_key = (
+            min(address_from, address_to),
+            max(address_from, address_to),
+            int(fee),
+            int(tick_spacing),
+            int(extension),
+        )
+        pool_id = self._ids.get(pool_key)
+        if pool_id is None:
+            if self.size == len(self.token0):
+                self._grow()
+            pool_id = self.size
+            self.token0[pool_id] = self.tokens.get_id(pool_key[0])
+            self.token1[pool_id] = self.tokens.get_id(pool_key[1])
+            self.fee[pool_id] = pool_key[2]
+            self.fee_ratio[pool_id] = pool_key[2] / 2**128
+            self.tick_spacing[pool_id] = pool_key[3]
+            self.extension[pool_id] = pool_key[4]
+            self.pool_keys.append(list(pool_key))
+            self._ids[pool_key] = pool_id
+            self.size += 1
+        self._ids[raw_key] = pool_id
+        return pool_id
+
+    def view(self, pool_id, from_id):
+        return PoolView(self, pool_id, from_id)
+
+    def set_sqrt_ratios(self, pool_ids, sqrt_ratios):
+        for pool_id, sqrt_ratio in zip(pool_ids, sqrt_ratios):
+            self.sqrt_ratio[pool_id] = sqrt_ratio
+
+    def get_prices(self, pool_ids, from_ids):
+        """
+        Return the prices of token_to in token_from of the pools from their last
+        known sqrt ratio.
+        """
+        pool_ids = np.asarray(pool_ids, dtype=np.intp)
+        sqrt_ratios = self.sqrt_ratio[pool_ids].astype(float) / 2**128
+        prices = sqrt_ratios * sqrt_ratios
+        return np.where(self.token0[pool_ids] == from_ids, prices, 1 / prices)
+
+    def get_swap_params(self, pool_id, from_id):
+        """
+        Return the swap params of a hop as expected by flashloan_swap.
+        """
+        swap_params = self._swap_params.get((pool_id, from_id))
+        if swap_params is None:
+            token0, token1, fee, tick_spacing, extension = self.pool_keys[pool_id]
+            swap_params = self._swap_params[(pool_id, from_id)] = {
+                "token_from": self.tokens.addresses[from_id],
+                "token_to": token1
+                if self.tokens.addresses[from_id] == token0
+                else token0,
+                "pool_key": {
+                    "token0": token0,
+                    "token1": token1,
+                    "fee": fee,
+                    "extension": extension,
+                    "tick_spacing": tick_spacing,
+                },
+            }
+        return swap_params
@@ -0,0 +1,253 @@
+"""
+Shared JSON-RPC transport for the raw Starknet RPC calls.
+
+All the calls made to the same set of nodes go through one transport, which:
+- keeps a pool of keep-alive connections per event loop;
+- coalesces the calls made during the same event loop tick into a single JSON-RPC
+  batch request;
+- retries failed requests with exponential backoff;
+- sends each request to the node with the lowest recent latency, so that a slow or
+  failing node is skipped in favor of the next one.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import weakref
+
+import aiohttp
+
+from src.utils import constants
+from src.utils.metrics import METRICS
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RpcError(RuntimeError):
+    """
+    Error returned by the node for a call.
+    """
+
+    def __init__(self, method, error):
+        self.method = method
+        self.code = error.get("code")
+        self.message = error.get("message")
+        super().__init__(f"{method} failed: {json.dumps(error)}")
+
+
+class RpcUnavailableError(ConnectionError):
+    """
+    No node could be reached after all the retries.
+    """
+
+
+class JsonRpcTransport:
+    def __init__(
+        self,
+        urls,
+        concurrency=32,
+        timeout=30,
+        retries=3,
+        backoff=0.1,
+        max_batch_size=100,
+        latency_decay=0.2,
+    ):
+        self.urls = [url for url in urls if url]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_batch_size = max_batch_size
+        self.latency_decay = latency_decay
+        # Moving average of the latency of each node, with failures counting as a
+        # full timeout
+        self.latencies = {url: 0.0 for url in self.urls}
+        self._sessions = weakref.WeakKeyDictionary()
+        self._pending = weakref.WeakKeyDictionary()
+        self._tasks = set()
+        self._sync_session = None
+        self._ids = itertools.count()
+
+    def get_urls(self):
+        """
+        Return the node urls sorted by increasing recent latency.
+        """
+        return sorted(self.urls, key=self.latencies.__getitem__)
+
+    def _record_latency(self, url, latency):
+        self.latencies[url] += self.latency_decay * (latency - self.latencies[url])
+
+    def get_session(self):
+        """
+        Return the keep-alive HTTP session of the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.concurrency, keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                raise_for_status=True,
+            )
+            self._sessions[loop] = session
+        return session
+
+    async def close(self):
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+        if self._sync_session is not None:
+            self._sync_session.close()
+            self._sync_session = None
+
+    async def call(self, method, params=None):
+        """
+        Return the result of a call, sent with the other calls of the same tick.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(loop, [])
+        pending.append((method, [] if params is None else params, future))
+        if len(pending) == 1:
+            loop.call_soon(self._flush, loop)
+        return await future
+
+    async def batch(self, calls, return_exceptions=False):
+        """
+        Return the results of many (method, params) calls, sent as one batch.
+        """
+        return await asyncio.gather(
+            *[self.call(method, params) for method, params in calls],
+            return_exceptions=return_exceptions,
+        )
+
+    def _flush(self, loop):
+        pending = self._pending.pop(loop, [])
+        for i in range(0, len(pending), self.max_batch_size):
+            task = loop.create_task(self._send(pending[i : i + self.max_batch_size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, calls):
+        requests = [
+            {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params,
+                "id": next(self._ids),
+            }
+            for method, params, _ in calls
+        ]
+        start = time.perf_counter()
+        try:
+            payload = await self._post(requests[0] if len(requests) == 1 else requests)
+        except Exception as err:
+            for _, _, future in calls:
+                if not future.done():
+                    future.set_exception(err)
+            return
+
+        if isinstance(payload, list):
+            responses = {response.get("id"): response for response in payload}
+        else:
+            # A single request gets a single response, whatever its id
+            responses = {request["id"]: payload for request in requests}
+        duration = time.perf_counter() - start
+        for request, (method, _, future) in zip(requests, calls):
+            METRICS.observe("rpc_seconds", duration, method=method)
+            if future.done():
+                continue
+            response = responses.get(request["id"], {})
+            if "result" in response:
+                future.set_result(response["result"])
+            else:
+                METRICS.increment("rpc_errors", method=method)
+                future.set_exception(
+                    RpcError(method, response.get("error", {"message": "no response"}))
+                )
+
+    async def _post(self, body):
+        if not self.urls:
+            raise RpcUnavailableError("No RPC url configured")
+        for attempt in range(self.retries + 1):
+            url = self.get_urls()[0]
+            start = time.perf_counter()
+            try:
+                async with self.get_session().post(url, json=body) as response:
+                    payload = await response.json(content_type=None)
+                self._record_latency(url, time.perf_counter() - start)
+                return payload
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                self._record_latency(url, self.timeout)
+                if attempt == self.retries:
+                    raise RpcUnavailableError(f"{url} failed: {err}") from err
+                delay = self.backoff * 2**attempt
+                logger.warning(f"⚠️  {url} failed ({err}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    def call_sync(self, method, params=None, retries=None, timeout=None):
+        """
+        Blocking version of call, for the code running outside of an event loop.
+        """
+        import requests
+
+        if not self.urls:
+            raise RpcUnavailableError("No RPC url configured")
+        if self._sync_session is None:
+            self._sync_session = requests.Session()
+        body = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": [] if params is None else params,
+            "id": next(self._ids),
+        }
+        retries = self.retries if retries is None else retries
+        for attempt in range(retries + 1):
+            url = self.get_urls()[0]
+            start = time.perf_counter()
+            try:
+                response = self._sync_session.post(
+                    url, json=body, timeout=timeout or self.timeout
+                )
+                response.raise_for_status()
+                payload = response.json()
+                break
+            except (requests.RequestException, ValueError) as err:
+                self._record_latency(url, self.timeout)
+                if attempt == retries:
+                    raise RpcUnavailableError(f"{url} failed: {err}") from err
+                time.sleep(self.backoff * 2**attempt)
+        self._record_latency(url, time.perf_counter() - start)
+        METRICS.observe("rpc_seconds", time.perf_counter() - start, method=method)
+        if "result" not in payload:
+            raise RpcError(method, payload.get("error", {"message": "no result"}))
+        return payload["result"]
+
+
+_transports = {}
+
+
+def get_rpc_transport(urls=None):
+    """
+    Return the shared transport of a node url or list of urls.
+
+    By default, the nodes are the RPC url of the network followed by the
+    comma-separated RPC_FALLBACK_URLS.
+    """
+    if urls is None:
+        urls = [
+            constants.NETWORK["rpc_url"],
+            *os.getenv("RPC_FALLBACK_URLS", "").split(","),
+        ]
+    elif isinstance(urls, str):
+        urls = [urls]
+    key = tuple(url for url in urls if url)
+    if key not in _transports:
+        _transports[key] = JsonRpcTransport(key)
+    return _transports[key]
@@ -0,0 +1,379 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.utils.arbitrage import ArbitrageIndex, TokenGraph
+from src.utils.constants import BUILD_DIR
+from src.utils.ekubo import (
+    FlashswapTemplates,
+    discover_tokens,
+    get_eth_balance,
+    get_pair_prices,
+    get_pool_states,
+    get_pools,
+    get_prices,
+    get_route_directions,
+    get_route_pools,
+    get_session,
+    get_swap_params,
+    register_tokens,
+    select_pools,
+)
+from src.utils.metrics import METRICS
+from src.utils.mirror import PoolMirror, RpcEventSource
+from src.utils.simulator import find_optimal_amount
+from src.utils.snapshots import SnapshotStore
+from src.utils.starknet import get_starknet_account
+from src.utils.validator import validate
+
+load_dotenv()
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class Scanner:
+    """
+    Long running arbitrage pipeline.
+
+    Three stages run concurrently:
+    - ingestion fetches the prices matrix on a fixed tick and publishes it only when it
+      changed; a slow consumer never delays it since only the latest matrix is kept;
+    - detection re-scores the cycles of the pairs that moved on each new matrix,
+      prices the pools of the top_k routes and sizes their trades, simulates them
+      on chain when simulate is set and pushes the best one to a bounded queue,
+      dropping the oldest candidate when full;
+    - execution broadcasts the flashloan_swap transaction of each fresh candidate,
+      pre-signed during detection from a pre-serialized template of its route.
+
+    When a PoolMirror is given, it follows the Ekubo events alongside and the pools
+    prices and states are read from it. When a SnapshotStore is given, each new
+    prices matrix is appended to it, with the mirrored pool states if any, for
+    backtesting.
+
+    The tokens default to the known ones. When pairs are given, e.g. the liquid pairs
+    of discover_tokens, only these pairs are priced, into a sparse TokenGraph, for
+    universes of tokens too large for the prices matrix and the exhaustive
+    ArbitrageIndex.
+
+    Stage latencies and counters are served in the Prometheus format on METRICS_PORT
+    and/or appended as JSON lines to METRICS_PATH when these are set.
+    """
+
+    def __init__(
+        self,
+        account,
+        tick=6.0,
+        queue_size=4,
+        min_profit=1.0,
+        report_every=10,
+        mirror=None,
+        snapshots=None,
+        top_k=3,
+        simulate=True,
+        tokens=None,
+        pairs=None,
+    ):
+        self.account = account
+        self.tokens = tokens
+        self.pairs = pairs
+        self.templates = FlashswapTemplates(account)
+        self.top_k = top_k
+        self.simulate = simulate
+        self.mirror = mirror
+        self.snapshots = snapshots
+        self.tick = tick
+        self.min_profit = min_profit
+        self.report_every = report_every
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.latencies = defaultdict(lambda: deque(maxlen=1000))
+        self.dropped = 0
+        self.ticks = 0
+        self._prices = None
+        self._prices_at = None
+        self._prices_updated = asyncio.Event()
+        self._last_route_prices = {}
+        self._index = None
+        self._session = None
+
+    @contextmanager
+    def timed(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.latencies[stage].append(duration)
+            METRICS.observe("stage_seconds", duration, stage=stage)
+
+    def report(self):
+        for stage, latencies in self.latencies.items():
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+            logger.info(
+                f"ℹ️  {stage}: p50={p50:.1f}ms p99={p99:.1f}ms over {len(latencies)} runs"
+            )
+        logger.info(f"ℹ️  Queue: {self.queue.qsize()} pending, {self.dropped} dropped")
+
+    async def ingest(self):
+        while True:
+            start = time.perf_counter()
+            try:
+                with self.timed("prices"):
+                    if self.pairs is None:
+                        prices = await get_prices(
+                            tokens=self.tokens, session=self._session
+                        )
+                    else:
+                        prices = await get_pair_prices(
+                            self.pairs, tokens=self.tokens, session=self._session
+                        )
+                if self._prices is None or not prices.equals(self._prices):
+                    self._prices = prices
+                    self._prices_at = time.perf_counter()
+                    self._prices_updated.set()
+                    METRICS.increment("price_updates")
+                    if self.snapshots is not None:
+                        self.record(prices)
+            except Exception as err:
+                logger.error(f"❌ Cannot fetch prices: {err}")
+            self.ticks += 1
+            if self.ticks % self.report_every == 0:
+                self.report()
+            await asyncio.sleep(max(0, self.tick - (time.perf_counter() - start)))
+
+    def record(self, prices):
+        if isinstance(prices, TokenGraph):
+            # The backtests replay prices matrices
+            prices = prices.to_prices()
+        if self.mirror is None:
+            self.snapshots.append(prices)
+        else:
+            self.snapshots.append(
+                prices,
+                block=self.mirror.block_number or -1,
+                pool_states=self.mirror.pools,
+            )
+
+    async def detect(self):
+        while True:
+            await self._prices_updated.wait()
+            self._prices_updated.clear()
+            prices, prices_at = self._prices, self._prices_at
+            try:
+                with self.timed("search"):
+                    routes = [
+                        route
+                        for route, profit, _ in self.search(prices, self.top_k)
+                        if profit >= self.min_profit
+                    ]
+            except Exception as err:
+                logger.error(f"❌ Detection failed: {err}")
+                continue
+            if not routes:
+                continue
+            candidates = [
+                candidate
+                for candidate in await asyncio.gather(
+                    *[self.size(route, prices_at) for route in routes]
+                )
+                if candidate is not None
+            ]
+            if not candidates:
+                continue
+            if not self.simulate:
+                self.submit(candidates[0])
+                continue
+            try:
+                with self.timed("simulation"):
+                    max_fee = await get_eth_balance(self.account.address)
+                    # Sign the transactions while they are simulated, to broadcast
+                    # the best one right away
+                    best, *transactions = await asyncio.gather(
+                        validate(
+                            self.account, candidates, max_fee, prices, self.templates
+                        ),
+                        *[
+                            self.templates.sign(
+                                candidate["swap_params"],
+                                candidate["amount_from"],
+                                max_fee,
+                            )
+                            for candidate in candidates
+                        ],
+                    )
+            except Exception as err:
+                logger.error(f"❌ Simulation failed: {err}")
+                continue
+            if best is None:
+                logger.info(f"ℹ️  No route of {len(candidates)} profitable on chain")
+                continue
+            routes = [candidate["route"] for candidate in candidates]
+            self.submit(
+                {
+                    **best,
+                    "max_fee": max_fee,
+                    "transaction": transactions[routes.index(best["route"])],
+                }
+            )
+
+    async def size(self, route, prices_at):
+        """
+        Return the candidate trade of a route, or None if it is not profitable on its
+        pools or if it did not change since the previous prices.
+        """
+        try:
+            with self.timed("pools"):
+                pools = await get_pools(route, session=self._session)
+            with self.timed("pool_prices"):
+                selected_pools = await select_pools(
+                    route, pools, session=self._session, mirror=self.mirror
+                )
+        except Exception as err:
+            logger.error(f"❌ Detection failed: {err}")
+            return None
+
+        route_prices = tuple(selected_pools.price)
+        if self._last_route_prices.get(tuple(route)) == route_prices:
+            return None
+        self._last_route_prices[tuple(route)] = route_prices
+        if selected_pools.net_price.prod() < self.min_profit:
+            logger.info(f"ℹ️  Route {route} is not profitable on pools")
+            return None
+        route_pools = get_route_pools(selected_pools)
+        try:
+            with self.timed("sizing"):
+                if self.mirror is None:
+                    pool_states = await get_pool_states(
+                        route_pools, session=self._session
+                    )
+                else:
+                    pool_states = self.mirror.get_pool_states(route_pools)
+                amount_from, expected_profit = find_optimal_amount(
+                    pool_states, get_route_directions(route_pools)
+                )
+        except Exception as err:
+            logger.error(f"❌ Sizing failed: {err}")
+            return None
+        if amount_from == 0:
+            logger.info(f"ℹ️  Route {route} is not profitable after slippage")
+            return None
+        return {
+            "created_at": time.perf_counter(),
+            "prices_at": prices_at,
+            "route": route,
+            "swap_params": get_swap_params(selected_pools),
+            "amount_from": amount_from,
+            "expected_profit": expected_profit,
+        }
+
+    def search(self, prices, top=1):
+        """
+        Return the top cycles, only re-scoring the cycles of the pairs whose price
+        changed since the previous matrix, or searching the sparse graph of the pairs
+        if any.
+        """
+        if isinstance(prices, TokenGraph):
+            return prices.find_arbitrages(top)
+        if self._index is None or self._index.names != list(prices.columns):
+            self._index = ArbitrageIndex(prices)
+        else:
+            values = prices.to_numpy()
+            for origin, destination in np.argwhere(values != self._index.values):
+                self._index.update(
+                    self._index.names[origin],
+                    self._index.names[destination],
+                    values[origin, destination],
+                )
+        return self._index.top(top)
+
+    def submit(self, candidate):
+        METRICS.increment("opportunities")
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            METRICS.increment("dropped_candidates")
+        self.queue.put_nowait(candidate)
+
+    async def execute(self):
+        while True:
+            candidate = await self.queue.get()
+            if time.perf_counter() - candidate["created_at"] > self.tick:
+                logger.info(f"ℹ️  Skipping stale route {candidate['route']}")
+                METRICS.increment("stale_candidates")
+                continue
+            try:
+                with self.timed("execution"):
+                    # The pre-signed transaction is signed again if sent ones made
+                    # its nonce stale
+                    transaction_hash = await self.templates.send(
+                        candidate["swap_params"],
+                        candidate["amount_from"],
+                        candidate.get("max_fee")
+                        or await get_eth_balance(self.account.address),
+                        candidate.get("transaction"),
+                    )
+                submitted_at = time.perf_counter()
+                self.latencies["detection_to_submission"].append(
+                    submitted_at - candidate["created_at"]
+                )
+                # From the prices showing the opportunity to the transaction sent
+                METRICS.observe(
+                    "opportunity_to_submission_seconds",
+                    submitted_at - candidate["prices_at"],
+                )
+                METRICS.increment("submissions")
+                logger.info(
+                    f"✅ Route {candidate['route']} sent in tx {hex(transaction_hash)}"
+                )
+            except Exception as err:
+                logger.error(f"❌ Route {candidate['route']} failed: {err}")
+                METRICS.increment("failed_submissions")
+
+    async def run(self):
+        await self.templates.prepare()
+        async with get_session() as session:
+            self._session = session
+            stages = [self.ingest(), self.detect(), self.execute()]
+            if self.mirror is not None:
+                stages.append(self.mirror.follow())
+            if os.getenv("METRICS_PATH"):
+                stages.append(METRICS.export(os.environ["METRICS_PATH"]))
+            metrics_runner = None
+            if os.getenv("METRICS_PORT"):
+                metrics_runner = await METRICS.serve(int(os.environ["METRICS_PORT"]))
+            try:
+                await asyncio.gather(*stages)
+            finally:
+                if metrics_runner is not None:
+                    await metrics_runner.cleanup()
+
+
+async def main():
+    account = await get_starknet_account()
+    tokens, pairs = None, None
+    if os.getenv("MIN_LIQUIDITY"):
+        tokens, pairs = await discover_tokens(float(os.environ["MIN_LIQUIDITY"]))
+        register_tokens(tokens)
+        logger.info(f"ℹ️  Found {len(tokens)} tokens and {len(pairs)} liquid pairs")
+    mirror = PoolMirror(RpcEventSource())
+    try:
+        await Scanner(
+            account,
+            mirror=mirror,
+            snapshots=SnapshotStore(BUILD_DIR / "snapshots"),
+            tokens=tokens,
+            pairs=pairs,
+        ).run()
+    finally:
+        await mirror.source.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
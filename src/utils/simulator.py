@@ -0,0 +1,278 @@
+"""
+Off-chain simulation of Ekubo swaps.
+
+Amounts, liquidities and sqrt ratios are integers with the same fixed point
+representation as Ekubo core: sqrt ratios are 128.128 fixed point numbers of
+sqrt(token1 / token0) and fees are fractions of 2**128.
+"""
+import bisect
+import functools
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal, localcontext
+from typing import List, Tuple
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ONE = 2**128
+MIN_TICK = -88722883
+MAX_TICK = 88722883
+GOLDEN_RATIO = (5**0.5 - 1) / 2
+
+
+@dataclass
+class PoolState:
+    sqrt_ratio: int
+    tick: int
+    liquidity: int
+    fee: int
+    # Sorted (tick, liquidity_net) of the initialized ticks around the current one
+    ticks: List[Tuple[int, int]] = field(default_factory=list)
+
+
+def _div_round_up(numerator, denominator):
+    return -(-numerator // denominator)
+
+
+def _get_tick_factors(sign):
+    # sqrt(1.000001) ** (sign * 2**bit) with 256 fractional bits, for each bit of
+    # the ticks
+    with localcontext() as context:
+        context.prec = 100
+        return [
+            int(Decimal("1.000001") ** (Decimal(sign * 2**bit) / 2) * 2**256)
+            for bit in range(MAX_TICK.bit_length())
+        ]
+
+
+TICK_FACTORS = {1: _get_tick_factors(1), -1: _get_tick_factors(-1)}
+
+
+@functools.lru_cache(maxsize=4096)
+def tick_to_sqrt_ratio(tick):
+    factors = TICK_FACTORS[1 if tick >= 0 else -1]
+    ratio = 1 << 256
+    for bit, factor in enumerate(factors):
+        if abs(tick) >> bit & 1:
+            ratio = ratio * factor >> 256
+    return ratio >> 128
+
+
+def _swap_step(sqrt_ratio, target, liquidity, amount, fee, is_token1):
+    """
+    Swap at most amount (fee included) within [sqrt_ratio, target] at constant
+    liquidity.
+
+    Return the consumed input, the output and the new sqrt ratio.
+    """
+    amount_after_fee = amount - _div_round_up(amount * fee, ONE)
+    if is_token1:
+        # token1 in, price goes up
+        next_sqrt_ratio = sqrt_ratio + amount_after_fee * ONE // liquidity
+        if next_sqrt_ratio < target:
+            output = liquidity * (next_sqrt_ratio - sqrt_ratio) * ONE
+            output //= sqrt_ratio * next_sqrt_ratio
+            return amount, output, next_sqrt_ratio
+        needed = _div_round_up(liquidity * (target - sqrt_ratio), ONE)
+        output = liquidity * (target - sqrt_ratio) * ONE // (sqrt_ratio * target)
+    else:
+        # token0 in, price goes down
+        next_sqrt_ratio = _div_round_up(
+            liquidity * sqrt_ratio * ONE,
+            liquidity * ONE + amount_after_fee * sqrt_ratio,
+        )
+        if next_sqrt_ratio > target:
+            output = liquidity * (sqrt_ratio - next_sqrt_ratio) // ONE
+            return amount, output, next_sqrt_ratio
+        needed = _div_round_up(
+            liquidity * (sqrt_ratio - target) * ONE, sqrt_ratio * target
+        )
+        output = liquidity * (sqrt_ratio - target) // ONE
+    consumed = min(_div_round_up(needed * ONE, ONE - fee), amount)
+    return consumed, output, target
+
+
+def simulate_swap(pool, amount, is_token1):
+    """
+    Return the output of swapping exactly amount of token1 (if is_token1) or token0
+    into the pool, crossing the initialized ticks on the way.
+
+    The swap stops at the last known tick if the input is not fully consumed: the
+    output is then a lower bound.
+    """
+    sqrt_ratio, liquidity, remaining, output = (
+        pool.sqrt_ratio,
+        pool.liquidity,
+        amount,
+        0,
+    )
+    ticks = [tick for tick, _ in pool.ticks]
+    if is_token1:
+        index = bisect.bisect_right(ticks, pool.tick)
+    else:
+        index = bisect.bisect_right(ticks, pool.tick) - 1
+
+    while remaining > 0:
+        if 0 <= index < len(ticks):
+            target = tick_to_sqrt_ratio(ticks[index])
+        else:
+            target = tick_to_sqrt_ratio(MAX_TICK if is_token1 else MIN_TICK)
+        if liquidity > 0:
+            consumed, step_output, sqrt_ratio = _swap_step(
+                sqrt_ratio, target, liquidity, remaining, pool.fee, is_token1
+            )
+            remaining -= consumed
+            output += step_output
+        else:
+            sqrt_ratio = target
+        if sqrt_ratio != target or not 0 <= index < len(ticks):
+            break
+        liquidity_net = pool.ticks[index][1]
+        liquidity += liquidity_net if is_token1 else -liquidity_net
+        index += 1 if is_token1 else -1
+    return output
+
+
+class SwapPath:
+    """
+    Swap of a pool in one direction with its ticks crossed ahead of time, to
+    simulate many amounts against the same pool state.
+
+    Crossing a segment between two initialized ticks always consumes the same
+    input for the same output, and happens exactly when the remaining input
+    covers it, so simulate only bisects the cumulated inputs and swaps within the
+    last segment reached, with the same result as simulate_swap.
+    """
+
+    def __init__(self, pool, is_token1):
+        self.fee, self.is_token1 = pool.fee, is_token1
+        ticks = [tick for tick, _ in pool.ticks]
+        index = bisect.bisect_right(ticks, pool.tick) - (0 if is_token1 else 1)
+        sqrt_ratio, liquidity = pool.sqrt_ratio, pool.liquidity
+        # Start (sqrt_ratio, liquidity, target) of the segments, and the input and
+        # output cumulated until each of them
+        self.segments, self.inputs, self.outputs = [], [0], [0]
+        while 0 <= index < len(ticks):
+            target = tick_to_sqrt_ratio(ticks[index])
+            self.segments.append((sqrt_ratio, liquidity, target))
+            consumed, output = 0, 0
+            if liquidity > 0:
+                consumed, output = self._cross(sqrt_ratio, target, liquidity)
+            self.inputs.append(self.inputs[-1] + consumed)
+            self.outputs.append(self.outputs[-1] + output)
+            liquidity_net = pool.ticks[index][1]
+            liquidity += liquidity_net if is_token1 else -liquidity_net
+            sqrt_ratio = target
+            index += 1 if is_token1 else -1
+        target = tick_to_sqrt_ratio(MAX_TICK if is_token1 else MIN_TICK)
+        self.segments.append((sqrt_ratio, liquidity, target))
+
+    def _cross(self, sqrt_ratio, target, liquidity):
+        """
+        Return the input and output of swapping from sqrt_ratio to target, as in
+        _swap_step.
+        """
+        if self.is_token1:
+            needed = _div_round_up(liquidity * (target - sqrt_ratio), ONE)
+            output = liquidity * (target - sqrt_ratio) * ONE // (sqrt_ratio * target)
+        else:
+            needed = _div_round_up(
+                liquidity * (sqrt_ratio - target) * ONE, sqrt_ratio * target
+            )
+            output = liquidity * (sqrt_ratio - target) // ONE
+        return _div_round_up(needed * ONE, ONE - self.fee), output
+
+    def simulate(self, amount):
+        if amount <= 0:
+            return 0
+        index = bisect.bisect_right(self.inputs, amount) - 1
+        remaining = amount - self.inputs[index]
+        sqrt_ratio, liquidity, target = self.segments[index]
+        if remaining == 0 or liquidity <= 0:
+            return self.outputs[index]
+        _, output, _ = _swap_step(
+            sqrt_ratio, target, liquidity, remaining, self.fee, self.is_token1
+        )
+        return self.outputs[index] + output
+
+
+def simulate_route(pools, directions, amount):
+    """
+    Return the output of swapping amount through the pools one after the other.
+
+    directions[i] is True when the input of pools[i] is its token1.
+    """
+    for pool, is_token1 in zip(pools, directions):
+        amount = simulate_swap(pool, amount, is_token1)
+        if amount == 0:
+            break
+    return amount
+
+
+def get_marginal_rate(pools, directions):
+    """
+    Return the output per unit of input of an infinitesimal swap along the route.
+    """
+    rate = 1.0
+    for pool, is_token1 in zip(pools, directions):
+        price = (pool.sqrt_ratio / ONE) ** 2
+        rate *= (1 / price if is_token1 else price) * (1 - pool.fee / ONE)
+    return rate
+
+
+def find_optimal_amount(pools, directions, max_amount=2**120, tolerance=1e-4):
+    """
+    Return the input amount maximizing simulate_route(amount) - amount for a cyclic
+    route, and this profit.
+
+    The profit of a cycle of concentrated liquidity swaps is concave in the input,
+    so the maximum is bracketed by doubling the input and refined with a golden
+    section search. Each pool is crossed once for all the amounts tried, see
+    SwapPath.
+    """
+
+    paths = [SwapPath(pool, is_token1) for pool, is_token1 in zip(pools, directions)]
+
+    def _profit(amount):
+        output = amount
+        for path in paths:
+            output = path.simulate(output)
+        return output - amount
+
+    rate = get_marginal_rate(pools, directions)
+    if rate <= 1:
+        return 0, 0
+
+    # Each hop rounds its output down by about one unit, so the doubling starts
+    # where the marginal profit outweighs the rounding, not from one unit where
+    # the profit drops are only noise
+    noise = len(pools)
+    start = min(max(1, int(16 * noise / (rate - 1))), max_amount)
+    low, high, profit_high = 0, start, _profit(start)
+    while high < max_amount:
+        profit_next = _profit(high * 2)
+        if profit_next < profit_high:
+            break
+        low, high, profit_high = high // 2, high * 2, profit_next
+    high = min(high * 2, max_amount)
+
+    left = high - int(GOLDEN_RATIO * (high - low))
+    right = low + int(GOLDEN_RATIO * (high - low))
+    profit_left, profit_right = _profit(left), _profit(right)
+    while high - low > max(2, tolerance * high):
+        if profit_left < profit_right:
+            low, left, profit_left = left, right, profit_right
+            right = low + int(GOLDEN_RATIO * (high - low))
+            profit_right = _profit(right)
+        else:
+            high, right, profit_right = right, left, profit_left
+            left = high - int(GOLDEN_RATIO * (high - low))
+            profit_left = _profit(left)
+
+    amount, profit = max(
+        [(amount, _profit(amount)) for amount in {low, left, right, high}],
+        key=lambda item: item[1],
+    )
+    return (amount, profit) if profit > 0 else (0, 0)
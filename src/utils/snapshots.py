@@ -0,0 +1,147 @@
+"""
+Append-only store of the prices matrices and pool states seen by the scanner.
+
+A store is a directory with:
+- meta.json: the token names, i.e. the rows and columns of the prices matrices;
+- prices.bin: the float64 prices matrices, one fixed size record per snapshot;
+- pools.jsonl: the pool states of each snapshot, one JSON line per snapshot;
+- index.bin: one (timestamp, block, pools offset, pools size) record per snapshot.
+
+The index record is written last, so a snapshot interrupted while being appended
+is ignored. Prices are read through a memory map without loading the whole file.
+"""
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.utils.mirror import dump_pool_states, load_pool_states
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("timestamp", "f8"),
+        ("block", "i8"),
+        ("pools_offset", "i8"),
+        ("pools_size", "i8"),
+    ]
+)
+
+
+class SnapshotStore:
+    def __init__(self, path, names=None):
+        self.path = Path(path)
+        self.names = names
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            self.names = json.loads(meta_path.read_text())["names"]
+        self._index = None
+        self._prices = None
+
+    def __len__(self):
+        index_path = self.path / "index.bin"
+        if not index_path.exists():
+            return 0
+        return index_path.stat().st_size // INDEX_DTYPE.itemsize
+
+    def _init(self, names):
+        self.path.mkdir(exist_ok=True, parents=True)
+        self.names = list(names)
+        (self.path / "meta.json").write_text(json.dumps({"names": self.names}))
+
+    def append(self, prices, timestamp=None, block=-1, pool_states=None):
+        """
+        Append a prices matrix, and optionally the {pool key: PoolState} dict of the
+        pools at this time.
+
+        The prices are a DataFrame, or an ndarray ordered like the names of the store,
+        which must then be given to a new store.
+        """
+        if not hasattr(prices, "columns") and self.names is None:
+            raise ValueError(
+                "The token names are required to append ndarray prices to a new store"
+            )
+        names = prices.columns if self.names is None else self.names
+        values = np.ascontiguousarray(prices, dtype=np.float64)
+        if values.shape != (len(names), len(names)):
+            raise ValueError(
+                f"Prices shape {values.shape} does not match {len(names)} tokens"
+            )
+        if not (self.path / "meta.json").exists():
+            self._init(names)
+        elif hasattr(prices, "columns") and list(prices.columns) != self.names:
+            raise ValueError(f"Prices tokens {list(prices.columns)} != {self.names}")
+
+        with open(self.path / "pools.jsonl", "ab") as file:
+            pools_offset = file.tell()
+            file.write(json.dumps(dump_pool_states(pool_states or {})).encode() + b"\n")
+            pools_size = file.tell() - pools_offset
+        with open(self.path / "prices.bin", "ab") as file:
+            # Drop the prices of a snapshot interrupted before its index record
+            file.truncate(len(self) * values.nbytes)
+            file.write(values.tobytes())
+        record = np.array(
+            [
+                (
+                    time.time() if timestamp is None else timestamp,
+                    block,
+                    pools_offset,
+                    pools_size,
+                )
+            ],
+            dtype=INDEX_DTYPE,
+        )
+        with open(self.path / "index.bin", "ab") as file:
+            file.write(record.tobytes())
+        self._index = self._prices = None
+
+    @property
+    def index(self):
+        if len(self) == 0:
+            return np.empty(0, dtype=INDEX_DTYPE)
+        if self._index is None or len(self._index) != len(self):
+            self._index = np.memmap(
+                self.path / "index.bin", dtype=INDEX_DTYPE, mode="r", shape=(len(self),)
+            )
+        return self._index
+
+    @property
+    def prices(self):
+        """
+        Return the (n_snapshots, n_tokens, n_tokens) memory map of the prices.
+        """
+        n_tokens = len(self.names or [])
+        if len(self) == 0:
+            return np.empty((0, n_tokens, n_tokens))
+        if self._prices is None or len(self._prices) != len(self):
+            self._prices = np.memmap(
+                self.path / "prices.bin",
+                dtype=np.float64,
+                mode="r",
+                shape=(len(self), n_tokens, n_tokens),
+            )
+        return self._prices
+
+    def get_prices(self, i):
+        return pd.DataFrame(
+            self.prices[i],
+            index=pd.Index(self.names, name="token"),
+            columns=pd.Index(self.names, name="base"),
+        )
+
+    def get_pool_states(self, i):
+        _, _, offset, size = self.index[i]
+        with open(self.path / "pools.jsonl", "rb") as file:
+            file.seek(offset)
+            return load_pool_states(json.loads(file.read(size)))
+
+    def find(self, timestamp=None, block=None):
+        """
+        Return the index of the last snapshot at or before a timestamp or a block.
+        """
+        if block is not None:
+            return int(np.searchsorted(self.index["block"], block, side="right")) - 1
+        return (
+            int(np.searchsorted(self.index["timestamp"], timestamp, side="right")) - 1
+        )
@@ -1,31 +1,39 @@
+import asyncio
+import copy
 import functools
+import hashlib
 import json
 import logging
+import os
+import random
+import re
+import shutil
 import subprocess
 import time
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
+from types import SimpleNamespace
 from typing import List, Union, cast
 
-import requests
 from starknet_py.contract import Contract
 from starknet_py.hash.selector import get_selector_from_name
 from starknet_py.net.account.account import Account
 from starknet_py.net.client_models import Call, TransactionStatus
 from starknet_py.net.signer.stark_curve_signer import KeyPair
 
+from src.utils import constants
 from src.utils.constants import (
     BUILD_DIR,
     BUILD_DIR_FIXTURES,
-    CONTRACTS,
-    CONTRACTS_FIXTURES,
     DEPLOYMENTS_DIR,
     ETH_TOKEN_ADDRESS,
-    GATEWAY_CLIENT,
     NETWORK,
-    RPC_CLIENT,
     SOURCE_DIR,
+    get_chain_id,
 )
+from src.utils.metrics import METRICS
+from src.utils.registry import parse_int
+from src.utils.rpc import RpcError, get_rpc_transport
 
 logging.basicConfig()
 logger = logging.getLogger(__name__)
@@ -36,6 +44,16 @@ logger.setLevel(logging.INFO)
 # to have at least 0.1 ETH
 _max_fee = int(5e15)
 
+COMPILER = "starknet-compile-deprecated"
+# Entry of build_hashes.json caching the version of the compiler
+COMPILER_CACHE_KEY = "__compiler__"
+
+_accounts = {}
+_json_files = {}
+_contracts = {}
+
+_CAIRO_IMPORT = re.compile(r"^\s*from\s+([\w.]+)\s+import", re.MULTILINE)
+
 
 def int_to_uint256(value):
     value = int(value)
@@ -44,25 +62,34 @@ def int_to_uint256(value):
     return {"low": low, "high": high}
 
 
-async def get_starknet_account(
-    address=None,
-    private_key=None,
-) -> Account:
-    address = address or NETWORK["account_address"]
-    if address is None:
-        raise ValueError(
-            "address was not given in arg nor in env variable, see README.md#Deploy"
-        )
-    address = int(address, 16)
-    private_key = private_key or NETWORK["private_key"]
-    if private_key is None:
-        raise ValueError(
-            "private_key was not given in arg nor in env variable, see README.md#Deploy"
-        )
-    key_pair = KeyPair.from_private_key(int(private_key, 16))
+def _get_public_key_selectors():
+    try:
+        return json.loads((DEPLOYMENTS_DIR / "accounts.json").read_text())
+    except FileNotFoundError:
+        return {}
+
 
-    public_key = None
-    for selector in ["get_public_key", "getPublicKey", "getSigner", "get_owner"]:
+def _dump_public_key_selector(address, selector):
+    selectors = _get_public_key_selectors()
+    selectors[hex(address)] = selector
+    DEPLOYMENTS_DIR.mkdir(exist_ok=True, parents=True)
+    json.dump(selectors, open(DEPLOYMENTS_DIR / "accounts.json", "w"), indent=2)
+
+
+async def get_account_public_key(address):
+    """
+    Return the public key stored in the account contract, or None if it cannot be
+    read.
+
+    Account contracts expose it under different names, the selector that worked is
+    saved in accounts.json so that next runs try it first.
+    """
+    selectors = ["get_public_key", "getPublicKey", "getSigner", "get_owner"]
+    known_selector = _get_public_key_selectors().get(hex(address))
+    if known_selector in selectors:
+        selectors = [known_selector] + [s for s in selectors if s != known_selector]
+
+    for selector in selectors:
         try:
             call = Call(
                 to_addr=address,
@@ -70,9 +97,8 @@ async def get_starknet_account(
                 calldata=[],
             )
             public_key = (
-                await RPC_CLIENT.call_contract(call=call, block_hash="latest")
+                await constants.RPC_CLIENT.call_contract(call=call, block_hash="latest")
             )[0]
-            break
         except Exception as err:
             if (
                 err.message == "Client failed with code 40: Contract error."
@@ -85,7 +111,15 @@ async def get_starknet_account(
             else:
                 logger.error(f"Raising for account at address {hex(address)}")
                 raise err
+        if selector != known_selector:
+            _dump_public_key_selector(address, selector)
+        return public_key
+    return None
+
 
+async def _create_starknet_account(address, private_key) -> Account:
+    key_pair = KeyPair.from_private_key(private_key)
+    public_key = await get_account_public_key(address)
     if public_key is not None:
         if key_pair.public_key != public_key:
             raise ValueError(
@@ -98,28 +132,126 @@ async def get_starknet_account(
 
     return Account(
         address=address,
-        client=RPC_CLIENT,
-        chain=NETWORK["chain_id"],
+        client=constants.RPC_CLIENT,
+        chain=await get_chain_id(),
         key_pair=key_pair,
     )
 
 
+async def get_starknet_account(
+    address=None,
+    private_key=None,
+) -> Account:
+    """
+    Return the Account for the given address and private key.
+
+    The key pair is verified against the account contract only once per process:
+    the Account is then served from memory until invalidate_starknet_account.
+    """
+    address = address or NETWORK["account_address"]
+    if address is None:
+        raise ValueError(
+            "address was not given in arg nor in env variable, see README.md#Deploy"
+        )
+    address = int(address, 16)
+    private_key = private_key or NETWORK["private_key"]
+    if private_key is None:
+        raise ValueError(
+            "private_key was not given in arg nor in env variable, see README.md#Deploy"
+        )
+    private_key = int(private_key, 16)
+
+    key = (address, private_key)
+    if key not in _accounts:
+        _accounts[key] = asyncio.ensure_future(
+            _create_starknet_account(address, private_key)
+        )
+    try:
+        return await asyncio.shield(_accounts[key])
+    except Exception:
+        _accounts.pop(key, None)
+        raise
+
+
+def invalidate_starknet_account(address=None):
+    """
+    Forget the verified accounts, all of them if no address is given.
+    """
+    for key in list(_accounts):
+        if address is None or key[0] == int(address, 16):
+            del _accounts[key]
+
+
+def _get_file_stamp(path):
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_json(path):
+    """
+    Parse a JSON file, reusing the previous result while the file is unchanged.
+
+    The returned object is shared: callers must not mutate it.
+    """
+    stamp = _get_file_stamp(path)
+    if stamp is None:
+        raise FileNotFoundError(path)
+    cached = _json_files.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    value = json.loads(Path(path).read_text())
+    _json_files[path] = (stamp, value)
+    return value
+
+
+def _get_deployments():
+    try:
+        return _load_json(DEPLOYMENTS_DIR / "deployments.json")
+    except FileNotFoundError:
+        return {}
+
+
+def get_abi(contract_name):
+    return _load_json(get_artifact(contract_name))["abi"]
+
+
+def get_cached_contract(contract_name, address, account, abi_path=None):
+    """
+    Return a Contract for the given name and address, built only once as long as the
+    artifact and the deployments are unchanged and for the same account.
+    """
+    abi_path = abi_path or get_artifact(contract_name)
+    if address is None:
+        address = _get_deployments()[contract_name]["address"]
+    address = int(address, 16) if isinstance(address, str) else address
+    stamp = (
+        _get_file_stamp(abi_path),
+        _get_file_stamp(DEPLOYMENTS_DIR / "deployments.json"),
+    )
+    cached = _contracts.get((contract_name, address))
+    if cached is not None and cached[0] == stamp and cached[1] is account:
+        return cached[2]
+    contract = Contract(address, _load_json(abi_path)["abi"], account)
+    _contracts[(contract_name, address)] = (stamp, account, contract)
+    return contract
+
+
 async def get_eth_contract() -> Contract:
     # TODO: use .from_address when katana implements getClass
-    return Contract(
+    return get_cached_contract(
+        "erc20",
         ETH_TOKEN_ADDRESS,
-        json.loads((Path("scripts") / "utils" / "erc20.json").read_text())["abi"],
         await get_starknet_account(),
+        abi_path=Path("scripts") / "utils" / "erc20.json",
     )
 
 
 async def get_contract(contract_name) -> Contract:
     # TODO: use .from_address when katana implements getClass
-    return Contract(
-        get_deployments()[contract_name]["address"],
-        json.loads(get_artifact(contract_name).read_text())["abi"],
-        await get_starknet_account(),
-    )
+    return get_cached_contract(contract_name, None, await get_starknet_account())
 
 
 async def fund_address(address: Union[int, str], amount: float):
@@ -129,12 +261,13 @@ async def fund_address(address: Union[int, str], amount: float):
     address = int(address, 16) if isinstance(address, str) else address
     amount = amount * 1e18
     if NETWORK["name"] == "starknet-devnet":
-        response = requests.post(
+        async with get_rpc_transport().get_session().post(
             "http://127.0.0.1:5050/mint",
             json={"address": hex(address), "amount": amount},
-        )
-        if response.status_code != 200:
-            logger.error(f"Cannot mint token to {address}: {response.text}")
+            raise_for_status=False,
+        ) as response:
+            if response.status != 200:
+                logger.error(f"Cannot mint token to {address}: {await response.text()}")
         logger.info(f"{amount / 1e18} ETH minted to {hex(address)}")
     else:
         account = await get_starknet_account()
@@ -159,6 +292,7 @@ async def fund_address(address: Union[int, str], amount: float):
 
 
 def dump_declarations(declarations):
+    DEPLOYMENTS_DIR.mkdir(exist_ok=True, parents=True)
     json.dump(
         {name: hex(class_hash) for name, class_hash in declarations.items()},
         open(DEPLOYMENTS_DIR / "declarations.json", "w"),
@@ -169,33 +303,39 @@ def dump_declarations(declarations):
 def get_declarations():
     return {
         name: int(class_hash, 16)
-        for name, class_hash in json.load(
-            open(DEPLOYMENTS_DIR / "declarations.json")
+        for name, class_hash in _load_json(
+            DEPLOYMENTS_DIR / "declarations.json"
         ).items()
     }
 
 
 def dump_deployments(deployments):
-    json.dump(
-        {
-            name: {
-                **deployment,
-                "address": hex(deployment["address"]),
-                "tx": hex(deployment["tx"]),
-                "artifact": str(deployment["artifact"]),
-            }
-            for name, deployment in deployments.items()
-        },
-        open(DEPLOYMENTS_DIR / "deployments.json", "w"),
-        indent=2,
+    """
+    Write deployments.json atomically: readers see either the old or the new file.
+
+    Addresses and tx hashes can be given as int or as hex strings.
+    """
+    DEPLOYMENTS_DIR.mkdir(exist_ok=True, parents=True)
+    tmp_path = DEPLOYMENTS_DIR / "deployments.json.tmp"
+    tmp_path.write_text(
+        json.dumps(
+            {
+                name: {
+                    **deployment,
+                    "address": hex(parse_int(deployment["address"])),
+                    "tx": hex(parse_int(deployment["tx"])),
+                    "artifact": str(deployment["artifact"]),
+                }
+                for name, deployment in deployments.items()
+            },
+            indent=2,
+        )
     )
+    os.replace(tmp_path, DEPLOYMENTS_DIR / "deployments.json")
 
 
 def get_deployments():
-    try:
-        return json.load(open(DEPLOYMENTS_DIR / "deployments.json", "r"))
-    except FileNotFoundError:
-        return {}
+    return copy.deepcopy(_get_deployments())
 
 
 def get_artifact(contract_name):
@@ -212,65 +352,201 @@ def get_tx_url(tx_hash: int) -> str:
 
 
 def is_fixture_contract(contract_name):
-    return CONTRACTS_FIXTURES.get(contract_name) is not None
+    return constants.CONTRACTS_FIXTURES.get(contract_name) is not None
+
+
+def get_contract_source(contract_name):
+    return (
+        constants.CONTRACTS[contract_name]
+        if not is_fixture_contract(contract_name)
+        else constants.CONTRACTS_FIXTURES[contract_name]
+    )
+
+
+def get_compile_flags(contract):
+    return [
+        "--cairo_path",
+        str(SOURCE_DIR),
+        *(["--no_debug_info"] if not NETWORK["devnet"] else []),
+        *(["--account_contract"] if contract["is_account_contract"] else []),
+        *(
+            ["--disable_hint_validation"]
+            if NETWORK["name"] == "starknet-devnet"
+            else []
+        ),
+    ]
+
+
+def get_source_dependencies(source):
+    """
+    Return the source and all the files it imports, recursively, that can be found
+    in the --cairo_path.
+    """
+    dependencies = set()
+    to_visit = [Path(source)]
+    while to_visit:
+        path = to_visit.pop()
+        if path in dependencies:
+            continue
+        dependencies.add(path)
+        for module in _CAIRO_IMPORT.findall(path.read_text()):
+            dependency = SOURCE_DIR / Path(*module.split(".")).with_suffix(".cairo")
+            if dependency.exists():
+                to_visit.append(dependency)
+    return sorted(dependencies)
+
+
+def _get_compiler_key():
+    """
+    Return the resolved path, mtime and size of the compiler, or None if it is not
+    installed.
+    """
+    path = shutil.which(COMPILER)
+    if path is None:
+        return None
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    return f"{path}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def get_compiler_version(cache=None):
+    """
+    Return the output of the compiler --version, or an empty string if the compiler
+    cannot be run.
+
+    Running the compiler takes about a second, so the version is saved in the cache
+    dict, e.g. the build hashes, with the key of the compiler executable, and the
+    compiler is only run again when its executable changed.
+    """
+    key = _get_compiler_key()
+    if key is None:
+        return ""
+    cache = {} if cache is None else cache
+    if cache.get(COMPILER_CACHE_KEY, {}).get("key") != key:
+        try:
+            output = subprocess.run([COMPILER, "--version"], capture_output=True)
+        except OSError:
+            return ""
+        cache[COMPILER_CACHE_KEY] = {
+            "key": key,
+            "version": output.stdout.decode().strip(),
+        }
+    return cache[COMPILER_CACHE_KEY]["version"]
+
+
+def get_contract_build_hash(contract, compiler_version=""):
+    build_hash = hashlib.sha256()
+    build_hash.update(compiler_version.encode())
+    build_hash.update(json.dumps(get_compile_flags(contract)).encode())
+    for path in get_source_dependencies(get_contract_source(contract["contract_name"])):
+        build_hash.update(str(path).encode())
+        build_hash.update(path.read_bytes())
+    return build_hash.hexdigest()
+
+
+def _convert_offset_to_hex(entry_points_by_type):
+    return {
+        entry_point_type: [
+            {
+                key: hex(value) if isinstance(value, int) and value >= 0 else value
+                for key, value in entry_point.items()
+            }
+            for entry_point in entry_points
+        ]
+        for entry_point_type, entry_points in entry_points_by_type.items()
+    }
 
 
 def compile_contract(contract):
-    is_fixture = is_fixture_contract(contract["contract_name"])
     contract_build_path = get_artifact(contract["contract_name"])
+    contract_build_path.parent.mkdir(exist_ok=True, parents=True)
 
     output = subprocess.run(
         [
-            "starknet-compile-deprecated",
-            CONTRACTS[contract["contract_name"]]
-            if not is_fixture
-            else CONTRACTS_FIXTURES[contract["contract_name"]],
+            COMPILER,
+            get_contract_source(contract["contract_name"]),
             "--output",
             contract_build_path,
-            "--cairo_path",
-            str(SOURCE_DIR),
-            *(["--no_debug_info"] if not NETWORK["devnet"] else []),
-            *(["--account_contract"] if contract["is_account_contract"] else []),
-            *(
-                ["--disable_hint_validation"]
-                if NETWORK["name"] == "starknet-devnet"
-                else []
-            ),
+            *get_compile_flags(contract),
         ],
         capture_output=True,
     )
     if output.returncode != 0:
         raise RuntimeError(output.stderr)
 
-    def _convert_offset_to_hex(obj):
-        if isinstance(obj, list):
-            return [_convert_offset_to_hex(i) for i in obj]
-        if isinstance(obj, dict):
-            return {key: _convert_offset_to_hex(obj[key]) for key, value in obj.items()}
-        if isinstance(obj, int) and obj >= 0:
-            return hex(obj)
-        return obj
-
     compiled = json.loads(contract_build_path.read_text())
-    compiled = {
-        **compiled,
-        "entry_points_by_type": _convert_offset_to_hex(
-            compiled["entry_points_by_type"]
-        ),
+    compiled["entry_points_by_type"] = _convert_offset_to_hex(
+        compiled["entry_points_by_type"]
+    )
+    contract_build_path.write_text(json.dumps(compiled, indent=2))
+
+
+def compile_contracts(contracts, max_workers=None):
+    """
+    Compile the given contracts in parallel, skipping the ones whose artifact is
+    up to date.
+
+    An artifact is up to date when the hash of its sources, of the files they import,
+    of the compiler version and of the compiler flags matches the one saved in
+    BUILD_DIR/build_hashes.json. The hashes of the contracts compiled successfully
+    are saved even if others fail.
+    """
+    build_hashes_path = BUILD_DIR / "build_hashes.json"
+    try:
+        build_hashes = json.loads(build_hashes_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        build_hashes = {}
+
+    compiler = build_hashes.get(COMPILER_CACHE_KEY)
+    compiler_version = get_compiler_version(build_hashes)
+    new_hashes = {
+        contract["contract_name"]: get_contract_build_hash(contract, compiler_version)
+        for contract in contracts
     }
-    json.dump(
-        compiled,
-        open(
-            contract_build_path,
-            "w",
-        ),
-        indent=2,
+    outdated = [
+        contract
+        for contract in contracts
+        if build_hashes.get(contract["contract_name"])
+        != new_hashes[contract["contract_name"]]
+        or not get_artifact(contract["contract_name"]).exists()
+    ]
+    logger.info(
+        f"ℹ️  {len(contracts) - len(outdated)} contracts up to date, compiling {len(outdated)}"
     )
+    if not outdated:
+        if build_hashes.get(COMPILER_CACHE_KEY) != compiler:
+            BUILD_DIR.mkdir(exist_ok=True, parents=True)
+            build_hashes_path.write_text(json.dumps(build_hashes, indent=2))
+        return []
+
+    errors = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(compile_contract, contract): contract["contract_name"]
+                for contract in outdated
+            }
+            for future in as_completed(futures):
+                contract_name = futures[future]
+                try:
+                    future.result()
+                    build_hashes[contract_name] = new_hashes[contract_name]
+                    logger.info(f"✅ {contract_name} compiled")
+                except Exception as err:
+                    # e.g. a missing compiler or a crashed worker
+                    errors[contract_name] = err
+                    logger.error(f"❌ {contract_name} failed to compile: {err!r}")
+    finally:
+        BUILD_DIR.mkdir(exist_ok=True, parents=True)
+        build_hashes_path.write_text(json.dumps(build_hashes, indent=2))
+    if errors:
+        raise RuntimeError(errors)
+    return [contract["contract_name"] for contract in outdated]
 
 
 async def deploy(contract_name, *args):
     logger.info(f"ℹ️  Deploying {contract_name}")
-    abi = json.loads(Path(get_artifact(contract_name)).read_text())["abi"]
+    abi = get_abi(contract_name)
     account = await get_starknet_account()
 
     deploy_result = await Contract.deploy_contract(
@@ -292,7 +568,108 @@ async def deploy(contract_name, *args):
     }
 
 
-async def invoke_address(contract_address, function_name, *calldata, account=None):
+def get_deployment_layers(plan):
+    """
+    Split a deployment plan in successive layers of contracts that only depend on
+    contracts of previous layers.
+    """
+    dependencies = {
+        name: set(spec.get("depends_on", [])) & set(plan) for name, spec in plan.items()
+    }
+    layers = []
+    while dependencies:
+        layer = sorted(name for name, deps in dependencies.items() if not deps)
+        if not layer:
+            raise ValueError(
+                f"Circular dependencies in deployment plan: {dependencies}"
+            )
+        layers.append(layer)
+        dependencies = {
+            name: deps - set(layer)
+            for name, deps in dependencies.items()
+            if name not in layer
+        }
+    return layers
+
+
+async def deploy_contracts(plan):
+    """
+    Deploy a set of contracts following their dependency graph.
+
+    The plan maps a deployment name to a dict with the optional keys:
+    - contract_name: the declared contract to deploy, defaults to the deployment name;
+    - args: the constructor args, or a function taking the current deployments and
+      returning them, to use addresses of contracts deployed in previous layers;
+    - depends_on: the deployment names that must be confirmed before this one.
+
+    All the contracts of a layer are sent back-to-back with nonces reserved on the
+    account NonceManager, shared with the other senders, and their confirmations
+    are awaited concurrently. deployments.json is written once at the end, even if
+    a deployment failed.
+    """
+    from src.utils.nonce import get_nonce_manager
+
+    account = await get_starknet_account()
+    nonces = get_nonce_manager(account)
+    declarations = get_declarations()
+    deployments = get_deployments()
+
+    async def _deploy(nonce, name, contract_name, args, sent):
+        logger.info(f"ℹ️  Deploying {name} with nonce {nonce}")
+        deploy_result = await Contract.deploy_contract(
+            account=account,
+            class_hash=declarations[contract_name],
+            abi=get_abi(contract_name),
+            constructor_args=list(args),
+            nonce=nonce,
+            max_fee=_max_fee,
+        )
+        sent[name] = deploy_result
+        return SimpleNamespace(transaction_hash=deploy_result.hash)
+
+    try:
+        for layer in get_deployment_layers(plan):
+            sent = {}
+            statuses = {}
+            for name in layer:
+                spec = plan[name]
+                contract_name = spec.get("contract_name", name)
+                args = spec.get("args", [])
+                args = args(deployments) if callable(args) else args
+                _, statuses[name] = await nonces.submit(
+                    functools.partial(
+                        _deploy,
+                        name=name,
+                        contract_name=contract_name,
+                        args=args,
+                        sent=sent,
+                    )
+                )
+
+            failed = []
+            for name, status in zip(layer, await asyncio.gather(*statuses.values())):
+                address = sent[name].deployed_contract.address
+                if status != TransactionStatus.ACCEPTED_ON_L2:
+                    logger.error(f"❌ {name} deployment failed with status {status}")
+                    failed.append(name)
+                    continue
+                logger.info(f"✅ {name} deployed at: {hex(address)}")
+                deployments[name] = {
+                    "address": address,
+                    "tx": sent[name].hash,
+                    "artifact": get_artifact(plan[name].get("contract_name", name)),
+                }
+            if failed:
+                raise RuntimeError(f"Deployments failed: {failed}")
+    finally:
+        dump_deployments(deployments)
+
+    return deployments
+
+
+async def invoke_address(
+    contract_address, function_name, *calldata, account=None, nonce=None
+):
     account = account or (await get_starknet_account())
     logger.info(
         f"ℹ️  Invoking {function_name}({json.dumps(calldata) if calldata else ''}) "
@@ -304,25 +681,21 @@ async def invoke_address(contract_address, function_name, *calldata, account=Non
             selector=get_selector_from_name(function_name),
             calldata=cast(List[int], calldata),
         ),
+        nonce=nonce,
         max_fee=_max_fee,
     )
 
 
 async def invoke_contract(
-    contract_name, function_name, *inputs, address=None, account=None
+    contract_name, function_name, *inputs, address=None, account=None, nonce=None
 ):
     account = account or (await get_starknet_account())
-    deployments = get_deployments()
-    contract = Contract(
-        deployments[contract_name]["address"] if address is None else address,
-        json.load(open(get_artifact(contract_name)))["abi"],
-        account,
-    )
+    contract = get_cached_contract(contract_name, address, account)
     call = contract.functions[function_name].prepare(*inputs, max_fee=_max_fee)
     logger.info(
         f"ℹ️  Invoking {contract_name}.{function_name}({json.dumps(inputs) if inputs else ''})"
     )
-    return await account.execute(call, max_fee=_max_fee)
+    return await account.execute(call, nonce=nonce, max_fee=_max_fee)
 
 
 async def invoke(contract, *args, **kwargs):
@@ -353,13 +726,8 @@ async def call_address(contract_address, function_name, *calldata):
 
 
 async def call_contract(contract_name, function_name, *inputs, address=None):
-    deployments = get_deployments()
     account = await get_starknet_account()
-    contract = Contract(
-        deployments[contract_name]["address"] if address is None else address,
-        json.load(open(get_artifact(contract_name)))["abi"],
-        account,
-    )
+    contract = get_cached_contract(contract_name, address, account)
     return await contract.functions[function_name].call(*inputs)
 
 
@@ -371,25 +739,53 @@ async def call(contract, *args, **kwargs):
     )
 
 
+async def get_transaction_status(transaction_hash, rpc_url=None):
+    """
+    Return the status of a transaction, None if unknown yet, or raise on RPC errors.
+    """
+    try:
+        receipt = await get_rpc_transport(rpc_url).call(
+            "starknet_getTransactionReceipt",
+            {"transaction_hash": hex(transaction_hash)},
+        )
+    except RpcError as err:
+        if err.message != "Transaction hash not found":
+            raise
+        return None
+    status = receipt.get("status")
+    if status is not None:
+        # Statuses unknown to starknet-py, e.g. PENDING, are not final yet
+        return TransactionStatus.__members__.get(status)
+    # no status, but RPC currently doesn't return status for ACCEPTED_ON_L2 still PENDING
+    # we take actual_fee as a proxy for ACCEPTED_ON_L2
+    if receipt.get("actual_fee"):
+        return TransactionStatus.ACCEPTED_ON_L2
+    return None
+
+
 # TODO: use RPC_CLIENT when RPC wait_for_tx is fixed, see https://github.com/kkrt-labs/kakarot/issues/586
 # TODO: Currently, the first ping often throws "transaction not found"
-@functools.wraps(RPC_CLIENT.wait_for_tx)
 async def wait_for_transaction(*args, **kwargs):
     """
     We need to write this custom hacky wait_for_transaction instead of using the one from starknet-py
     because the RPCs don't know RECEIVED, PENDING and REJECTED states currently.
+
+    The receipt is polled without blocking the event loop, starting every check_interval
+    seconds and backing off exponentially (with jitter) up to max_interval.
     """
-    if GATEWAY_CLIENT is not None:
+    if constants.GATEWAY_CLIENT is not None:
         # Gateway case, just use it
-        receipt = await GATEWAY_CLIENT.wait_for_tx(*args, **kwargs)
+        receipt = await constants.GATEWAY_CLIENT.wait_for_tx(*args, **kwargs)
         return receipt.status
 
-    start = datetime.now()
+    start = time.monotonic()
     elapsed = 0
     check_interval = kwargs.get("check_interval", NETWORK.get("check_interval", 15))
     max_wait = kwargs.get("max_wait", NETWORK.get("max_wait", 30))
+    max_interval = kwargs.get("max_interval", 4 * check_interval)
     transaction_hash = args[0] if args else kwargs["tx_hash"]
     status = None
+    attempt = 0
     logger.info(f"⏳ Waiting for tx {get_tx_url(transaction_hash)}")
     while (
         status not in [TransactionStatus.ACCEPTED_ON_L2, TransactionStatus.REJECTED]
@@ -398,29 +794,34 @@ async def wait_for_transaction(*args, **kwargs):
         if elapsed > 0:
             # don't log at the first iteration
             logger.info(f"ℹ️  Current status: {status}")
-        logger.info(f"ℹ️  Sleeping for {check_interval}s")
-        time.sleep(check_interval)
-        response = requests.post(
-            RPC_CLIENT.url,
-            json={
-                "jsonrpc": "2.0",
-                "method": "starknet_getTransactionReceipt",
-                "params": {"transaction_hash": hex(transaction_hash)},
-                "id": 0,
-            },
-        )
-        payload = json.loads(response.text)
-        if payload.get("error"):
-            if payload["error"]["message"] != "Transaction hash not found":
-                logger.warn(json.dumps(payload["error"]))
-                break
-        status = payload.get("result", {}).get("status")
-        if status is not None:
-            status = TransactionStatus(status)
-        else:
-            # no status, but RPC currently doesn't return status for ACCEPTED_ON_L2 still PENDING
-            # we take actual_fee as a proxy for ACCEPTED_ON_L2
-            if payload.get("result", {}).get("actual_fee"):
-                status = TransactionStatus.ACCEPTED_ON_L2
-        elapsed = (datetime.now() - start).total_seconds()
+        delay = min(check_interval * 1.5**attempt, max_interval)
+        delay = min(delay * random.uniform(0.8, 1.2), max(max_wait - elapsed, 0))
+        logger.info(f"ℹ️  Sleeping for {delay:.2f}s")
+        await asyncio.sleep(delay)
+        attempt += 1
+        try:
+            status = await get_transaction_status(
+                transaction_hash, rpc_url=kwargs.get("rpc_url")
+            )
+        except RuntimeError as err:
+            logger.warning(str(err))
+            break
+        elapsed = time.monotonic() - start
+    METRICS.observe("wait_for_transaction_seconds", time.monotonic() - start)
+    METRICS.increment("transactions", status=getattr(status, "name", str(status)))
     return status
+
+
+async def wait_for_transactions(transaction_hashes, **kwargs):
+    """
+    Wait for many transactions at once, yielding (transaction_hash, status) as soon as
+    each receipt arrives.
+    """
+
+    async def _wait(transaction_hash):
+        return transaction_hash, await wait_for_transaction(transaction_hash, **kwargs)
+
+    for result in asyncio.as_completed(
+        [_wait(transaction_hash) for transaction_hash in transaction_hashes]
+    ):
+        yield await result
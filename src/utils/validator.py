@@ -0,0 +1,180 @@
+"""
+Pre-trade validation of the candidate routes.
+
+The flashloan_swap transaction of each candidate is simulated on the node with
+starknet_simulateTransactions, all the candidates concurrently, and only the route
+with the best simulated profit net of the transaction fee is sent.
+
+The simulated profit is the net amount of the origin token received by the account
+and the flashswap contract, read from the Transfer events of the trace. Profits are
+valued in wei, like the fees, with the prices matrix and the decimals of the origin
+tokens, to compare routes starting from different tokens.
+
+Simulations run on the node of the current network, e.g. on a local devnet forking
+mainnet with STARKNET_NETWORK=starknet-devnet.
+"""
+import asyncio
+import logging
+
+from starknet_py.hash.selector import get_selector_from_name
+from starknet_py.net.client_models import RevertedFunctionInvocation
+
+from src.utils import constants
+from src.utils.arbitrage import TokenGraph
+from src.utils.ekubo import (
+    FLASHSWAP_ADDRESS,
+    TOKEN_DECIMALS,
+    TOKEN_NAME_TO_ADDRESS,
+    FlashswapTemplates,
+)
+from src.utils.metrics import METRICS
+from src.utils.registry import parse_int
+
+logging.basicConfig()
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+TRANSFER = get_selector_from_name("Transfer")
+
+
+def _get_transfers(invocation):
+    """
+    Yield the (token, sender, recipient, amount) of the Transfer events of an
+    invocation and of its inner calls.
+    """
+    if invocation is None:
+        return
+    for event in invocation.events:
+        if not event.keys or event.keys[0] != TRANSFER:
+            continue
+        if len(event.keys) == 3:
+            # Cairo 1 tokens index the sender and the recipient
+            sender, recipient = event.keys[1:]
+            low, high = event.data[:2]
+        else:
+            sender, recipient, low, high = event.data[:4]
+        yield invocation.contract_address, sender, recipient, low + (high << 128)
+    for call in invocation.calls:
+        yield from _get_transfers(call)
+
+
+def get_token_flow(invocation, token, holders):
+    """
+    Return the net amount of token received by the holders in an invocation.
+    """
+    flow = 0
+    for address, sender, recipient, amount in _get_transfers(invocation):
+        if address != token:
+            continue
+        flow += (recipient in holders) * amount - (sender in holders) * amount
+    return flow
+
+
+def get_eth_rate(prices, token):
+    """
+    Return the value in ETH of one whole token, or 0 if the prices matrix, or
+    TokenGraph, has no price for the pair.
+    """
+    if token == "ETH":
+        return 1.0
+    if isinstance(prices, TokenGraph):
+        to_eth, from_eth = prices.get_price(token, "ETH"), prices.get_price(
+            "ETH", token
+        )
+    else:
+        to_eth, from_eth = prices.loc[token, "ETH"], prices.loc["ETH", token]
+    if to_eth > 0:
+        return float(to_eth)
+    if from_eth > 0:
+        return 1 / float(from_eth)
+    return 0.0
+
+
+def get_wei_value(prices, token, amount):
+    """
+    Return the value in wei of an amount of token given in its smallest unit, like
+    the fees.
+    """
+    whole = amount / 10 ** TOKEN_DECIMALS.get(token, 18)
+    return whole * get_eth_rate(prices, token) * 10**18
+
+
+async def simulate_flashloan_swaps(
+    account, candidates, max_fee, prices=None, templates=None
+):
+    """
+    Simulate the flashloan_swap of all the candidates concurrently.
+
+    Return a copy of each candidate with its simulated profit in the smallest unit
+    of the origin token, the fee in wei, the net profit in wei when prices are
+    given, and the error if the simulation failed or reverted.
+    """
+    templates = templates or FlashswapTemplates(account)
+    await templates.prepare()
+    holders = {account.address, FLASHSWAP_ADDRESS}
+
+    async def _simulate(candidate):
+        # Validation is skipped, so the transaction does not need to be signed
+        transaction = await templates.build(
+            candidate["swap_params"], candidate["amount_from"], max_fee, query=True
+        )
+        (simulated,) = await constants.RPC_CLIENT.simulate_transactions(
+            [transaction], skip_validate=True, skip_fee_charge=True
+        )
+        return simulated
+
+    simulations = await asyncio.gather(
+        *[_simulate(candidate) for candidate in candidates], return_exceptions=True
+    )
+    results = []
+    for candidate, simulated in zip(candidates, simulations):
+        result = {
+            **candidate,
+            "simulated_profit": 0,
+            "fee": 0,
+            "net_profit": 0.0,
+            "error": None,
+        }
+        results.append(result)
+        if isinstance(simulated, Exception):
+            result["error"] = str(simulated)
+            continue
+        result["fee"] = simulated.fee_estimation.overall_fee
+        execution = simulated.transaction_trace.execute_invocation
+        if isinstance(execution, RevertedFunctionInvocation):
+            result["error"] = execution.revert_reason
+            continue
+        origin = candidate["route"][0]
+        result["simulated_profit"] = get_token_flow(
+            execution, parse_int(TOKEN_NAME_TO_ADDRESS[origin]), holders
+        )
+        if prices is not None:
+            result["net_profit"] = (
+                get_wei_value(prices, origin, result["simulated_profit"])
+                - result["fee"]
+            )
+    return results
+
+
+async def validate(account, candidates, max_fee, prices, templates=None):
+    """
+    Return the candidate with the best simulated net profit, or None if no
+    simulation is profitable.
+    """
+    results = await simulate_flashloan_swaps(
+        account, candidates, max_fee, prices, templates
+    )
+    for result in results:
+        METRICS.increment("simulations", reverted=result["error"] is not None)
+        if result["error"] is not None:
+            logger.info(f"ℹ️  Route {result['route']} rejected: {result['error']}")
+    profitable = [
+        result
+        for result in results
+        if result["error"] is None
+        and result["simulated_profit"] > 0
+        and result["net_profit"] > 0
+    ]
+    if not profitable:
+        return None
+    return max(profitable, key=lambda result: result["net_profit"])
@@ -0,0 +1,114 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.arbitrage import (
+    SWAP_COST,
+    ArbitrageIndex,
+    find_arbitrage_for_all_tokens,
+    find_arbitrage_for_token,
+    find_arbitrages,
+    get_cycles_indexes,
+)
+
+
+def get_prices(n_tokens, density, seed):
+    rng = np.random.default_rng(seed)
+    values = np.exp(rng.normal(0, 3, n_tokens))
+    prices = values[None, :] / values[:, None]
+    prices *= np.exp(rng.normal(0, 0.01, (n_tokens, n_tokens)))
+    prices[rng.random((n_tokens, n_tokens)) > density] = 0
+    return prices
+
+
+def get_best_profit(origin, prices, max_length):
+    best = 0.0
+    others = [token for token in range(len(prices)) if token != origin]
+    for length in range(1, max_length):
+        for path in itertools.permutations(others, length):
+            cycle = [origin, *path, origin]
+            cycle_prices = [prices[i, j] for i, j in zip(cycle[:-1], cycle[1:])]
+            profit = np.prod(cycle_prices) * (1 - SWAP_COST) ** len(cycle_prices)
+            best = max(best, profit)
+    return best
+
+
+def get_canonical_cycle(route):
+    """
+    Return the rotation of a cycle starting from its smallest token.
+    """
+    cycle = route[:-1]
+    start = cycle.index(min(cycle))
+    return tuple(cycle[start:] + cycle[:start])
+
+
+class TestFindArbitrages:
+    @pytest.mark.parametrize("n_tokens, max_length", [(5, 4), (6, 3), (3, 4)])
+    def test_should_list_each_cycle_once(self, n_tokens, max_length):
+        indexes, lengths = get_cycles_indexes(n_tokens, max_length)
+        cycles = [
+            tuple(cycle[:length].tolist()) for cycle, length in zip(indexes, lengths)
+        ]
+        expected = {
+            get_canonical_cycle(list(path) + [path[0]])
+            for length in range(2, max_length + 1)
+            for path in itertools.permutations(range(n_tokens), length)
+        }
+        assert len(cycles) == len(set(cycles))
+        assert set(cycles) == expected
+
+    @pytest.mark.parametrize("seed", range(3))
+    def test_should_not_return_rotations_of_the_same_cycle(self, seed):
+        prices = get_prices(7, 1.0, seed)
+        arbitrages = find_arbitrages(prices, max_length=4, top=10)
+
+        cycles = [get_canonical_cycle(route) for route, _, _ in arbitrages]
+        assert len(arbitrages) == 10
+        assert len(set(cycles)) == len(cycles)
+        # The best cycle is the best one of all the origins
+        best = max(get_best_profit(origin, prices, 4) for origin in range(len(prices)))
+        assert arbitrages[0][1] == pytest.approx(best)
+
+    def test_should_match_the_incremental_index(self):
+        prices = get_prices(6, 1.0, 0)
+        index = ArbitrageIndex(prices, max_length=4)
+        prices[2, 4] *= 1.05
+        index.update(2, 4, prices[2, 4])
+
+        assert index.top(5) == find_arbitrages(prices, max_length=4, top=5)
+
+
+class TestFindArbitrageForAllTokens:
+    @pytest.mark.parametrize("seed", range(6))
+    @pytest.mark.parametrize("density", [1.0, 0.5])
+    @pytest.mark.parametrize("max_length", [None, 3])
+    def test_should_find_the_best_cycle_of_each_token(self, seed, density, max_length):
+        prices = get_prices(7, density, seed)
+        arbitrages = find_arbitrage_for_all_tokens(prices, max_length=max_length)
+
+        for origin, (route, profit, cycle_prices) in enumerate(arbitrages):
+            assert profit == pytest.approx(
+                get_best_profit(origin, prices, max_length or len(prices))
+            )
+            assert route[0] == route[-1] == origin
+            if profit > 0:
+                assert cycle_prices == [
+                    prices[i, j] for i, j in zip(route[:-1], route[1:])
+                ]
+
+    def test_should_match_the_search_of_each_token(self):
+        prices = pd.DataFrame(get_prices(10, 0.5, 0), columns=list("ABCDEFGHIJ"))
+        arbitrages = find_arbitrage_for_all_tokens(prices, max_length=4)
+
+        for origin, arbitrage in enumerate(arbitrages):
+            assert arbitrage == find_arbitrage_for_token(origin, prices, max_length=4)
+
+    def test_should_return_empty_route_without_cycle(self):
+        prices = np.array([[1.0, 2.0, 0.0], [0.0, 1.0, 2.0], [0.0, 0.0, 1.0]])
+        assert find_arbitrage_for_all_tokens(prices) == [
+            ([0, 0], 0.0, []),
+            ([1, 1], 0.0, []),
+            ([2, 2], 0.0, []),
+        ]
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from src.utils.cache import AsyncTTLCache
+
+
+@pytest.fixture
+def writes(monkeypatch):
+    """
+    Record the thread of each write of a cache file.
+    """
+    writes = []
+    write = AsyncTTLCache._write
+
+    def _write(self, entries):
+        writes.append(threading.current_thread())
+        write(self, entries)
+
+    monkeypatch.setattr(AsyncTTLCache, "_write", _write)
+    return writes
+
+
+class TestAsyncTTLCache:
+    def test_should_save_the_updates_together_off_the_loop(self, tmp_path, writes):
+        path = tmp_path / "cache.json"
+        cache = AsyncTTLCache(path=path, dump_delay=60)
+
+        async def _run():
+            for i in range(100):
+                cache.set(f"key{i}", i)
+            assert not path.exists()
+            await cache.flush()
+
+        asyncio.run(_run())
+        assert len(writes) == 1
+        assert writes[0] is not threading.main_thread()
+        assert len(json.loads(path.read_text())) == 100
+
+    def test_should_save_the_pending_updates_when_the_loop_closes(
+        self, tmp_path, writes
+    ):
+        path = tmp_path / "cache.json"
+
+        async def _run():
+            AsyncTTLCache(path=path, dump_delay=60).set("key", [1, 2])
+
+        asyncio.run(_run())
+        assert len(writes) == 1
+        assert AsyncTTLCache(path=path).get("key") == [1, 2]
+
+    def test_should_save_right_away_without_a_loop(self, tmp_path, writes):
+        path = tmp_path / "cache.json"
+        AsyncTTLCache(path=path).set("key", "value")
+
+        assert writes == [threading.main_thread()]
+        assert AsyncTTLCache(path=path).get("key") == "value"
+
+    def test_should_only_serve_values_of_the_same_block(self):
+        cache = AsyncTTLCache()
+        fetches = []
+
+        async def fetch():
+            fetches.append(None)
+            await asyncio.sleep(0)
+            return len(fetches)
+
+        async def _run():
+            first = await asyncio.gather(
+                *[cache.get_or_fetch("key", fetch, block_number=10) for _ in range(3)]
+            )
+            return first, await cache.get_or_fetch("key", fetch, block_number=11)
+
+        assert asyncio.run(_run()) == ([1, 1, 1], 2)
+        assert cache.get("key", block_number=11) == 2
+        assert cache.get("key", block_number=10) is None
+        assert cache.get("key") is None
+
+    def test_should_load_files_without_block_numbers(self, tmp_path):
+        path = tmp_path / "cache.json"
+        path.write_text(json.dumps({"key": ["value", time.time() + 60]}))
+
+        assert AsyncTTLCache(path=path).get("key") == "value"
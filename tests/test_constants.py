@@ -0,0 +1,46 @@
+import asyncio
+
+import pytest
+
+from src.utils import constants, rpc
+
+
+class Transport:
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, method, params=None):
+        self.calls.append(method)
+        return "0x534e5f4d41494e"
+
+    def call_sync(self, method, params=None, retries=None, timeout=None):
+        raise AssertionError("The event loop must not be blocked")
+
+
+@pytest.fixture
+def transport(monkeypatch, tmp_path):
+    transport = Transport()
+    monkeypatch.setattr(rpc, "get_rpc_transport", lambda urls=None: transport)
+    monkeypatch.setattr(constants, "CHAIN_IDS_PATH", tmp_path / "chain_ids.json")
+    monkeypatch.setitem(constants.NETWORK, "chain_id", None)
+    monkeypatch.setitem(constants.NETWORK, "rpc_url", "http://node/api-key")
+    return transport
+
+
+class TestGetChainId:
+    def test_should_ask_the_node_without_blocking(self, transport):
+        assert asyncio.run(constants.get_chain_id()) == int.from_bytes(
+            b"SN_MAIN", "big"
+        )
+        assert transport.calls == ["starknet_chainId"]
+        assert "api-key" not in constants.CHAIN_IDS_PATH.read_text()
+
+    def test_should_reuse_the_saved_chain_id(self, transport):
+        asyncio.run(constants.get_chain_id())
+        constants.NETWORK["chain_id"] = None
+
+        assert asyncio.run(constants.get_chain_id()) == int.from_bytes(
+            b"SN_MAIN", "big"
+        )
+        assert constants.get_chain_id_sync() == int.from_bytes(b"SN_MAIN", "big")
+        assert transport.calls == ["starknet_chainId"]
@@ -0,0 +1,347 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+from aiohttp import web
+from starknet_py.constants import QUERY_VERSION_BASE
+from starknet_py.contract import Contract
+from starknet_py.net.account.account import Account
+from starknet_py.net.client_models import TransactionStatus
+from starknet_py.net.full_node_client import FullNodeClient
+from starknet_py.net.signer.stark_curve_signer import KeyPair
+
+from src.utils import ekubo, nonce
+from src.utils.ekubo import FLASHSWAP_ADDRESS, FlashswapTemplates
+
+CONTRACT_ADDRESS = "core::starknet::contract_address::ContractAddress"
+ABI = [
+    {
+        "type": "struct",
+        "name": "core::integer::u256",
+        "members": [
+            {"name": "low", "type": "core::integer::u128"},
+            {"name": "high", "type": "core::integer::u128"},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "ekubo::types::keys::PoolKey",
+        "members": [
+            {"name": "token0", "type": CONTRACT_ADDRESS},
+            {"name": "token1", "type": CONTRACT_ADDRESS},
+            {"name": "fee", "type": "core::integer::u128"},
+            {"name": "tick_spacing", "type": "core::integer::u128"},
+            {"name": "extension", "type": CONTRACT_ADDRESS},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "flashswap::SwapParams",
+        "members": [
+            {"name": "token_from", "type": CONTRACT_ADDRESS},
+            {"name": "token_to", "type": CONTRACT_ADDRESS},
+            {"name": "pool_key", "type": "ekubo::types::keys::PoolKey"},
+        ],
+    },
+    {
+        "type": "struct",
+        "name": "flashswap::FlashswapParams",
+        "members": [
+            {"name": "amount_from", "type": "core::integer::u256"},
+            {
+                "name": "routes",
+                "type": "core::array::Array::<flashswap::SwapParams>",
+            },
+        ],
+    },
+    {
+        "type": "function",
+        "name": "flashloan_swap",
+        "inputs": [{"name": "flashswap_params", "type": "flashswap::FlashswapParams"}],
+        "outputs": [],
+        "state_mutability": "external",
+    },
+]
+TOKENS = [0x49D3, 0x53C9, 0xDA11]
+SWAP_PARAMS = [
+    {
+        "token_from": token_from,
+        "token_to": token_to,
+        "pool_key": {
+            "token0": min(token_from, token_to),
+            "token1": max(token_from, token_to),
+            "fee": 170141183460469235273462165868118016,
+            "extension": 0,
+            "tick_spacing": 1000,
+        },
+    }
+    for token_from, token_to in zip(TOKENS, TOKENS[1:] + TOKENS[:1])
+]
+MAX_FEE = 10**16
+
+
+@pytest.fixture
+def account(monkeypatch):
+    """
+    An account at nonce 5 on a node that accepts all the transactions.
+    """
+    account = Account(
+        address=0x1234,
+        client=FullNodeClient(node_url="http://127.0.0.1:1"),
+        key_pair=KeyPair.from_private_key(0x1),
+        chain=int.from_bytes(b"SN_MAIN", "big"),
+    )
+    account._cairo_version = 1
+    account.sent = []
+
+    async def get_nonce(**kwargs):
+        return 5
+
+    async def send_transaction(transaction):
+        account.sent.append(transaction)
+        return SimpleNamespace(transaction_hash=0xABC + len(account.sent))
+
+    async def wait_for_transaction(transaction_hash):
+        return TransactionStatus.ACCEPTED_ON_L2
+
+    monkeypatch.setattr(account, "get_nonce", get_nonce)
+    monkeypatch.setattr(account.client, "send_transaction", send_transaction)
+    monkeypatch.setattr(nonce, "wait_for_transaction", wait_for_transaction)
+    monkeypatch.setattr(nonce, "_nonce_managers", {})
+    monkeypatch.setitem(
+        ekubo._flashswap_contracts,
+        account.address,
+        Contract(address=FLASHSWAP_ADDRESS, abi=ABI, provider=account, cairo_version=1),
+    )
+    return account
+
+
+def _prepare(account, amount_from):
+    contract = ekubo._flashswap_contracts[account.address]
+    return contract.functions["flashloan_swap"].prepare(
+        flashswap_params={"amount_from": amount_from, "routes": SWAP_PARAMS}
+    )
+
+
+class TestFlashswapTemplates:
+    @pytest.mark.parametrize("amount_from", [0, 5, 2**128 + 7, 2**200 + 3])
+    def test_should_patch_amount_in_template(self, account, amount_from):
+        templates = FlashswapTemplates(account)
+        asyncio.run(templates.prepare())
+        templates.get_call(SWAP_PARAMS, 1)
+
+        call = templates.get_call(SWAP_PARAMS, amount_from)
+        assert call.calldata == _prepare(account, amount_from).calldata
+
+    @pytest.mark.parametrize("cairo_version", [0, 1])
+    def test_should_sign_like_the_account(self, account, cairo_version):
+        account._cairo_version = cairo_version
+        templates = FlashswapTemplates(account)
+
+        async def _run():
+            transaction = await templates.sign(SWAP_PARAMS, 123, MAX_FEE)
+            expected = await account.sign_invoke_transaction(
+                _prepare(account, 123), nonce=5, max_fee=MAX_FEE
+            )
+            return transaction, expected
+
+        transaction, expected = asyncio.run(_run())
+        assert transaction == expected
+
+    def test_should_build_query_transactions(self, account):
+        templates = FlashswapTemplates(account)
+        transaction = asyncio.run(
+            templates.build(SWAP_PARAMS, 123, MAX_FEE, query=True)
+        )
+        assert transaction.version == 1 + QUERY_VERSION_BASE
+        assert transaction.signature == []
+
+    def test_should_share_nonces_with_other_submissions(self, account):
+        templates = FlashswapTemplates(account)
+
+        async def _run():
+            pre_signed = await templates.sign(SWAP_PARAMS, 123, MAX_FEE)
+            # Another transaction of the account takes the nonce of the pre-signed one
+            await nonce.get_nonce_manager(account).reserve()
+            await templates.send(SWAP_PARAMS, 123, MAX_FEE, pre_signed)
+            fresh = await templates.sign(SWAP_PARAMS, 456, MAX_FEE)
+            await templates.send(SWAP_PARAMS, 456, MAX_FEE, fresh)
+            return pre_signed, fresh
+
+        pre_signed, fresh = asyncio.run(_run())
+        assert pre_signed.nonce == 5
+        assert [transaction.nonce for transaction in account.sent] == [6, 7]
+        assert account.sent[1] is fresh
+
+    def test_should_send_notebook_swaps_with_the_shared_nonces(self, account):
+        async def _run():
+            await nonce.get_nonce_manager(account).reserve()
+            return await ekubo.flashloan_swap(account, SWAP_PARAMS, 123, MAX_FEE)
+
+        assert asyncio.run(_run()) == 0xABC + 1
+        assert [transaction.nonce for transaction in account.sent] == [6]
+
+
+class Response:
+    def __init__(self, payload):
+        self.payload = payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def json(self):
+        return self.payload
+
+
+class Session:
+    """
+    Serve the price endpoint from a matrix of prices[token][base].
+    """
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        base = url.split("/")[-1]
+        return Response(
+            {
+                "prices": [
+                    {"token": token, "price": str(prices[base])}
+                    for token, prices in self.prices.items()
+                    if base in prices
+                ]
+            }
+        )
+
+
+class TestGetPairPrices:
+    TOKENS = {"0xa": "A", "0xb": "B", "0xc": "C", "0xd": "D", "0xe": "E"}
+
+    def test_should_only_fetch_the_hubs_of_the_pairs(self):
+        # A is the hub of all the pairs but D/E
+        session = Session(
+            {
+                "0xb": {"0xa": 2.0},
+                "0xc": {"0xa": 4.0},
+                "0xd": {"0xa": 0.5},
+                "0xe": {"0xa": 8.0, "0xd": 3.0},
+                "0xa": {"0xd": 2.1},
+            }
+        )
+        pairs = [("A", "B", 10.0), ("C", "A", 5.0), ("A", "D", 1.0), ("D", "E", 1.0)]
+
+        graph = asyncio.run(
+            ekubo.get_pair_prices(pairs, tokens=self.TOKENS, session=session)
+        )
+        assert session.urls == [
+            f"{ekubo.EKUBO_API_URL}/price/0xa",
+            f"{ekubo.EKUBO_API_URL}/price/0xd",
+        ]
+        assert len(graph) == 8
+        assert graph.get_price("B", "A") == 2.0
+        assert graph.get_price("A", "B") == 0.5
+        assert graph.get_price("A", "D") == 2.1
+        assert graph.get_price("D", "A") == 0.5
+        assert graph.get_price("E", "D") == 3.0
+        # Pairs not discovered are not priced
+        assert graph.get_price("E", "A") == 0.0
+        assert graph.equals(graph.from_prices(graph.to_prices()))
+
+
+class PriceServer:
+    """
+    Local stub of the price endpoint, failing the first requests of some tokens.
+    """
+
+    def __init__(self, prices, errors=None, delays=None):
+        self.prices = prices
+        self.errors = dict(errors or {})
+        self.delays = dict(delays or {})
+        self.requests = []
+
+    async def price(self, request):
+        base = request.match_info["address"]
+        self.requests.append(base)
+        if self.errors.get(base):
+            self.errors[base] -= 1
+            return web.Response(status=503)
+        if self.delays.get(base):
+            self.delays[base] -= 1
+            await asyncio.sleep(1)
+        return web.json_response(
+            {
+                "prices": [
+                    {"token": token, "price": str(prices[base])}
+                    for token, prices in self.prices.items()
+                    if base in prices
+                ]
+            }
+        )
+
+    def get_prices(self, tokens, timeout=5, retries=3):
+        async def _run():
+            app = web.Application()
+            app.router.add_get("/price/{address}", self.price)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            _, port = runner.addresses[0]
+            try:
+                async with ekubo.get_session(timeout=timeout) as session:
+                    return await ekubo.get_prices(
+                        tokens,
+                        api_url=f"http://127.0.0.1:{port}",
+                        session=session,
+                        retries=retries,
+                    )
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(_run())
+
+
+class TestGetPrices:
+    # Not sorted by name
+    TOKENS = {"0xc": "USDC", "0xa": "ETH", "0xb": "DAI"}
+    PRICES = {
+        "0xa": {"0xc": 2500.0, "0xb": 2400.0},
+        "0xb": {"0xa": 0.0004},
+        "0xc": {"0xa": 0.0004, "0xb": 1.01},
+    }
+
+    def test_should_build_the_matrix_sorted_by_name(self):
+        prices = PriceServer(self.PRICES).get_prices(self.TOKENS)
+
+        assert list(prices.index) == list(prices.columns) == ["DAI", "ETH", "USDC"]
+        assert prices.index.name == "token" and prices.columns.name == "base"
+        # Rows are the quoted tokens and columns their base, missing pairs are 0
+        assert prices.loc["ETH", "USDC"] == 2500.0
+        assert prices.loc["USDC", "DAI"] == 1.01
+        assert prices.loc["DAI", "USDC"] == 0.0
+        assert prices.loc["DAI", "ETH"] == 0.0004
+
+    def test_should_retry_failed_requests(self):
+        server = PriceServer(self.PRICES, errors={"0xa": 2})
+        prices = server.get_prices(self.TOKENS)
+
+        assert server.requests.count("0xa") == 3
+        assert prices.loc["USDC", "ETH"] == 0.0004
+
+    def test_should_retry_timed_out_requests(self):
+        server = PriceServer(self.PRICES, delays={"0xc": 1})
+        prices = server.get_prices(self.TOKENS, timeout=0.2)
+
+        assert server.requests.count("0xc") == 2
+        assert prices.loc["ETH", "USDC"] == 2500.0
+
+    def test_should_raise_after_the_last_retry(self):
+        server = PriceServer(self.PRICES, errors={"0xb": 2})
+        with pytest.raises(aiohttp.ClientResponseError):
+            server.get_prices(self.TOKENS, retries=1)
+        assert server.requests.count("0xb") == 2
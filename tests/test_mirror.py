@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import pytest
+
+from src.utils import mirror as mirror_module
+from src.utils.mirror import (
+    POOL_INITIALIZED,
+    POSITION_UPDATED,
+    SWAPPED,
+    PoolMirror,
+    RecordedEventSource,
+)
+from src.utils.simulator import PoolState
+
+POOL_KEY = (0x1, 0x2, 170141183460469235273462165868118016, 1000, 0)
+OTHER_POOL_KEY = (0x1, 0x3, 170141183460469235273462165868118016, 1000, 0)
+LOCKER = 0x10
+
+
+def _event(block_number, selector, data, block_hash=None):
+    return {
+        "block_number": block_number,
+        "block_hash": hex(block_hash if block_hash is not None else block_number),
+        "keys": [hex(selector)],
+        "data": [hex(value) for value in data],
+    }
+
+
+def pool_initialized(block_number, pool_key, tick, sqrt_ratio, **kwargs):
+    data = [*pool_key, abs(tick), int(tick < 0), sqrt_ratio % 2**128]
+    return _event(block_number, POOL_INITIALIZED, data + [sqrt_ratio >> 128], **kwargs)
+
+
+def swapped(block_number, pool_key, sqrt_ratio, tick, liquidity, **kwargs):
+    # Only the state after the swap is read by the mirror
+    params_and_delta = [0] * 10
+    data = [LOCKER, *pool_key, *params_and_delta]
+    data += [sqrt_ratio % 2**128, sqrt_ratio >> 128, abs(tick), int(tick < 0)]
+    return _event(block_number, SWAPPED, data + [liquidity], **kwargs)
+
+
+def position_updated(block_number, pool_key, lower, upper, liquidity_delta):
+    data = [LOCKER, *pool_key, 0]
+    for value in [lower, upper, liquidity_delta]:
+        data += [abs(value), int(value < 0)]
+    return _event(block_number, POSITION_UPDATED, data)
+
+
+def write_events(path, events):
+    path.write_text("".join(json.dumps(event) + "\n" for event in events))
+    return path
+
+
+@pytest.fixture
+def pool_states(monkeypatch):
+    """
+    Serve the states of the tracked pools instead of calling the node, recording
+    the block of each call.
+    """
+    calls = []
+
+    async def _get_pool_states(pools, session=None, rpc_url=None, block_id=None):
+        calls.append(block_id)
+        await asyncio.sleep(0.01)
+        return [PoolState(2**128, 0, 100, POOL_KEY[2]) for _ in pools]
+
+    monkeypatch.setattr(mirror_module, "get_pool_states", _get_pool_states)
+    return calls
+
+
+class TestPoolMirror:
+    def test_should_decode_events(self, tmp_path):
+        events = [
+            pool_initialized(10, POOL_KEY, tick=-5, sqrt_ratio=2**128 + 1),
+            position_updated(11, POOL_KEY, lower=-100, upper=100, liquidity_delta=50),
+            swapped(12, POOL_KEY, sqrt_ratio=2**129, tick=7, liquidity=50),
+            position_updated(13, POOL_KEY, lower=-100, upper=100, liquidity_delta=-50),
+        ]
+        source = RecordedEventSource(write_events(tmp_path / "events.jsonl", events))
+
+        async def _run():
+            pool_mirror = PoolMirror(source, path=None)
+            await pool_mirror._set_checkpoint(9)
+            return pool_mirror, await pool_mirror.sync()
+
+        pool_mirror, applied = asyncio.run(_run())
+        assert applied == 4
+        assert pool_mirror.block_number == 13
+        assert pool_mirror.pools[POOL_KEY] == PoolState(
+            sqrt_ratio=2**129, tick=7, liquidity=0, fee=POOL_KEY[2], ticks=[]
+        )
+
+    def test_should_skip_events_of_untracked_pools(self, tmp_path):
+        events = [swapped(10, OTHER_POOL_KEY, sqrt_ratio=2**129, tick=7, liquidity=1)]
+        source = RecordedEventSource(write_events(tmp_path / "events.jsonl", events))
+
+        async def _run():
+            pool_mirror = PoolMirror(source, path=None)
+            await pool_mirror._set_checkpoint(9)
+            return pool_mirror, await pool_mirror.sync()
+
+        pool_mirror, applied = asyncio.run(_run())
+        assert applied == 0
+        assert OTHER_POOL_KEY not in pool_mirror.pools
+
+    def test_should_track_pools_at_mirror_block(self, tmp_path, pool_states):
+        source = RecordedEventSource(write_events(tmp_path / "events.jsonl", []))
+        source.head = 20
+        pool = dict(zip(["token_from", "token_to"], POOL_KEY[:2]))
+        pool.update(fee=POOL_KEY[2], tick_spacing=POOL_KEY[3], extension=POOL_KEY[4])
+
+        async def _run():
+            pool_mirror = PoolMirror(source, path=None)
+            await pool_mirror.track([pool, pool])
+            return pool_mirror
+
+        pool_mirror = asyncio.run(_run())
+        assert pool_states == [{"block_number": 20}]
+        assert pool_mirror.pools[POOL_KEY].liquidity == 100
+
+    def test_should_not_lose_events_of_pools_tracked_during_sync(
+        self, tmp_path, pool_states
+    ):
+        events = [swapped(15, POOL_KEY, sqrt_ratio=2**129, tick=7, liquidity=42)]
+        source = RecordedEventSource(write_events(tmp_path / "events.jsonl", events))
+        pool = dict(zip(["token_from", "token_to"], POOL_KEY[:2]))
+        pool.update(fee=POOL_KEY[2], tick_spacing=POOL_KEY[3], extension=POOL_KEY[4])
+
+        async def _run():
+            pool_mirror = PoolMirror(source, path=None)
+            await pool_mirror._set_checkpoint(10)
+            # The chain moves past the swap while the pool state is being loaded
+            await asyncio.gather(pool_mirror.track([pool]), pool_mirror.sync())
+            return pool_mirror
+
+        pool_mirror = asyncio.run(_run())
+        assert pool_states == [{"block_number": 10}]
+        assert pool_mirror.block_number == 15
+        assert pool_mirror.pools[POOL_KEY].liquidity == 42
+
+    def test_should_rollback_reorganized_blocks(self, tmp_path):
+        events = [
+            pool_initialized(10, POOL_KEY, tick=0, sqrt_ratio=2**128),
+            swapped(11, POOL_KEY, sqrt_ratio=2**129, tick=7, liquidity=1),
+            pool_initialized(12, OTHER_POOL_KEY, tick=0, sqrt_ratio=2**128),
+        ]
+        source = RecordedEventSource(write_events(tmp_path / "events.jsonl", events))
+
+        async def _run():
+            pool_mirror = PoolMirror(source, path=None)
+            await pool_mirror._set_checkpoint(9)
+            await pool_mirror.sync()
+            # Blocks 11 and 12 are replaced by a chain without events
+            source.block_hashes[11] = source.block_hashes[12] = 0xDEAD
+            source.events = source.events[:1]
+            source.head = 12
+            return pool_mirror, await pool_mirror.sync()
+
+        pool_mirror, applied = asyncio.run(_run())
+        assert applied == 0
+        assert pool_mirror.block_number == 12
+        assert pool_mirror.pools == {
+            POOL_KEY: PoolState(2**128, 0, 0, POOL_KEY[2], ticks=[])
+        }
@@ -0,0 +1,93 @@
+import random
+from decimal import Decimal, localcontext
+
+import pytest
+
+from src.utils.simulator import (
+    MAX_TICK,
+    MIN_TICK,
+    ONE,
+    PoolState,
+    SwapPath,
+    find_optimal_amount,
+    get_marginal_rate,
+    simulate_route,
+    simulate_swap,
+    tick_to_sqrt_ratio,
+)
+
+FEE = int(0.0005 * ONE)
+LIQUIDITY = 10**22
+
+
+class TestFindOptimalAmount:
+    @pytest.mark.parametrize(
+        "sqrt_ratios, directions",
+        [
+            (
+                [
+                    360481988486122238288749808340560773120,
+                    346941463894756873128694436059578105856,
+                    324470362199422201312631493258995826688,
+                ],
+                [True, False, True],
+            ),
+            (
+                [
+                    291426730577325969825130470588448505856,
+                    395257457106813662867418955830970548224,
+                ],
+                [True, True],
+            ),
+        ],
+    )
+    def test_should_not_stop_on_rounding_noise(self, sqrt_ratios, directions):
+        pools = [PoolState(sqrt_ratio, 0, LIQUIDITY, FEE) for sqrt_ratio in sqrt_ratios]
+        assert get_marginal_rate(pools, directions) > 1.005
+        # Small amounts lose about a unit per hop to rounding
+        assert all(simulate_route(pools, directions, a) < a for a in [1, 2, 4, 8])
+        reference = simulate_route(pools, directions, 2**60) - 2**60
+        assert reference > 0
+
+        amount, profit = find_optimal_amount(pools, directions)
+        assert profit >= reference
+        assert profit == simulate_route(pools, directions, amount) - amount
+
+    def test_should_return_zero_for_unprofitable_route(self):
+        pools = [PoolState(ONE, 0, LIQUIDITY, FEE), PoolState(ONE, 0, LIQUIDITY, FEE)]
+        assert find_optimal_amount(pools, [False, True]) == (0, 0)
+
+
+class TestTickToSqrtRatio:
+    @pytest.mark.parametrize(
+        "tick", [0, 1, -1, 1000, -123456, 27000000, MAX_TICK, MIN_TICK]
+    )
+    def test_should_match_the_decimal_power(self, tick):
+        with localcontext() as context:
+            context.prec = 80
+            expected = int(Decimal("1.000001") ** (Decimal(tick) / 2) * ONE)
+        assert tick_to_sqrt_ratio(tick) == expected
+
+
+class TestSwapPath:
+    @pytest.mark.parametrize("is_token1", [True, False])
+    @pytest.mark.parametrize("liquidity", [0, LIQUIDITY])
+    def test_should_simulate_like_simulate_swap(self, is_token1, liquidity):
+        rng = random.Random(liquidity)
+        ticks = sorted({rng.randrange(-40000, 40000, 100) for _ in range(40)} | {0})
+        pool = PoolState(
+            tick_to_sqrt_ratio(0),
+            0,
+            liquidity,
+            FEE,
+            [(tick, rng.choice([1, -1]) * LIQUIDITY // 4) for tick in ticks],
+        )
+        path = SwapPath(pool, is_token1)
+
+        # Around the crossings of the ticks, where the rounding matters
+        amounts = [rng.randrange(2 ** rng.randrange(1, 100)) for _ in range(200)]
+        amounts += [
+            max(0, amount + delta) for amount in path.inputs for delta in (-1, 0, 1)
+        ]
+        for amount in amounts:
+            assert path.simulate(amount) == simulate_swap(pool, amount, is_token1)
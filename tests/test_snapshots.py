@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.utils.snapshots import SnapshotStore
+
+NAMES = ["ETH", "USDC"]
+PRICES = np.array([[1.0, 2500.0], [0.0004, 1.0]])
+
+
+class TestSnapshotStore:
+    def test_should_append_ndarrays_with_the_names_of_the_store(self, tmp_path):
+        store = SnapshotStore(tmp_path, names=NAMES)
+        store.append(PRICES, timestamp=1.0, block=10)
+        store.append(PRICES * 2, timestamp=2.0, block=11)
+
+        store = SnapshotStore(tmp_path)
+        assert store.names == NAMES
+        assert store.index["block"].tolist() == [10, 11]
+        np.testing.assert_array_equal(store.prices[1], PRICES * 2)
+        assert store.get_prices(0).loc["ETH", "USDC"] == 2500.0
+
+    def test_should_require_names_for_ndarrays_of_a_new_store(self, tmp_path):
+        store = SnapshotStore(tmp_path / "snapshots")
+
+        with pytest.raises(ValueError, match="names are required"):
+            store.append(PRICES)
+        assert len(store) == 0
+        assert not (tmp_path / "snapshots").exists()
+        # The names of a DataFrame are enough
+        store.append(pd.DataFrame(PRICES, index=NAMES, columns=NAMES))
+        assert store.names == NAMES
+        store.append(PRICES)
+        assert len(store) == 2
+
+    def test_should_reject_prices_of_other_tokens(self, tmp_path):
+        store = SnapshotStore(tmp_path, names=NAMES)
+
+        with pytest.raises(ValueError, match="shape"):
+            store.append(np.ones((3, 3)))
+        store.append(PRICES)
+        with pytest.raises(ValueError, match="tokens"):
+            store.append(pd.DataFrame(PRICES, columns=["ETH", "DAI"]))
+        assert len(store) == 1
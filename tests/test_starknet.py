@@ -0,0 +1,338 @@
+import asyncio
+import json
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+from starknet_py.net.client_models import TransactionStatus
+
+from src.utils import constants, nonce, starknet
+from src.utils.rpc import get_rpc_transport
+
+CONTRACTS = [
+    {"contract_name": "Compiled", "is_account_contract": False},
+    {"contract_name": "Missing", "is_account_contract": False},
+]
+
+DECLARATIONS = {"Math": 1, "Renderer": 2, "Sheet": 3}
+PLAN = {
+    "math": {"contract_name": "Math"},
+    "renderer": {"contract_name": "Renderer"},
+    "sheet": {
+        "contract_name": "Sheet",
+        "args": lambda deployments: [
+            deployments["math"]["address"],
+            deployments["renderer"]["address"],
+        ],
+        "depends_on": ["math", "renderer"],
+    },
+}
+
+
+def compile_contract(contract, failing=frozenset({"Missing"})):
+    # Runs in the workers, forked with the patched module
+    if contract["contract_name"] in failing:
+        raise FileNotFoundError("starknet-compile-deprecated")
+    starknet.get_artifact(contract["contract_name"]).write_text("{}")
+
+
+@pytest.fixture
+def build_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(starknet, "BUILD_DIR", tmp_path)
+    monkeypatch.setattr(
+        starknet,
+        "get_artifact",
+        lambda contract_name: tmp_path / f"{contract_name}.json",
+    )
+    monkeypatch.setattr(
+        starknet,
+        "get_contract_build_hash",
+        lambda contract, compiler_version: contract["contract_name"],
+    )
+    monkeypatch.setattr(starknet, "get_compiler_version", lambda cache: "0.11.0")
+    monkeypatch.setattr(starknet, "compile_contract", compile_contract)
+    return tmp_path
+
+
+class TestCompileContracts:
+    def test_should_save_the_hashes_of_the_compiled_contracts(
+        self, build_dir, monkeypatch
+    ):
+        with pytest.raises(RuntimeError, match="Missing"):
+            starknet.compile_contracts(CONTRACTS, max_workers=2)
+
+        build_hashes = json.loads((build_dir / "build_hashes.json").read_text())
+        assert build_hashes == {"Compiled": "Compiled"}
+        # Only the failed contract is compiled again once the compiler is found
+        monkeypatch.setattr(
+            starknet, "compile_contract", partial(compile_contract, failing=frozenset())
+        )
+        assert starknet.compile_contracts(CONTRACTS, max_workers=2) == ["Missing"]
+
+
+class TestGetContractBuildHash:
+    def test_should_change_with_the_compiler_version(self, monkeypatch, tmp_path):
+        source = tmp_path / "Contract.cairo"
+        source.write_text("%lang starknet\n")
+        monkeypatch.setattr(starknet, "get_contract_source", lambda name: source)
+        contract = {"contract_name": "Contract", "is_account_contract": False}
+
+        assert starknet.get_contract_build_hash(
+            contract, "0.11.0"
+        ) != starknet.get_contract_build_hash(contract, "0.12.0")
+
+
+class TestGetCompilerVersion:
+    def test_should_only_run_a_changed_compiler(self, monkeypatch):
+        runs = []
+
+        def run(command, capture_output):
+            runs.append(command)
+            return SimpleNamespace(stdout=b"starknet-compile-deprecated 0.11.0\n")
+
+        monkeypatch.setattr(starknet.subprocess, "run", run)
+        monkeypatch.setattr(starknet, "_get_compiler_key", lambda: "compiler:1:10")
+        cache = {}
+        assert (
+            starknet.get_compiler_version(cache) == "starknet-compile-deprecated 0.11.0"
+        )
+        assert (
+            starknet.get_compiler_version(cache) == "starknet-compile-deprecated 0.11.0"
+        )
+        assert len(runs) == 1
+
+        # e.g. after an upgrade of cairo-lang
+        monkeypatch.setattr(starknet, "_get_compiler_key", lambda: "compiler:2:10")
+        starknet.get_compiler_version(cache)
+        assert len(runs) == 2
+
+    def test_should_not_run_a_missing_compiler(self, monkeypatch):
+        monkeypatch.setattr(starknet, "_get_compiler_key", lambda: None)
+        assert starknet.get_compiler_version({}) == ""
+
+
+class Devnet:
+    """
+    Stand-in for a devnet: deployments are accepted unless their contract is in
+    rejected, and the node nonce only moves when they are.
+    """
+
+    def __init__(self, rejected=()):
+        self.rejected = rejected
+        self.address = 0x1234
+        self.nonce = 3
+        self.deployed = []
+        self.statuses = {}
+
+    async def get_nonce(self, **kwargs):
+        return self.nonce
+
+    async def deploy_contract(
+        self, account, class_hash, abi, constructor_args, nonce, max_fee
+    ):
+        assert account is self
+        self.deployed.append((class_hash, constructor_args, nonce))
+        tx_hash = 0x100 + len(self.deployed)
+        self.statuses[tx_hash] = (
+            TransactionStatus.REJECTED
+            if class_hash in self.rejected
+            else TransactionStatus.ACCEPTED_ON_L2
+        )
+        await asyncio.sleep(0)
+        return SimpleNamespace(
+            hash=tx_hash, deployed_contract=SimpleNamespace(address=0x1000 + class_hash)
+        )
+
+    async def wait_for_transaction(self, tx_hash):
+        await asyncio.sleep(0)
+        if self.statuses[tx_hash] == TransactionStatus.ACCEPTED_ON_L2:
+            self.nonce += 1
+        return self.statuses[tx_hash]
+
+
+@pytest.fixture
+def devnet(monkeypatch, tmp_path):
+    devnet = Devnet()
+    devnet.dumps = []
+
+    async def get_starknet_account():
+        return devnet
+
+    monkeypatch.setattr(starknet, "get_starknet_account", get_starknet_account)
+    monkeypatch.setattr(starknet, "Contract", devnet)
+    monkeypatch.setattr(starknet, "get_declarations", lambda: DECLARATIONS)
+    monkeypatch.setattr(starknet, "get_deployments", dict)
+    monkeypatch.setattr(starknet, "get_abi", lambda contract_name: [])
+    monkeypatch.setattr(
+        starknet, "get_artifact", lambda contract_name: f"{contract_name}.json"
+    )
+    monkeypatch.setattr(
+        starknet,
+        "dump_deployments",
+        lambda deployments: devnet.dumps.append(deployments),
+    )
+    monkeypatch.setattr(nonce, "wait_for_transaction", devnet.wait_for_transaction)
+    monkeypatch.setattr(nonce, "_nonce_managers", {})
+    return devnet
+
+
+class TestDeployContracts:
+    def test_should_deploy_layers_in_dependency_order(self, devnet):
+        deployments = asyncio.run(starknet.deploy_contracts(PLAN))
+
+        assert devnet.deployed == [
+            (1, [], 3),
+            (2, [], 4),
+            (3, [0x1001, 0x1002], 5),
+        ]
+        assert {
+            name: deployment["address"] for name, deployment in deployments.items()
+        } == {
+            "math": 0x1001,
+            "renderer": 0x1002,
+            "sheet": 0x1003,
+        }
+        assert devnet.dumps == [deployments]
+
+    def test_should_dump_the_deployments_of_a_partial_failure(self, devnet):
+        devnet.rejected = {DECLARATIONS["Renderer"]}
+
+        with pytest.raises(RuntimeError, match="renderer"):
+            asyncio.run(starknet.deploy_contracts(PLAN))
+
+        # The dependent contract is not sent and the failed nonce is reused
+        assert [deployed[0] for deployed in devnet.deployed] == [1, 2]
+        assert list(devnet.dumps[0]) == ["math"]
+        assert asyncio.run(nonce.get_nonce_manager(devnet).peek()) == 4
+
+    def test_should_reject_circular_plans(self):
+        with pytest.raises(ValueError, match="Circular"):
+            starknet.get_deployment_layers(
+                {"a": {"depends_on": ["b"]}, "b": {"depends_on": ["a"]}}
+            )
+
+
+class Node:
+    """
+    Local JSON-RPC stub serving the receipts of each transaction in turn, the last
+    one being served again once reached.
+    """
+
+    NOT_FOUND = {"code": 29, "message": "Transaction hash not found"}
+
+    def __init__(self, receipts):
+        self.receipts = {
+            hex(tx_hash): list(answers) for tx_hash, answers in receipts.items()
+        }
+        self.requests = []
+
+    async def rpc(self, request):
+        payload = await request.json()
+        responses = []
+        for call in payload if isinstance(payload, list) else [payload]:
+            assert call["method"] == "starknet_getTransactionReceipt"
+            tx_hash = call["params"]["transaction_hash"]
+            self.requests.append(int(tx_hash, 16))
+            answers = self.receipts[tx_hash]
+            answer = answers.pop(0) if len(answers) > 1 else answers[0]
+            key = "result" if "code" not in answer else "error"
+            responses.append({"jsonrpc": "2.0", "id": call["id"], key: answer})
+        return web.json_response(
+            responses if isinstance(payload, list) else responses[0]
+        )
+
+    def run(self, wait):
+        """
+        Run wait(rpc_url) with the node served on a local port.
+        """
+
+        async def _run():
+            app = web.Application()
+            app.router.add_post("/", self.rpc)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            _, port = runner.addresses[0]
+            rpc_url = f"http://127.0.0.1:{port}"
+            try:
+                return await wait(rpc_url)
+            finally:
+                await get_rpc_transport(rpc_url).close()
+                await runner.cleanup()
+
+        return asyncio.run(_run())
+
+
+@pytest.fixture
+def delays(monkeypatch, caplog):
+    """
+    Return the delays slept by wait_for_transaction, without jitter.
+    """
+    monkeypatch.setattr(constants, "GATEWAY_CLIENT", None, raising=False)
+    monkeypatch.setattr(starknet.random, "uniform", lambda low, high: 1.0)
+    caplog.set_level("INFO", logger=starknet.logger.name)
+    return lambda: [
+        float(record.getMessage().split()[-1][:-1])
+        for record in caplog.records
+        if "Sleeping for" in record.getMessage()
+    ]
+
+
+class TestWaitForTransaction:
+    def test_should_back_off_until_accepted(self, delays):
+        node = Node(
+            {
+                0x1: [
+                    Node.NOT_FOUND,
+                    {"status": "PENDING"},
+                    {"status": "PENDING"},
+                    {"status": "PENDING"},
+                    {"status": "ACCEPTED_ON_L2"},
+                ]
+            }
+        )
+        status = node.run(
+            lambda rpc_url: starknet.wait_for_transaction(
+                0x1, rpc_url=rpc_url, check_interval=0.02, max_interval=0.04, max_wait=5
+            )
+        )
+
+        assert status == TransactionStatus.ACCEPTED_ON_L2
+        assert node.requests == [0x1] * 5
+        # Exponential backoff capped at max_interval
+        assert delays() == [0.02, 0.03, 0.04, 0.04, 0.04]
+
+    def test_should_stop_on_rpc_errors(self, delays):
+        node = Node({0x1: [{"code": -32603, "message": "Internal error"}]})
+        status = node.run(
+            lambda rpc_url: starknet.wait_for_transaction(
+                0x1, rpc_url=rpc_url, check_interval=0.01, max_wait=5
+            )
+        )
+
+        assert status is None
+        assert node.requests == [0x1]
+
+    def test_should_yield_receipts_as_they_arrive(self, delays):
+        node = Node(
+            {
+                0x1: [{"status": "PENDING"}] * 3 + [{"status": "ACCEPTED_ON_L2"}],
+                0x2: [{"status": "REJECTED"}],
+                0x3: [{"status": "PENDING"}, {"status": "ACCEPTED_ON_L2"}],
+            }
+        )
+
+        async def _wait(rpc_url):
+            return [
+                result
+                async for result in starknet.wait_for_transactions(
+                    [0x1, 0x2, 0x3], rpc_url=rpc_url, check_interval=0.01, max_wait=5
+                )
+            ]
+
+        assert node.run(_wait) == [
+            (0x2, TransactionStatus.REJECTED),
+            (0x3, TransactionStatus.ACCEPTED_ON_L2),
+            (0x1, TransactionStatus.ACCEPTED_ON_L2),
+        ]
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from starknet_py.net.client_models import RevertedFunctionInvocation
+
+from src.utils import constants
+from src.utils.ekubo import FLASHSWAP_ADDRESS, TOKEN_NAME_TO_ADDRESS
+from src.utils.registry import parse_int
+from src.utils.validator import TRANSFER, validate
+
+ACCOUNT = SimpleNamespace(address=0x1234)
+LENDER = 0x999
+# One ETH is worth 2500 USDC
+PRICES = pd.DataFrame(
+    [[1.0, 2500.0], [0.0004, 1.0]],
+    index=pd.Index(["ETH", "USDC"], name="token"),
+    columns=pd.Index(["ETH", "USDC"], name="base"),
+)
+
+
+class Templates:
+    async def prepare(self):
+        pass
+
+    async def build(self, swap_params, amount_from, max_fee, query=False):
+        assert query
+        return swap_params
+
+
+def transfer(token, sender, recipient, amount):
+    return SimpleNamespace(
+        contract_address=parse_int(TOKEN_NAME_TO_ADDRESS[token]),
+        events=[
+            SimpleNamespace(
+                keys=[TRANSFER, sender, recipient],
+                data=[amount % 2**128, amount >> 128],
+            )
+        ],
+        calls=[],
+    )
+
+
+class Node:
+    """
+    Simulate the flashloan_swap of a candidate as the execution set in its
+    swap_params, as a devnet would trace it.
+    """
+
+    def __init__(self, fee):
+        self.fee = fee
+        self.simulated = []
+
+    async def simulate_transactions(self, transactions, skip_validate, skip_fee_charge):
+        assert skip_validate and skip_fee_charge
+        (execution,) = transactions
+        self.simulated.append(execution)
+        await asyncio.sleep(0)
+        return [
+            SimpleNamespace(
+                fee_estimation=SimpleNamespace(overall_fee=self.fee),
+                transaction_trace=SimpleNamespace(execute_invocation=execution),
+            )
+        ]
+
+
+@pytest.fixture
+def node(monkeypatch):
+    node = Node(fee=10**13)
+    monkeypatch.setattr(constants, "RPC_CLIENT", node, raising=False)
+    return node
+
+
+def candidate(route, execution):
+    return {"route": route, "swap_params": execution, "amount_from": 1}
+
+
+class TestValidate:
+    def test_should_compare_profits_of_tokens_with_different_decimals(self, node):
+        candidates = [
+            # 0.001 ETH
+            candidate(
+                ["ETH", "USDC", "ETH"],
+                transfer("ETH", LENDER, FLASHSWAP_ADDRESS, 10**15),
+            ),
+            # 5 USDC, i.e. 0.002 ETH
+            candidate(
+                ["USDC", "ETH", "USDC"],
+                transfer("USDC", LENDER, ACCOUNT.address, 5 * 10**6),
+            ),
+            candidate(
+                ["ETH", "USDC", "ETH"], RevertedFunctionInvocation("Insufficient")
+            ),
+        ]
+
+        best = asyncio.run(
+            validate(ACCOUNT, candidates, 10**16, PRICES, templates=Templates())
+        )
+        assert len(node.simulated) == 3
+        assert best["route"] == ["USDC", "ETH", "USDC"]
+        assert best["simulated_profit"] == 5 * 10**6
+        assert best["net_profit"] == pytest.approx(2 * 10**15 - 10**13)
+
+    def test_should_reject_routes_losing_the_fee(self, node):
+        candidates = [
+            candidate(
+                ["USDC", "ETH", "USDC"], transfer("USDC", LENDER, ACCOUNT.address, 10)
+            ),
+        ]
+
+        assert (
+            asyncio.run(
+                validate(ACCOUNT, candidates, 10**16, PRICES, templates=Templates())
+            )
+            is None
+        )